@@ -0,0 +1,251 @@
+import os
+import sys
+import time
+import json
+import argparse
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+# shared dataset / predictions loaders live with the evaluation scripts
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "evaluation"))
+# manifest + per-run aggregate cache
+from run_cache import RunCache, load_runs, CACHE_DIR
+from utils import load_dataset
+
+# Error-analysis cube: correct / answered counts of every run on every cell of
+#   POS x target word x gold label x sentence-length bucket x span found
+# (span found = the word was located in both sentences, i.e. start1 and start2 != -1).
+# A cell only exists when some dataset item falls into it, so the cube is runs x cells
+# with cells <= items. Any roll-up / drill-down over these dimensions plus the run
+# dimensions (run, model, prompt_mode, language) is two sparse products over it.
+# Runs are added one row at a time from the RunCache aggregates and the cube is saved
+# next to them, so a new or changed prediction file costs one row, not a rebuild.
+
+JSONL_PATH = "../processed_data/final_dataset_lastE.jsonl"
+CSV_DIR = "../results_evaluation/csv_results"
+CUBE_FILE = "error_cube.npz"
+
+# sentence length = words in the longer of the two sentences
+LENGTH_BINS = [0, 5, 10, 15, 20, 30, np.inf]
+LENGTH_LABELS = ["1-5", "6-10", "11-15", "16-20", "21-30", "31+"]
+
+ITEM_DIMS = ["pos", "word", "label", "length", "span_found"]
+RUN_DIMS = ["run", "model", "prompt_mode", "language"]
+
+def item_dimensions(dataset_path: str, idx: np.ndarray) -> pd.DataFrame:
+    """One row per dataset item (in `idx` order) with the cube's item dimensions as strings."""
+    df = load_dataset(dataset_path, columns=["idx", "word", "pos", "label", "sentence1", "sentence2",
+                                             "start1", "start2"]).set_index("idx").loc[idx]
+    words = np.maximum(df["sentence1"].astype(str).str.split().str.len(),
+                       df["sentence2"].astype(str).str.split().str.len())
+    return pd.DataFrame({
+        "pos": df["pos"].fillna("NA").astype(str).to_numpy(),
+        "word": df["word"].astype(str).to_numpy(),
+        "label": df["label"].astype(bool).astype(str).to_numpy(),
+        "length": pd.cut(words, LENGTH_BINS, labels=LENGTH_LABELS).astype(str).to_numpy(),
+        "span_found": ((df["start1"] != -1) & (df["start2"] != -1)).astype(str).to_numpy(),
+    })
+
+def run_dimensions(names: list) -> pd.DataFrame:
+    parts = [n.split("__") for n in names]
+    return pd.DataFrame({
+        "run": names,
+        "model": [p[0] for p in parts],
+        "prompt_mode": [p[1] if len(p) > 1 else "" for p in parts],
+        "language": [p[2] if len(p) > 2 else "" for p in parts],
+    })
+
+def _encode(frame: pd.DataFrame) -> tuple:
+    """({dim: int codes}, {dim: level strings}) of a frame of string dimensions."""
+    codes, levels = {}, {}
+    for dim in frame.columns:
+        c, lv = pd.factorize(frame[dim], sort=True)
+        codes[dim], levels[dim] = c.astype(np.int64), np.asarray(lv, dtype=object)
+    return codes, levels
+
+def _group_ids(codes: dict, levels: dict, dims: list, mask: np.ndarray) -> tuple:
+    """Dense group id of every masked row over `dims`, plus the (n_groups, dims) code table."""
+    n = int(mask.sum())
+    if not dims:
+        return np.zeros(n, dtype=np.int64), np.zeros((1, 0), dtype=np.int64)
+    key = np.ravel_multi_index([codes[d][mask] for d in dims], [len(levels[d]) for d in dims])
+    uniq, gid = np.unique(key, return_inverse=True)
+    table = np.stack(np.unravel_index(uniq, [len(levels[d]) for d in dims]), axis=1)
+    return gid.ravel(), table
+
+def _onehot(gid: np.ndarray, n_groups: int):
+    return sparse.csr_matrix((np.ones(len(gid), dtype=np.int64), (np.arange(len(gid)), gid)),
+                             shape=(len(gid), n_groups))
+
+class ErrorCube:
+    """
+    correct / answered: (runs, cells) int64 counts; `cells` holds the item dimensions of
+    every cell, run dimensions are parsed from the run names. Build (or update) with
+    ErrorCube.build, query with rollup.
+    """
+    def __init__(self, runs: list, hashes: list, cells: pd.DataFrame, correct: np.ndarray, answered: np.ndarray):
+        self.runs = list(runs)
+        self.hashes = list(hashes)
+        self.cells = cells
+        self.correct = correct
+        self.answered = answered
+        self.cell_codes, self.cell_levels = _encode(cells)
+        self.run_codes, self.run_levels = _encode(run_dimensions(self.runs))
+
+    @staticmethod
+    def cube_path(cache: RunCache) -> str:
+        return os.path.join(cache.cache_dir, CUBE_FILE)
+
+    @classmethod
+    def build(cls, dataset_path: str, runs: dict, cache_dir: str = CACHE_DIR, stats: dict = None):
+        """
+        Cube of `runs` (name -> predictions CSV). Rows of runs whose file hash matches the
+        saved cube are reused; only new or changed runs are counted (from the RunCache).
+        """
+        cache = RunCache(dataset_path, cache_dir)
+        report = cache.sync(runs)
+        names = list(runs)
+        hashes = [cache.manifest["runs"][n]["sha1"] for n in names]
+
+        items = item_dimensions(dataset_path, cache.idx)
+        cells, cell_of_item = np.unique(items.to_numpy(dtype=str), axis=0, return_inverse=True)
+        cell_of_item = cell_of_item.ravel()
+        cells = pd.DataFrame(cells, columns=ITEM_DIMS)
+
+        old = cls.load(cls.cube_path(cache))
+        reuse = {}
+        if old is not None and old.cells.equals(cells):
+            reuse = {(n, h): j for j, (n, h) in enumerate(zip(old.runs, old.hashes))}
+
+        correct = np.zeros((len(names), len(cells)), dtype=np.int64)
+        answered = np.zeros((len(names), len(cells)), dtype=np.int64)
+        counted = 0
+        for i, (name, h) in enumerate(zip(names, hashes)):
+            j = reuse.get((name, h))
+            if j is not None:
+                correct[i], answered[i] = old.correct[j], old.answered[j]
+                continue
+            run = cache.load(name)
+            ok = (run["values"] == cache.gold) & run["valid"]
+            correct[i] = np.bincount(cell_of_item, weights=ok, minlength=len(cells))
+            answered[i] = np.bincount(cell_of_item, weights=run["valid"], minlength=len(cells))
+            counted += 1
+
+        cube = cls(names, hashes, cells, correct, answered)
+        cube.save(cls.cube_path(cache))
+        if stats is not None:
+            stats.update(runs=len(names), cells=len(cells), counted=counted, reused=len(names) - counted,
+                         **{k: len(v) for k, v in report.items()})
+        return cube
+
+    def save(self, path: str):
+        tmp = path + ".tmp.npz"
+        np.savez(tmp, correct=self.correct, answered=self.answered,
+                 cells=np.array(json.dumps(self.cells.to_numpy().tolist(), ensure_ascii=False)),
+                 runs=np.array(json.dumps({"runs": self.runs, "hashes": self.hashes})))
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str):
+        if not os.path.exists(path):
+            return None
+        with np.load(path) as z:
+            meta = json.loads(str(z["runs"]))
+            cells = pd.DataFrame(json.loads(str(z["cells"])), columns=ITEM_DIMS)
+            return cls(meta["runs"], meta["hashes"], cells, z["correct"], z["answered"])
+
+    def _mask(self, codes: dict, levels: dict, n: int, where: dict) -> np.ndarray:
+        mask = np.ones(n, dtype=bool)
+        for dim, wanted in where.items():
+            if dim not in codes:
+                continue
+            wanted = [wanted] if isinstance(wanted, (str, bool, int)) else wanted
+            allowed = np.isin(levels[dim], [str(w) for w in wanted])
+            mask &= allowed[codes[dim]]
+        return mask
+
+    def rollup(self, by: list = (), where: dict = None) -> pd.DataFrame:
+        """
+        correct / answered / errors / accuracy grouped by `by` (any of ITEM_DIMS + RUN_DIMS),
+        over the cells and runs selected by `where` ({dim: value or list of values}).
+        Drilling down is the same call with more dimensions in `by` or `where`.
+        """
+        where = where or {}
+        unknown = [d for d in list(by) + list(where) if d not in ITEM_DIMS + RUN_DIMS]
+        if unknown:
+            raise ValueError(f"Unknown cube dimension(s): {unknown}; expected {ITEM_DIMS + RUN_DIMS}")
+        cell_mask = self._mask(self.cell_codes, self.cell_levels, len(self.cells), where)
+        run_mask = self._mask(self.run_codes, self.run_levels, len(self.runs), where)
+        cell_by = [d for d in by if d in ITEM_DIMS]
+        run_by = [d for d in by if d in RUN_DIMS]
+
+        cell_gid, cell_table = _group_ids(self.cell_codes, self.cell_levels, cell_by, cell_mask)
+        run_gid, run_table = _group_ids(self.run_codes, self.run_levels, run_by, run_mask)
+        cells_to_groups = _onehot(cell_gid, len(cell_table))
+        runs_to_groups = _onehot(run_gid, len(run_table)).T
+
+        out = {}
+        for key, counts in (("correct", self.correct), ("answered", self.answered)):
+            sub = counts[np.ix_(run_mask, cell_mask)]
+            out[key] = np.asarray((runs_to_groups @ sparse.csr_matrix(sub) @ cells_to_groups).todense())
+
+        # (run group, cell group) pairs, run groups outermost
+        rg, cg = np.meshgrid(np.arange(len(run_table)), np.arange(len(cell_table)), indexing="ij")
+        rg, cg = rg.ravel(), cg.ravel()
+        frame = {}
+        for k, d in enumerate(run_by):
+            frame[d] = self.run_levels[d][run_table[rg, k]]
+        for k, d in enumerate(cell_by):
+            frame[d] = self.cell_levels[d][cell_table[cg, k]]
+        frame = pd.DataFrame(frame)
+        frame["correct"] = out["correct"].ravel()
+        frame["answered"] = out["answered"].ravel()
+        frame = frame[frame["answered"] > 0].reset_index(drop=True)
+        frame["errors"] = frame["answered"] - frame["correct"]
+        frame["accuracy"] = frame["correct"] / frame["answered"]
+        return frame[[d for d in by] + ["correct", "answered", "errors", "accuracy"]]
+
+def _parse_where(items: list) -> dict:
+    where = {}
+    for item in items or []:
+        dim, _, values = item.partition("=")
+        where[dim] = values.split(",")
+    return where
+
+def main():
+    ap = argparse.ArgumentParser(description="Build / update the error-analysis cube and print a roll-up of it.")
+    ap.add_argument("--data", default=JSONL_PATH)
+    ap.add_argument("--csv_dir", default=CSV_DIR)
+    ap.add_argument("--cache_dir", default=CACHE_DIR)
+    ap.add_argument("--by", nargs="*", default=["pos"],
+                    help=f"Dimensions to group by, any of: {' '.join(ITEM_DIMS + RUN_DIMS)}.")
+    ap.add_argument("--where", nargs="*", default=[],
+                    help="Filters like pos=N language=kk,en span_found=False.")
+    ap.add_argument("--sort", default="accuracy", help="Column to sort the roll-up by (ascending).")
+    ap.add_argument("--min-answered", type=int, default=1)
+    ap.add_argument("--top", type=int, default=30, help="Rows to print (0 = all).")
+    ap.add_argument("--out", default=None, help="Also save the roll-up to this CSV.")
+    args = ap.parse_args()
+
+    t0 = time.perf_counter()
+    stats = {}
+    cube = ErrorCube.build(args.data, load_runs(args.csv_dir), args.cache_dir, stats=stats)
+    build_s = time.perf_counter() - t0
+    print(f"Cube: {stats['runs']} runs x {stats['cells']} cells "
+          f"({stats['counted']} runs counted, {stats['reused']} reused) in {build_s:.2f}s")
+
+    t0 = time.perf_counter()
+    table = cube.rollup(args.by, _parse_where(args.where))
+    query_ms = (time.perf_counter() - t0) * 1000
+    table = table[table["answered"] >= args.min_answered].sort_values(args.sort, kind="stable")
+
+    with pd.option_context("display.max_rows", None, "display.width", 200):
+        print(table if args.top == 0 else table.head(args.top))
+    print(f"{len(table)} groups in {query_ms:.1f} ms")
+    if args.out:
+        table.to_csv(args.out, index=False)
+        print(f"Saved: {args.out}")
+
+if __name__ == "__main__":
+    main()
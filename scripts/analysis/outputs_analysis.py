@@ -1,143 +1,102 @@
 import os
-import re
+import sys
 import json
-import glob
+import numpy as np
 import pandas as pd
 
+# shared dataset / predictions loaders live with the evaluation scripts
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "evaluation"))
+# manifest + per-run aggregate cache
+from run_cache import RunCache, load_runs
+from utils import load_dataset
+
 CSV_DIR = "../results_evaluation/csv_results"  # folder containing prediction CSVs named like: predictions_<model>_<zero|few>_<kk|en>.csv
 JSONL_GOLD = "../processed_data/final_dataset_lastE.jsonl"  # gold dataset with word, sentences, label, idx
 OUT_JSONL = "../results_evaluation/combined_outputs/combined_predictions_wide.jsonl"
 OUT_JSONL_SORTED = "../results_evaluation/combined_outputs/combined_predictions_wide_sorted.jsonl"
 OUT_CSV_SORTED = "../results_evaluation/combined_outputs/combined_predictions_wide_sorted.csv"
-
-def to_bool(x):
-    if isinstance(x, bool):
-        return x
-    if pd.isna(x):
-        return None
-    s = str(x).strip().lower()
-    if s in {"true", "t", "1"}:
-        return True
-    if s in {"false", "f", "0"}:
-        return False
-    return None
-
-FNAME_RE = re.compile(
-    r"^predictions_(?P<model>.+)_(?P<prompt_mode>zero|few)_(?P<language>kk|en)\.csv$",
-    re.IGNORECASE
-)
-
-# load gold jsonl
-gold_rows = []
-with open(JSONL_GOLD, "r", encoding="utf-8") as f:
-    for line in f:
-        line = line.strip()
-        if not line:
-            continue
-        obj = json.loads(line)
-        # normalize columns we need
-        gold_rows.append({
-            "idx": int(obj["idx"]),
-            "word": obj.get("word"),
-            "sentence1": obj.get("sentence1"),
-            "sentence2": obj.get("sentence2"),
-            "gold": bool(obj.get("label")) if isinstance(obj.get("label"), bool) else (str(obj.get("label")).lower() == "true"),
-        })
-gold_df = pd.DataFrame(gold_rows).set_index("idx").sort_index()
-
-# read predictions and pivot to wide per idx
-pred_frames = []
-model_cols = []
-
-for path in glob.glob(os.path.join(CSV_DIR, "predictions_*.csv")):
-    fname = os.path.basename(path)
-    m = FNAME_RE.match(fname)
-    if not m:
-        continue  # skip non-matching files
-    model = m.group("model")
-    prompt_mode = m.group("prompt_mode").lower()
-    language = m.group("language").lower()
-    colname = f"{model}__{prompt_mode}__{language}"
-    model_cols.append(colname)
-
-    df = pd.read_csv(path)
-    # make sure idx present and boolean parse
-    if "idx" not in df.columns or "pred" not in df.columns:
-        continue
-    df = df[["idx", "pred"]].copy()
-    df["idx"] = df["idx"].astype(int)
-    df[colname] = df["pred"].apply(to_bool)
-    df = df.drop(columns=["pred"]).set_index("idx")
-    pred_frames.append(df)
-
-# merge all prediction columns
-if pred_frames:
-    preds_wide = pd.concat(pred_frames, axis=1).sort_index()
-else:
-    preds_wide = pd.DataFrame(index=gold_df.index)
-
-# align to gold indices
-preds_wide = preds_wide.reindex(gold_df.index)
-
-# combine with gold + metadata
-combined = gold_df.join(preds_wide, how="left")
-
-# compute disagreement metrics
-pred_cols = [c for c in combined.columns if c not in ["word", "sentence1", "sentence2", "gold"]]
-
-def row_disagreement_stats(row):
-    vals = [row[c] for c in pred_cols if pd.notna(row[c])]
-    # convert to strict booleans; ignore None
-    bools = [bool(v) for v in vals if v is not None]
-    total = len(bools)
-    if total == 0:
-        return pd.Series({
-            "total_models": 0,
-            "majority_vote": None,
-            "majority_size": 0,
-            "disagree_among_models": 0,
-            "num_incorrect_vs_gold": None
-        })
-    n_true = sum(bools)
-    n_false = total - n_true
-    majority_vote = (n_true >= n_false)  # ties count as True majority for determinism
-    majority_size = max(n_true, n_false)
-    disagree_among = total - majority_size  # how many disagree with the majority
-    # disagreement vs gold: count of predictions not equal to gold
-    gold = row["gold"]
-    num_incorrect = None
-    if pd.notna(gold):
-        num_incorrect = sum(1 for v in bools if v != bool(gold))
-    return pd.Series({
-        "total_models": total,
-        "majority_vote": majority_vote,
-        "majority_size": majority_size,
-        "disagree_among_models": disagree_among,
-        "num_incorrect_vs_gold": num_incorrect
-    })
-
-stats = combined.apply(row_disagreement_stats, axis=1)
-combined2 = pd.concat([combined, stats], axis=1)
-
-# sort: first by most model disagreement, then by most incorrect vs gold (desc), then by idx
-combined_sorted = combined2.sort_values(
-    by=["disagree_among_models", "num_incorrect_vs_gold", combined2.index.name],
-    ascending=[False, False, True]
+OUT_RUN_SUMMARY = "../results_evaluation/combined_outputs/run_summary.csv"
+OUT_PAIR_AGREEMENT = "../results_evaluation/combined_outputs/run_pairwise_agreement.csv"
+OUT_PAIR_KAPPA = "../results_evaluation/combined_outputs/run_pairwise_kappa.csv"
+
+# read predictions as one items x runs matrix (one column per run, in file name order)
+runs = load_runs(CSV_DIR)
+
+# only new or changed prediction files are parsed; the other columns come from the cache
+cache = RunCache(JSONL_GOLD)
+report = cache.sync(runs)
+print(f"Runs: {len(runs)} ({len(report['added'])} added, {len(report['changed'])} changed, "
+      f"{len(report['removed'])} removed)")
+OUTPUTS = [OUT_JSONL, OUT_JSONL_SORTED, OUT_CSV_SORTED, OUT_RUN_SUMMARY, OUT_PAIR_AGREEMENT, OUT_PAIR_KAPPA]
+if cache.outputs_current("combined_outputs", list(runs), OUTPUTS):
+    print("No run changed; combined outputs left as they are.")
+    sys.exit(0)
+
+matrix = cache.matrix(list(runs))
+model_cols = matrix.runs
+
+# gold + metadata, in the matrix's (idx) order
+gold_df = load_dataset(JSONL_GOLD, columns=["idx", "word", "sentence1", "sentence2"])
+gold_df = gold_df.set_index("idx").loc[matrix.idx]
+
+# compute disagreement metrics for all items at once
+stats = matrix.item_stats()
+
+# sort: first by most model disagreement, then by most incorrect vs gold (desc, unanswered last), then by idx
+sorted_order = np.lexsort((matrix.idx, -stats["num_incorrect_vs_gold"], -stats["disagree_among_models"]))
+
+def combined_chunk(rows: np.ndarray) -> dict:
+    """Output columns for the given item positions; predictions / votes are None where missing."""
+    cols = {
+        "idx": matrix.idx[rows].tolist(),
+        "word": gold_df["word"].to_numpy()[rows].tolist(),
+        "sentence1": gold_df["sentence1"].to_numpy()[rows].tolist(),
+        "sentence2": gold_df["sentence2"].to_numpy()[rows].tolist(),
+        "gold": matrix.gold[rows].tolist(),
+    }
+    values, valid = matrix.values[rows], matrix.valid[rows]
+    for j, name in enumerate(model_cols):
+        col = values[:, j].astype(object)
+        col[~valid[:, j]] = None
+        cols[name] = col.tolist()
+    vote = stats["majority_vote"][rows].astype(object)
+    vote[~stats["has_vote"][rows]] = None
+    cols["total_models"] = stats["total_models"][rows].tolist()
+    cols["majority_vote"] = vote.tolist()
+    for key in ("majority_size", "disagree_among_models"):
+        cols[key] = stats[key][rows].tolist()
+    wrong = stats["num_incorrect_vs_gold"][rows]
+    cols["num_incorrect_vs_gold"] = [int(v) if v == v else None for v in wrong.tolist()]
+    return cols
+
+# write JSONL (wide) unsorted and sorted, CSV sorted; streamed in chunks of items
+def write_outputs(order: np.ndarray, jsonl_path: str, csv_path: str = None, chunk: int = 20000):
+    with open(jsonl_path, "w", encoding="utf-8") as f:
+        csv_f = open(csv_path, "w", encoding="utf-8", newline="") if csv_path else None
+        try:
+            for start in range(0, len(order), chunk):
+                cols = combined_chunk(order[start:start + chunk])
+                names = list(cols)
+                f.write("".join(json.dumps(dict(zip(names, row)), ensure_ascii=False) + "\n"
+                                for row in zip(*cols.values())))
+                if csv_f:
+                    pd.DataFrame(cols).to_csv(csv_f, index=False, header=(start == 0))
+        finally:
+            if csv_f:
+                csv_f.close()
+
+write_outputs(np.arange(matrix.n_items), OUT_JSONL)
+write_outputs(sorted_order, OUT_JSONL_SORTED, OUT_CSV_SORTED)
+
+# per-run accuracy / kappa vs gold and run x run agreement / kappa
+run_summary = matrix.run_stats()
+pairwise = matrix.pairwise()
+run_summary["mean_agreement_with_others"] = (
+    (np.nansum(pairwise["agreement"], axis=1) - 1) / max(matrix.n_runs - 1, 1)
 )
+run_summary.to_csv(OUT_RUN_SUMMARY, index=False)
+pd.DataFrame(pairwise["agreement"], index=model_cols, columns=model_cols).to_csv(OUT_PAIR_AGREEMENT)
+pd.DataFrame(pairwise["kappa"], index=model_cols, columns=model_cols).to_csv(OUT_PAIR_KAPPA)
+cache.mark_outputs("combined_outputs", list(runs))
 
-# write JSONL (wide) unsorted and sorted
-def df_to_jsonl(df, path):
-    records = df.reset_index().to_dict(orient="records")
-    with open(path, "w", encoding="utf-8") as f:
-      for r in records:
-          # ensure JSON-serializable (convert NaNs)
-          cleaned = {k: (None if pd.isna(v) else v) for k, v in r.items()}
-          f.write(json.dumps(cleaned, ensure_ascii=False) + "\n")
-
-df_to_jsonl(combined2, OUT_JSONL)
-df_to_jsonl(combined_sorted, OUT_JSONL_SORTED)
-
-# also save a CSV for quick inspection
-combined_sorted.to_csv(OUT_CSV_SORTED, index=True)
-
-OUT_JSONL, OUT_JSONL_SORTED, OUT_CSV_SORTED
+OUT_JSONL, OUT_JSONL_SORTED, OUT_CSV_SORTED, OUT_RUN_SUMMARY, OUT_PAIR_AGREEMENT, OUT_PAIR_KAPPA
@@ -0,0 +1,162 @@
+import os
+import re
+import sys
+import glob
+import json
+import hashlib
+import numpy as np
+import pandas as pd
+
+# shared dataset / predictions loaders live with the evaluation scripts
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "evaluation"))
+from utils import load_dataset
+from columnar import predictions_store, read_store
+from run_matrix import RunMatrix
+
+# Manifest of the prediction files (path, size, mtime, content hash) plus a small
+# aggregate per run, so the analysis scripts only parse runs that are new or changed:
+#   manifest.json      dataset and run fingerprints
+#   runs/<run>.npz     pred / valid bits on the dataset items, per-POS correct / total
+#   outputs.json       per output set, the run hashes it was last written from
+# Touching a file without changing it costs a re-hash, not a re-parse.
+
+CACHE_DIR = "../results_evaluation/cache/analysis"
+
+FNAME_RE = re.compile(
+    r"^predictions_(?P<model>.+)_(?P<prompt_mode>zero|few)_(?P<language>kk|en)\.csv$",
+    re.IGNORECASE
+)
+
+def load_runs(csv_dir: str) -> dict:
+    """run name (model__mode__lang) -> predictions CSV, in file name order."""
+    runs = {}
+    for path in sorted(glob.glob(os.path.join(csv_dir, "predictions_*.csv"))):
+        m = FNAME_RE.match(os.path.basename(path))
+        if m:
+            runs[f"{m.group('model')}__{m.group('prompt_mode').lower()}__{m.group('language').lower()}"] = path
+    return runs
+
+def file_hash(path: str) -> str:
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def _json_load(path: str, default):
+    if not os.path.exists(path):
+        return default
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def _json_save(path: str, obj):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(obj, f, ensure_ascii=False, indent=1)
+    os.replace(tmp, path)
+
+class RunCache:
+    def __init__(self, dataset_path: str, cache_dir: str = CACHE_DIR):
+        self.cache_dir = cache_dir
+        self.runs_dir = os.path.join(cache_dir, "runs")
+        os.makedirs(self.runs_dir, exist_ok=True)
+        self.manifest_path = os.path.join(cache_dir, "manifest.json")
+        self.outputs_path = os.path.join(cache_dir, "outputs.json")
+        self.manifest = _json_load(self.manifest_path, {"dataset": None, "runs": {}})
+
+        self.idx, self.gold = RunMatrix.load_gold(dataset_path)
+        pos = load_dataset(dataset_path, columns=["idx", "pos"]).set_index("idx")["pos"]
+        self.pos_by_idx = pos.to_dict()
+
+        entry = self._fingerprint(dataset_path, self.manifest["dataset"])
+        if self.manifest["dataset"] is None or entry["sha1"] != self.manifest["dataset"]["sha1"]:
+            # every run aggregate is laid out on the dataset items: start over
+            self.manifest = {"dataset": entry, "runs": {}}
+            _json_save(self.outputs_path, {})
+        else:
+            self.manifest["dataset"] = entry
+
+    @staticmethod
+    def _fingerprint(path: str, old: dict = None) -> dict:
+        st = os.stat(path)
+        if old and old["path"] == path and old["size"] == st.st_size and old["mtime_ns"] == st.st_mtime_ns:
+            return old
+        return {"path": path, "size": st.st_size, "mtime_ns": st.st_mtime_ns, "sha1": file_hash(path)}
+
+    def _run_file(self, name: str) -> str:
+        return os.path.join(self.runs_dir, name + ".npz")
+
+    def _aggregate(self, name: str, path: str):
+        values, valid = RunMatrix.align_run(self.idx, path)
+        # per-POS accuracy the way pos_accuracy.py counts it: the run's own rows and gold column
+        cols = read_store(predictions_store(path), ["idx", "gold", "pred"])
+        n = len(cols["idx"])
+        gold_ok = cols.get("gold.valid", np.ones(n, dtype=bool))
+        pred_ok = cols.get("pred.valid", np.ones(n, dtype=bool))
+        correct = gold_ok & pred_ok & (cols["gold"] == cols["pred"])
+        pos = [self.pos_by_idx.get(int(i)) for i in cols["idx"]]
+        grp = pd.DataFrame({"pos": pos, "correct": correct}).groupby("pos", dropna=False)["correct"].agg(["sum", "size"])
+        pos_keys = [None if pd.isna(k) else k for k in grp.index]
+        pos_correct, pos_n = grp["sum"].to_numpy(), grp["size"].to_numpy()
+        np.savez(self._run_file(name) + ".tmp.npz", values=np.packbits(values), valid=np.packbits(valid),
+                 pos_keys=np.array(json.dumps(pos_keys, ensure_ascii=False)),
+                 pos_correct=np.array(pos_correct, dtype=np.int64), pos_n=np.array(pos_n, dtype=np.int64))
+        os.replace(self._run_file(name) + ".tmp.npz", self._run_file(name))
+
+    def sync(self, runs: dict) -> dict:
+        """
+        Bring the cache in line with `runs` (name -> predictions CSV): aggregate new and
+        changed runs, forget removed ones. Returns {"added": [...], "changed": [...], "removed": [...]}.
+        A run only counts as removed once its file is gone, so syncing another --csv_dir
+        or a subset of the runs leaves the other aggregates alone.
+        """
+        report = {"added": [], "changed": [], "removed": []}
+        known = self.manifest["runs"]
+        for name, path in runs.items():
+            old = known.get(name)
+            entry = self._fingerprint(path, old)
+            if old is not None and entry["sha1"] == old["sha1"] and os.path.exists(self._run_file(name)):
+                known[name] = entry
+                continue
+            self._aggregate(name, path)
+            report["changed" if old is not None else "added"].append(name)
+            known[name] = entry
+        for name in list(known):
+            if name not in runs and not os.path.exists(known[name]["path"]):
+                report["removed"].append(name)
+                del known[name]
+                if os.path.exists(self._run_file(name)):
+                    os.remove(self._run_file(name))
+        _json_save(self.manifest_path, self.manifest)
+        return report
+
+    def load(self, name: str) -> dict:
+        with np.load(self._run_file(name)) as z:
+            n = len(self.idx)
+            return {
+                "values": np.unpackbits(z["values"], count=n).astype(bool),
+                "valid": np.unpackbits(z["valid"], count=n).astype(bool),
+                "pos_keys": json.loads(str(z["pos_keys"])),
+                "pos_correct": z["pos_correct"],
+                "pos_n": z["pos_n"],
+            }
+
+    def matrix(self, names: list, packed: bool = False) -> RunMatrix:
+        values = np.zeros((len(self.idx), len(names)), dtype=bool)
+        valid = np.zeros((len(self.idx), len(names)), dtype=bool)
+        for j, name in enumerate(names):
+            run = self.load(name)
+            values[:, j], valid[:, j] = run["values"], run["valid"]
+        return RunMatrix(self.idx, self.gold, names, values, valid, packed=packed)
+
+    def outputs_current(self, output_set: str, names: list, paths: list) -> bool:
+        """True when `output_set` was last written from exactly these runs and its files still exist."""
+        stamp = _json_load(self.outputs_path, {}).get(output_set)
+        wanted = {n: self.manifest["runs"][n]["sha1"] for n in names}
+        return stamp == {"runs": wanted, "order": list(names)} and all(os.path.exists(p) for p in paths)
+
+    def mark_outputs(self, output_set: str, names: list):
+        stamps = _json_load(self.outputs_path, {})
+        stamps[output_set] = {"runs": {n: self.manifest["runs"][n]["sha1"] for n in names},
+                              "order": list(names)}
+        _json_save(self.outputs_path, stamps)
@@ -0,0 +1,199 @@
+import os
+import sys
+import time
+import argparse
+import numpy as np
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+from scipy.stats import binom
+
+# shared dataset / predictions loaders live with the evaluation scripts
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "evaluation"))
+from utils import load_dataset, metrics_from_counts, METRIC_KEYS
+from run_matrix import RunMatrix
+from run_cache import load_runs
+
+# Uncertainty of the reported numbers: POS-stratified bootstrap CIs of every metric for
+# every run, and paired tests (exact McNemar, sign-flip permutation of the accuracy
+# difference) between runs. All runs share the same resamples, which are drawn as index
+# matrices and turned into per-item multiplicities, so the confusion counts of every
+# (replicate, run) pair come out of one matrix product per block of replicates.
+
+CSV_DIR = "../results_evaluation/csv_results"
+JSONL_PATH = "../processed_data/final_dataset_lastE.jsonl"
+OUT_DIR = "../results_evaluation/significance"
+
+def stratified_indices(strata: np.ndarray, n_boot: int, rng: np.random.Generator) -> np.ndarray:
+    """(n_boot, items) resample index matrix; every stratum keeps its size in every replicate."""
+    idx = np.empty((n_boot, len(strata)), dtype=np.int64)
+    col = 0
+    for s in np.unique(strata):
+        members = np.flatnonzero(strata == s)
+        idx[:, col:col + len(members)] = members[rng.integers(0, len(members), (n_boot, len(members)))]
+        col += len(members)
+    return idx
+
+def multiplicities(idx: np.ndarray, n_items: int) -> np.ndarray:
+    """(n_boot, items) counts of how often each item was drawn, from an index matrix."""
+    b = idx.shape[0]
+    flat = (idx + (np.arange(b) * n_items)[:, None]).ravel()
+    return np.bincount(flat, minlength=b * n_items).reshape(b, n_items).astype(np.float32)
+
+def _category_matrices(matrix: RunMatrix):
+    """items x runs 0/1 float32 matrices of tp / tn / fp / fn (0 where a run has no answer)."""
+    vals, valid = matrix.dense()
+    g = matrix.gold[:, None]
+    return [((vals == p) & (g == t) & valid).astype(np.float32)
+            for p, t in ((True, True), (False, False), (True, False), (False, True))]
+
+def _blocks(total: int, size: int, seed: int):
+    # fixed block sizes and one child seed per block: same numbers whatever the worker count
+    seeds = np.random.SeedSequence(seed).spawn(-(-total // size))
+    return [(start, min(size, total - start), seeds[i]) for i, start in enumerate(range(0, total, size))]
+
+def bootstrap_metrics(matrix: RunMatrix, strata: np.ndarray, n_boot: int = 10000, seed: int = 0,
+                      workers: int = None, block: int = 1000) -> dict:
+    """{metric: (n_boot, runs) array} of every compute_metrics metric on stratified resamples."""
+    cats = _category_matrices(matrix)
+    counts = np.zeros((4, n_boot, matrix.n_runs), dtype=np.int64)
+
+    def run_block(args):
+        start, size, ss = args
+        w = multiplicities(stratified_indices(strata, size, np.random.default_rng(ss)), matrix.n_items)
+        for k, cat in enumerate(cats):
+            # float32 is exact here: counts never exceed the number of items
+            counts[k, start:start + size] = np.rint(w @ cat)
+
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1) as pool:
+        list(pool.map(run_block, _blocks(n_boot, block, seed)))
+    return metrics_from_counts(*counts)
+
+def bootstrap_ci(matrix: RunMatrix, strata: np.ndarray, n_boot: int = 10000, alpha: float = 0.05,
+                 seed: int = 0, workers: int = None) -> pd.DataFrame:
+    """Long table: run, metric, point estimate, percentile CI and bootstrap standard error."""
+    boot = bootstrap_metrics(matrix, strata, n_boot=n_boot, seed=seed, workers=workers)
+    point = matrix.run_stats()
+    rows = []
+    for metric in METRIC_KEYS:
+        with np.errstate(invalid="ignore"):
+            lo, hi = np.nanpercentile(boot[metric], [100 * alpha / 2, 100 * (1 - alpha / 2)], axis=0)
+            se = np.nanstd(boot[metric], axis=0, ddof=1)
+        for j, run in enumerate(matrix.runs):
+            rows.append({"run": run, "metric": metric, "estimate": point[metric].iloc[j],
+                         "ci_low": lo[j], "ci_high": hi[j], "boot_se": se[j]})
+    return pd.DataFrame(rows)
+
+def mcnemar_exact(b: np.ndarray, c: np.ndarray) -> np.ndarray:
+    """Two-sided exact McNemar p-values for discordant counts b, c (any shape)."""
+    n = b + c
+    p = 2 * binom.cdf(np.minimum(b, c), n, 0.5)
+    return np.where(n > 0, np.minimum(p, 1.0), 1.0)
+
+def paired_tests(matrix: RunMatrix, pairs: list = None, n_perm: int = 10000, seed: int = 0,
+                 workers: int = None, block: int = 256) -> pd.DataFrame:
+    """
+    Exact McNemar and a paired sign-flip permutation test of the accuracy difference for
+    each (run_a, run_b) pair (default: all pairs), on the items both runs answered. Every
+    pair is tested against the same sign flips: one matrix product per block of flips.
+    """
+    vals, valid = matrix.dense()
+    correct = (vals == matrix.gold[:, None]) & valid
+    wrong = (vals != matrix.gold[:, None]) & valid
+    r = matrix.n_runs
+    if pairs is None:
+        pairs = [(a, b) for a in range(r) for b in range(a + 1, r)]
+    pa = np.array([a for a, _ in pairs], dtype=np.int64)
+    pb = np.array([b for _, b in pairs], dtype=np.int64)
+
+    # discordant / shared counts of every run pair from a few matrix products
+    c_f, w_f = correct.astype(np.float32), wrong.astype(np.float32)
+    a_right_b_wrong = np.rint(c_f.T @ w_f).astype(np.int64)
+    shared = np.rint(valid.astype(np.float32).T @ valid.astype(np.float32)).astype(np.int64)
+    both_right = np.rint(c_f.T @ c_f).astype(np.int64)
+    b_ = a_right_b_wrong[pa, pb]
+    c_ = a_right_b_wrong[pb, pa]
+    n_shared = shared[pa, pb]
+
+    # per-item differences (+1 / -1 / 0) of each pair, and the observed statistic
+    diffs = np.empty((matrix.n_items, len(pairs)), dtype=np.float32)
+    both = valid[:, pa] & valid[:, pb]
+    diffs[:] = (correct[:, pa].astype(np.int8) - correct[:, pb].astype(np.int8)) * both
+    observed = np.abs(diffs.sum(axis=0))
+    exceed = np.zeros(len(pairs), dtype=np.int64)
+
+    def run_block(args):
+        _, size, ss = args
+        signs = np.random.default_rng(ss).integers(0, 2, (size, matrix.n_items), dtype=np.int8) * 2 - 1
+        stats = np.abs(signs.astype(np.float32) @ diffs)
+        return (stats >= observed - 1e-6).sum(axis=0)
+
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1) as pool:
+        for part in pool.map(run_block, _blocks(n_perm, block, seed)):
+            exceed += part
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        acc_a = (b_ + both_right[pa, pb]) / n_shared
+        acc_b = (c_ + both_right[pa, pb]) / n_shared
+    return pd.DataFrame({
+        "run_a": [matrix.runs[a] for a in pa],
+        "run_b": [matrix.runs[b] for b in pb],
+        "shared_items": n_shared,
+        "accuracy_a": acc_a,
+        "accuracy_b": acc_b,
+        "accuracy_diff": acc_a - acc_b,
+        "a_right_b_wrong": b_,
+        "a_wrong_b_right": c_,
+        "mcnemar_p": mcnemar_exact(b_, c_),
+        "permutation_p": (exceed + 1) / (n_perm + 1),
+    })
+
+def main():
+    ap = argparse.ArgumentParser(description="Bootstrap CIs (POS-stratified) and paired tests for every prediction run.")
+    ap.add_argument("--data", default=JSONL_PATH)
+    ap.add_argument("--csv_dir", default=CSV_DIR)
+    ap.add_argument("--out_dir", default=OUT_DIR)
+    ap.add_argument("--n-boot", type=int, default=10000)
+    ap.add_argument("--n-perm", type=int, default=10000)
+    ap.add_argument("--alpha", type=float, default=0.05)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--workers", type=int, default=None, help="Threads for resampling (default: all CPUs).")
+    ap.add_argument("--baseline", default=None,
+                    help="Only test every run against this one (e.g. gpt4o__zero__kk) instead of all pairs.")
+    args = ap.parse_args()
+
+    runs = load_runs(args.csv_dir)
+    matrix = RunMatrix.from_files(args.data, runs)
+    pos = load_dataset(args.data, columns=["idx", "pos"]).set_index("idx").loc[matrix.idx, "pos"]
+    strata = pd.factorize(pos.fillna("NA"))[0]
+    os.makedirs(args.out_dir, exist_ok=True)
+
+    t0 = time.perf_counter()
+    ci = bootstrap_ci(matrix, strata, n_boot=args.n_boot, alpha=args.alpha, seed=args.seed, workers=args.workers)
+    boot_s = time.perf_counter() - t0
+
+    pairs = None
+    if args.baseline:
+        base = matrix.runs.index(args.baseline)
+        pairs = [(base, j) for j in range(matrix.n_runs) if j != base]
+    t0 = time.perf_counter()
+    tests = paired_tests(matrix, pairs, n_perm=args.n_perm, seed=args.seed, workers=args.workers)
+    test_s = time.perf_counter() - t0
+
+    ci_path = os.path.join(args.out_dir, "bootstrap_ci.csv")
+    tests_path = os.path.join(args.out_dir, "paired_tests.csv")
+    ci.to_csv(ci_path, index=False)
+    tests.sort_values("mcnemar_p").to_csv(tests_path, index=False)
+
+    acc = ci[ci["metric"] == "accuracy"].sort_values("estimate", ascending=False)
+    print(f"=== Accuracy with {100 * (1 - args.alpha):.0f}% POS-stratified bootstrap CI "
+          f"({args.n_boot} replicates) ===")
+    for row in acc.itertuples():
+        print(f"{row.run:35s} {row.estimate:.4f}  [{row.ci_low:.4f}, {row.ci_high:.4f}]")
+    print(f"\n{len(tests)} paired tests; p < {args.alpha}: "
+          f"McNemar {int((tests['mcnemar_p'] < args.alpha).sum())}, "
+          f"permutation {int((tests['permutation_p'] < args.alpha).sum())}")
+    print(f"Bootstrap {boot_s:.2f}s, paired tests {test_s:.2f}s")
+    print(f"Saved: {ci_path}\nSaved: {tests_path}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+import os
+import json
+import hashlib
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+
+# Tokens / lemmas / UPOS of sentences via Stanza, computed once per distinct sentence
+# and kept in an SQLite cache, so dataset_stats.py (or anything else needing lemmas)
+# only runs Stanza on sentences it has never seen with the current model version.
+
+base_dir = os.path.dirname(os.path.abspath(__file__))
+ANNOTATION_CACHE = os.path.join(base_dir, "../results_evaluation/cache/stanza_annotations.sqlite")
+PROCESSORS = "tokenize,pos,lemma"
+
+def sentence_hash(sentence: str) -> str:
+    return hashlib.sha1(sentence.encode("utf-8")).hexdigest()
+
+def model_version(lang: str = "kk", processors: str = PROCESSORS) -> str:
+    """
+    Cache namespace: annotations from another Stanza release (whose default model
+    resources share its version number) are not reused. Read from the package
+    metadata so that a fully cached run never imports stanza / torch.
+    """
+    from importlib.metadata import version
+    return f"stanza-{version('stanza')}/{lang}/{processors}"
+
+def load_pipeline(lang: str = "kk", processors: str = PROCESSORS):
+    import stanza
+    return stanza.Pipeline(lang=lang, processors=processors, verbose=False)
+
+def doc_tokens(doc) -> list:
+    """[(text, lemma, upos), ...] over all sentences of a Stanza Document."""
+    return [(w.text, w.lemma, w.upos) for sent in doc.sentences for w in sent.words]
+
+class AnnotationCache:
+    """SQLite table of annotations keyed by (model version, sentence hash)."""
+    def __init__(self, path: str, version: str):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.version = version
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS annotations ("
+            " version TEXT NOT NULL, hash TEXT NOT NULL, tokens TEXT NOT NULL,"
+            " PRIMARY KEY (version, hash))"
+        )
+
+    def get_many(self, hashes: list) -> dict:
+        found = {}
+        # stay under SQLite's bound-parameter limit
+        for i in range(0, len(hashes), 500):
+            part = hashes[i:i + 500]
+            marks = ",".join("?" * len(part))
+            rows = self.conn.execute(
+                f"SELECT hash, tokens FROM annotations WHERE version = ? AND hash IN ({marks})",
+                [self.version, *part],
+            )
+            for h, tokens in rows:
+                found[h] = [tuple(t) for t in json.loads(tokens)]
+        return found
+
+    def put_many(self, items: dict):
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO annotations (version, hash, tokens) VALUES (?, ?, ?)",
+                [(self.version, h, json.dumps(toks, ensure_ascii=False)) for h, toks in items.items()],
+            )
+
+    def close(self):
+        self.conn.close()
+
+# one pipeline per worker process, built by the pool initializer
+_worker_nlp = None
+
+def _init_worker(lang: str, processors: str):
+    global _worker_nlp
+    _worker_nlp = load_pipeline(lang, processors)
+
+def _annotate_with(nlp, sentences: list, batch_size: int) -> list:
+    out = []
+    for i in range(0, len(sentences), batch_size):
+        # bulk_process runs the whole batch through each processor at once
+        docs = nlp.bulk_process(sentences[i:i + batch_size])
+        out.extend(doc_tokens(d) for d in docs)
+    return out
+
+def _annotate_shard(args) -> list:
+    sentences, batch_size = args
+    return _annotate_with(_worker_nlp, sentences, batch_size)
+
+def annotate(sentences, lang: str = "kk", processors: str = PROCESSORS, batch_size: int = 64,
+             workers: int = 1, cache_path: str = ANNOTATION_CACHE, nlp=None, stats: dict = None) -> list:
+    """
+    [(text, lemma, upos), ...] for every sentence, in input order.
+    Repeated sentences are annotated once; cached ones are not annotated at all. With
+    workers > 1 the new sentences are split into shards, each annotated by its own
+    process and pipeline (worth it only for corpora much larger than Stanza's start-up cost).
+    `nlp` is an already built pipeline to use instead of loading one (single process only).
+    """
+    sentences = [str(s) for s in sentences]
+    unique = {}
+    for s in sentences:
+        unique.setdefault(sentence_hash(s), s)
+
+    cache = AnnotationCache(cache_path, model_version(lang, processors)) if cache_path else None
+    try:
+        done = cache.get_many(list(unique)) if cache else {}
+        todo = [(h, s) for h, s in unique.items() if h not in done]
+        if stats is not None:
+            stats.update(sentences=len(sentences), unique=len(unique), cached=len(done), annotated=len(todo))
+
+        if todo:
+            texts = [s for _, s in todo]
+            if workers > 1 and nlp is None and len(texts) > batch_size:
+                per_shard = -(-len(texts) // workers)
+                shards = [texts[i:i + per_shard] for i in range(0, len(texts), per_shard)]
+                with ProcessPoolExecutor(max_workers=len(shards), initializer=_init_worker,
+                                         initargs=(lang, processors)) as pool:
+                    results = [t for part in pool.map(_annotate_shard, [(sh, batch_size) for sh in shards])
+                               for t in part]
+            else:
+                results = _annotate_with(nlp or load_pipeline(lang, processors), texts, batch_size)
+            new = {h: toks for (h, _), toks in zip(todo, results)}
+            if cache:
+                cache.put_many(new)
+            done.update(new)
+    finally:
+        if cache:
+            cache.close()
+
+    return [done[sentence_hash(s)] for s in sentences]
@@ -0,0 +1,354 @@
+import os
+import sys
+import json
+import time
+import shutil
+import random
+import argparse
+import platform
+import datetime
+import tempfile
+import tracemalloc
+import numpy as np
+import pandas as pd
+
+base_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(base_dir, "evaluation"))
+sys.path.insert(0, os.path.join(base_dir, "analysis"))
+
+from preprocess_data import clean_sentence, find_first_span, compile_kz_stem_pattern, SpanMatcher
+from utils import load_jsonl, load_dataset, parse_bool, compute_metrics, check_metrics_kernel
+from run_matrix import RunMatrix
+from run_cache import RunCache
+
+# Microbenchmarks of the data / metrics hot paths on a synthetic Kazakh-like WiC set:
+# throughput (items/s, best of --repeat) and peak traced memory (tracemalloc, separate
+# run) per benchmark and size. Results go to a JSON file and are compared with a stored
+# baseline JSON; anything slower than the baseline by more than --tolerance is flagged.
+# The *_rowwise cases time the original row-at-a-time pandas code that item_stats and the
+# pos_accuracy / outputs_analysis scripts replaced, as a fixed reference point.
+
+OUT_DIR = os.path.join(base_dir, "../results_evaluation/benchmarks")
+
+# synthetic data
+VOWELS = "аәеиоөұүыі"
+CONSONANTS = "бгғджзйклмнңпрстшқх"
+SUFFIXES = ["", "", "ы", "ді", "ға", "ның", "лар", "да", "ып", "ады", "ған", "тан"]
+POS_WEIGHTS = {"V": 0.49, "N": 0.45, "A": 0.06}
+
+def _syllable(rng: random.Random) -> str:
+    return rng.choice(CONSONANTS) + rng.choice(VOWELS) + (rng.choice(CONSONANTS) if rng.random() < 0.6 else "")
+
+def synth_vocab(size: int, rng: random.Random) -> list:
+    """Distinct stems of 1-3 syllables; a third end in 'у' like Kazakh infinitives."""
+    words = set()
+    while len(words) < size:
+        w = "".join(_syllable(rng) for _ in range(rng.randint(1, 3)))
+        words.add(w + "у" if rng.random() < 0.33 else w)
+    return sorted(words)
+
+def _sentence(stem: str, filler: list, rng: random.Random, found: bool = True):
+    """(sentence, start, end) with one inflected occurrence of `stem` among 3-29 words."""
+    n = rng.randint(3, 29)
+    words = [rng.choice(filler) for _ in range(n)]
+    if not found:
+        return clean_sentence(" ".join(words).capitalize()), -1, -1
+    base = stem[:-1] if stem.endswith("у") and rng.random() < 0.5 else stem
+    k = rng.randrange(n)
+    words[k] = base + rng.choice(SUFFIXES)
+    text = " ".join(words)
+    start = len(" ".join(words[:k])) + (1 if k else 0)
+    end = start + len(words[k])
+    # capitalizing the first word keeps spans valid: lengths do not change
+    return clean_sentence(text[:1].upper() + text[1:]), start, end
+
+def synth_dataset(n: int, seed: int = 0, vocab_size: int = 2000) -> list:
+    """n WiC items shaped like final_dataset_lastE.jsonl (about 1% with a missing span)."""
+    rng = random.Random(seed)
+    vocab = synth_vocab(vocab_size, rng)
+    filler = synth_vocab(5000, rng)
+    pos_tags, pos_w = list(POS_WEIGHTS), list(POS_WEIGHTS.values())
+    rows = []
+    for i in range(1, n + 1):
+        word = rng.choice(vocab)
+        s1, a1, b1 = _sentence(word, filler, rng, found=rng.random() > 0.01)
+        s2, a2, b2 = _sentence(word, filler, rng, found=rng.random() > 0.01)
+        rows.append({"word": word, "sentence1": s1, "sentence2": s2, "idx": i,
+                     "label": rng.random() < 0.5, "start1": a1, "end1": b1, "start2": a2, "end2": b2,
+                     "pos": rng.choices(pos_tags, pos_w)[0], "version": 1.1})
+    return rows
+
+def synth_outputs(n: int, seed: int = 0) -> list:
+    """Raw model replies in the shapes seen in csv_results (plus a few unparseable ones)."""
+    rng = random.Random(seed)
+    shapes = ["True", "False", "true", "False.", " True\n", "FALSE", "True - the meaning is the same", "Maybe"]
+    return [rng.choice(shapes) for _ in range(n)]
+
+def synth_predictions(dataset: list, accuracy: float, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    gold = np.array([r["label"] for r in dataset])
+    pred = np.where(rng.random(len(gold)) < accuracy, gold, ~gold)
+    return pd.DataFrame({
+        "idx": [r["idx"] for r in dataset], "word": [r["word"] for r in dataset],
+        "sentence1": [r["sentence1"] for r in dataset], "sentence2": [r["sentence2"] for r in dataset],
+        "gold": gold, "pred": pred, "raw_output": np.where(pred, "True", "False"),
+        "latency_s": rng.gamma(2.0, 0.3, len(gold)).round(6), "correct": gold == pred,
+    })
+
+def write_jsonl(rows: list, path: str):
+    with open(path, "w", encoding="utf-8") as f:
+        for r in rows:
+            f.write(json.dumps(r, ensure_ascii=False) + "\n")
+
+# benchmarks: each returns (setup() -> state, run(state)); only run() is measured
+def bench_load_jsonl(ctx):
+    return lambda: None, lambda _: load_jsonl(ctx["jsonl"])
+
+def bench_load_dataset_columnar(ctx):
+    load_dataset(ctx["jsonl"])  # build the store outside the timing: this is the warm path
+    return lambda: None, lambda _: load_dataset(ctx["jsonl"])
+
+def bench_compute_metrics(ctx):
+    gold = [r["label"] for r in ctx["rows"]]
+    pred = synth_predictions(ctx["rows"], 0.7, seed=1)["pred"].tolist()
+    return lambda: None, lambda _: compute_metrics(gold, pred)
+
+def bench_parse_bool(ctx):
+    outputs = synth_outputs(len(ctx["rows"]))
+
+    def run(_):
+        for text in outputs:
+            try:
+                parse_bool(text)
+            except ValueError:
+                pass
+    return lambda: None, run
+
+def bench_clean_sentence(ctx):
+    # the raw sheet has doubled spaces, stray newlines and missing final punctuation
+    raw = [r["sentence1"].rstrip(".").replace(" ", "  ", 2) + "\n" for r in ctx["rows"]]
+    return lambda: None, lambda _: [clean_sentence(s) for s in raw]
+
+def bench_find_first_span(ctx):
+    pairs = [(r["word"], r["sentence1"]) for r in ctx["rows"]]
+    for w in {w for w, _ in pairs}:
+        compile_kz_stem_pattern(w)  # patterns are compiled once per stem and cached
+    return lambda: None, lambda _: [find_first_span(w, s) for w, s in pairs]
+
+def bench_span_matcher(ctx):
+    words = [r["word"] for r in ctx["rows"]]
+    sents = [r["sentence1"] for r in ctx["rows"]]
+    vocab = sorted(set(words))
+    return lambda: SpanMatcher(vocab), lambda m: m.first_spans(words, sents)
+
+def bench_item_stats(ctx):
+    # outputs_analysis.py's per-item disagreement stats over every run
+    def setup():
+        rng = np.random.default_rng(0)
+        gold = np.array([r["label"] for r in ctx["rows"]])
+        values = np.where(rng.random((len(gold), ctx["runs"])) < 0.7, gold[:, None], ~gold[:, None])
+        valid = rng.random(values.shape) > 0.01
+        return RunMatrix(np.arange(1, len(gold) + 1), gold, [f"run{j}" for j in range(ctx["runs"])], values, valid)
+    return setup, lambda m: m.item_stats()
+
+def _to_bool(x):
+    # the analysis scripts' original per-cell parser
+    if isinstance(x, bool):
+        return x
+    if pd.isna(x):
+        return None
+    s = str(x).strip().lower()
+    if s in {"true", "t", "1"}:
+        return True
+    if s in {"false", "f", "0"}:
+        return False
+    return None
+
+def bench_item_stats_rowwise(ctx):
+    # outputs_analysis.py before RunMatrix: DataFrame.apply over the wide prediction table
+    def setup():
+        m = bench_item_stats(ctx)[0]()
+        wide = pd.DataFrame(np.where(m.valid, m.values, None), index=m.idx, columns=m.runs)
+        wide.insert(0, "gold", m.gold)
+        return wide
+
+    def stats(row, cols):
+        bools = [bool(row[c]) for c in cols if pd.notna(row[c])]
+        total = len(bools)
+        if total == 0:
+            return pd.Series({"total_models": 0, "majority_vote": None, "majority_size": 0,
+                              "disagree_among_models": 0, "num_incorrect_vs_gold": None})
+        n_true = sum(bools)
+        majority = max(n_true, total - n_true)
+        return pd.Series({"total_models": total, "majority_vote": n_true >= total - n_true,
+                          "majority_size": majority, "disagree_among_models": total - majority,
+                          "num_incorrect_vs_gold": sum(1 for v in bools if v != bool(row["gold"]))})
+    return setup, lambda wide: wide.apply(stats, axis=1, cols=list(wide.columns[1:]))
+
+def bench_pos_accuracy_rowwise(ctx):
+    # pos_accuracy.py before RunCache: re-read every CSV, parse cells one by one, merge POS
+    pos_map = pd.DataFrame(ctx["rows"])[["idx", "pos"]]
+
+    def run(_):
+        out = []
+        for path in ctx["csvs"].values():
+            df = pd.read_csv(path)
+            df["idx"] = df["idx"].astype(int)
+            df["correct_recalc"] = df["gold"].apply(_to_bool) == df["pred"].apply(_to_bool)
+            merged = df.merge(pos_map, on="idx", how="left", validate="many_to_one")
+            out.append((merged["correct_recalc"].mean(),
+                        [(tag, g["correct_recalc"].mean(), len(g)) for tag, g in merged.groupby("pos", dropna=False)]))
+        return out
+    return lambda: None, run
+
+def bench_pos_accuracy_cold(ctx):
+    # pos_accuracy.py's per-file loop: parse every predictions CSV, aggregate per POS
+    def setup():
+        shutil.rmtree(ctx["cache_dir"], ignore_errors=True)
+        for path in ctx["csvs"].values():
+            shutil.rmtree(os.path.join(os.path.dirname(path), ".columnar"), ignore_errors=True)
+        return None
+    return setup, lambda _: RunCache(ctx["jsonl"], ctx["cache_dir"]).sync(ctx["csvs"])
+
+def bench_pos_accuracy_warm(ctx):
+    # the same with nothing changed since the last run: fingerprints only
+    RunCache(ctx["jsonl"], ctx["cache_dir"]).sync(ctx["csvs"])
+    return lambda: None, lambda _: RunCache(ctx["jsonl"], ctx["cache_dir"]).sync(ctx["csvs"])
+
+BENCHMARKS = {
+    "load_jsonl": bench_load_jsonl,
+    "load_dataset_columnar": bench_load_dataset_columnar,
+    "compute_metrics": bench_compute_metrics,
+    "parse_bool": bench_parse_bool,
+    "clean_sentence": bench_clean_sentence,
+    "find_first_span": bench_find_first_span,
+    "span_matcher_first": bench_span_matcher,
+    "item_stats": bench_item_stats,
+    "item_stats_rowwise": bench_item_stats_rowwise,
+    "pos_accuracy_cold": bench_pos_accuracy_cold,
+    "pos_accuracy_warm": bench_pos_accuracy_warm,
+    "pos_accuracy_rowwise": bench_pos_accuracy_rowwise,
+}
+# the row-wise references take minutes past this size; they are skipped above it
+ROWWISE_MAX_N = 10_000
+
+def measure(setup, run, repeat: int, memory: bool) -> dict:
+    times = []
+    for _ in range(repeat):
+        state = setup()
+        t0 = time.perf_counter()
+        run(state)
+        times.append(time.perf_counter() - t0)
+    out = {"seconds": min(times)}
+    if memory:
+        state = setup()
+        tracemalloc.start()
+        run(state)
+        out["peak_mb"] = tracemalloc.get_traced_memory()[1] / 2 ** 20
+        tracemalloc.stop()
+    return out
+
+def make_context(n: int, work_dir: str, runs: int, file_runs: int, seed: int) -> dict:
+    rows = synth_dataset(n, seed=seed)
+    d = os.path.join(work_dir, f"n{n}")
+    os.makedirs(d, exist_ok=True)
+    jsonl = os.path.join(d, "dataset.jsonl")
+    write_jsonl(rows, jsonl)
+    csvs = {}
+    for j in range(file_runs):
+        path = os.path.join(d, f"predictions_model{j}_zero_kk.csv")
+        synth_predictions(rows, 0.6 + 0.3 * j / max(file_runs - 1, 1), seed=j).to_csv(path, index=False)
+        csvs[f"model{j}__zero__kk"] = path
+    return {"rows": rows, "jsonl": jsonl, "csvs": csvs, "runs": runs, "cache_dir": os.path.join(d, "cache")}
+
+def compare(results: list, baseline: dict, tolerance: float) -> list:
+    """Rows of results that are slower than the baseline by more than `tolerance` (0.2 = 20%)."""
+    base = {(r["bench"], r["n"]): r for r in baseline.get("results", [])}
+    slower = []
+    for r in results:
+        b = base.get((r["bench"], r["n"]))
+        if b is None:
+            continue
+        r["baseline_items_s"] = b["items_s"]
+        r["speedup_vs_baseline"] = r["items_s"] / b["items_s"]
+        if r["speedup_vs_baseline"] < 1 - tolerance:
+            slower.append(r)
+    return slower
+
+def main():
+    ap = argparse.ArgumentParser(description="Throughput / peak-memory microbenchmarks on synthetic WiC data.")
+    ap.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000],
+                    help="Item counts to run every benchmark at (up to 1000000).")
+    ap.add_argument("--bench", nargs="+", choices=list(BENCHMARKS), default=list(BENCHMARKS))
+    ap.add_argument("--runs", type=int, default=20, help="Runs in the item_stats matrix.")
+    ap.add_argument("--file-runs", type=int, default=4, help="Prediction CSVs for the pos_accuracy benchmarks.")
+    ap.add_argument("--repeat", type=int, default=3, help="Timed repetitions; the fastest counts.")
+    ap.add_argument("--no-memory", action="store_true", help="Skip the (slower) tracemalloc run.")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--out", default=os.path.join(OUT_DIR, "latest.json"))
+    ap.add_argument("--baseline", default=os.path.join(OUT_DIR, "baseline.json"))
+    ap.add_argument("--save-baseline", action="store_true", help="Store these results as the new baseline.")
+    ap.add_argument("--tolerance", type=float, default=0.2,
+                    help="Flag benchmarks slower than the baseline by more than this fraction.")
+    args = ap.parse_args()
+
+    # vectorized metrics must equal the sklearn reference before their speed means anything
+    rng = np.random.default_rng(args.seed)
+    y_true = rng.random(2000) < 0.5
+    checked = check_metrics_kernel(y_true, rng.random((20, 2000)) < 0.5)
+    print(f"Metrics kernel matches sklearn on {checked} runs")
+
+    work_dir = tempfile.mkdtemp(prefix="wic_bench_")
+    results = []
+    try:
+        for n in args.sizes:
+            t0 = time.perf_counter()
+            ctx = make_context(n, work_dir, args.runs, args.file_runs, args.seed)
+            print(f"\n=== {n:,} items (synthetic data in {time.perf_counter() - t0:.1f}s) ===")
+            for name in args.bench:
+                if name.endswith("_rowwise") and n > ROWWISE_MAX_N:
+                    print(f"{name:24s} skipped above {ROWWISE_MAX_N:,} items")
+                    continue
+                setup, run = BENCHMARKS[name](ctx)
+                res = measure(setup, run, args.repeat, not args.no_memory)
+                res.update(bench=name, n=n, items_s=n / res["seconds"])
+                results.append(res)
+                mem = f"{res['peak_mb']:>9.1f} MB" if "peak_mb" in res else ""
+                print(f"{name:24s} {res['seconds']:>9.4f}s {res['items_s']:>14,.0f} items/s {mem}")
+            shutil.rmtree(os.path.join(work_dir, f"n{n}"), ignore_errors=True)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = {
+        "meta": {"date": datetime.datetime.now().isoformat(timespec="seconds"),
+                 "python": platform.python_version(), "platform": platform.platform(),
+                 "numpy": np.__version__, "pandas": pd.__version__,
+                 "sizes": args.sizes, "repeat": args.repeat, "runs": args.runs, "file_runs": args.file_runs},
+        "results": results,
+    }
+    slower = []
+    if not os.path.exists(args.baseline) and not args.save_baseline:
+        print(f"\nWARNING: no baseline at {args.baseline}, so nothing was checked for regressions."
+              f" Run once with --save-baseline on this machine to create one.")
+    elif not args.save_baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            slower = compare(results, json.load(f), args.tolerance)
+        print(f"\nvs baseline {args.baseline}:")
+        for r in results:
+            if "speedup_vs_baseline" in r:
+                flag = "  <-- slower" if r in slower else ""
+                print(f"{r['bench']:24s} n={r['n']:<9,} {r['speedup_vs_baseline']:6.2f}x{flag}")
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=1)
+    print(f"\nSaved: {args.out}")
+    if args.save_baseline:
+        shutil.copyfile(args.out, args.baseline)
+        print(f"Saved baseline: {args.baseline}")
+    if slower:
+        print(f"{len(slower)} benchmark(s) more than {args.tolerance:.0%} slower than the baseline")
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
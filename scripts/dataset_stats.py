@@ -1,76 +1,90 @@
 import os
+import argparse
 import pandas as pd
 import numpy as np
 import time
-import stanza
-
-nlp = stanza.Pipeline(lang='kk', processors='tokenize,pos,lemma')
-
-# Paths
-base_dir = os.path.dirname(os.path.abspath(__file__))
-jsonl_path = os.path.join(base_dir, "../processed_data/final_dataset_lastE.jsonl")
-
-# Load JSONL dataset
-df = pd.read_json(jsonl_path, lines=True)
-
-# Just in case, ensure that stanza is loaded
-# if nlp:
-#   print("yeah, downloaded")
-
-# col names
-s1_col, s2_col, label_col, pos_col, word_col = "sentence1", "sentence2", "label", "pos", "word"
-
-# Getting sentences and labels
-contexts = list(df[s1_col].astype(str)) + list(df[s2_col].astype(str))
-labels_bool = df[label_col].astype(bool)
-
-# counting number of true/false labels
-true_count = int(labels_bool.sum())
-false_count = len(labels_bool) - true_count
-
-# Tokenization with Stanza(as it is multilangual and supports Kazakh)
-# calculating the time spent on teknization
-start_time = time.time()
-all_tokens = []
-lengths = []
-
-for s in contexts:
-    doc = nlp(s)
-    tokens = [w.text.lower() for sent in doc.sentences for w in sent.words]
-    all_tokens.extend(tokens)
-    lengths.append(len(tokens))
-
-unique_words_contexts = len(set(all_tokens))
-avg_context_len = float(np.mean(lengths))
-
-# taget unique words
-unique_words = df[word_col].nunique()
-# counting POS tags
-pos_counts = df[pos_col].value_counts(dropna=False) #.to_dict()
-
-end_time = time.time()
-elapsed = end_time - start_time
-
-# Printing stats
-print("=== WiC-Kazakh Stats (Stanza) ===")
-print(f"Instances (pairs): {len(df)}")
-print(f"Unique target words: {unique_words}")
-print(f"Unique words in context: {unique_words_contexts}")
-print(f"Avg context length (per sentence): {avg_context_len:.2f}")
-print(f"True labels: {true_count}")
-print(f"False labels: {false_count}")
-
-print("\nPOS Tag Counts:")
-for pos, count in pos_counts.items():
-    print(f"{pos} number: {count}")
-
-print(f"\nTime taken: {elapsed:.2f} seconds")
-import matplotlib.pyplot as plt
-# Plot POS tag counts
-plt.figure(figsize=(10, 6))
-pos_counts.plot(kind='bar')
-plt.title('POS Tag Counts')
-plt.xlabel('POS Tag')
-plt.ylabel('Count')
-plt.tight_layout()
-plt.show()
\ No newline at end of file
+
+from annotations import ANNOTATION_CACHE, annotate
+
+def main():
+    # Paths
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+
+    ap = argparse.ArgumentParser(description="WiC-Kazakh dataset statistics (Stanza tokenization).")
+    ap.add_argument("--data", default=os.path.join(base_dir, "../processed_data/final_dataset_lastE.jsonl"))
+    ap.add_argument("--batch-size", type=int, default=64, help="Sentences per Stanza bulk batch.")
+    ap.add_argument("--workers", type=int, default=1,
+                    help="Processes to shard new (uncached) sentences over.")
+    ap.add_argument("--cache-path", default=ANNOTATION_CACHE,
+                    help="SQLite annotation cache ('' to disable).")
+    ap.add_argument("--no-plot", action="store_true")
+    args = ap.parse_args()
+
+    # Load JSONL dataset
+    df = pd.read_json(args.data, lines=True)
+
+    # col names
+    s1_col, s2_col, label_col, pos_col, word_col = "sentence1", "sentence2", "label", "pos", "word"
+
+    # Getting sentences and labels
+    contexts = list(df[s1_col].astype(str)) + list(df[s2_col].astype(str))
+    labels_bool = df[label_col].astype(bool)
+
+    # counting number of true/false labels
+    true_count = int(labels_bool.sum())
+    false_count = len(labels_bool) - true_count
+
+    # Tokenization with Stanza(as it is multilangual and supports Kazakh)
+    # calculating the time spent on teknization; cached sentences are not re-run
+    start_time = time.time()
+    stats = {}
+    annotated = annotate(contexts, batch_size=args.batch_size, workers=args.workers,
+                         cache_path=args.cache_path or None, stats=stats)
+    all_tokens = []
+    lengths = []
+    for tokens in annotated:
+        all_tokens.extend(text.lower() for text, _, _ in tokens)
+        lengths.append(len(tokens))
+
+    unique_words_contexts = len(set(all_tokens))
+    avg_context_len = float(np.mean(lengths))
+
+    # taget unique words
+    unique_words = df[word_col].nunique()
+    # counting POS tags
+    pos_counts = df[pos_col].value_counts(dropna=False) #.to_dict()
+
+    end_time = time.time()
+    elapsed = end_time - start_time
+
+    # Printing stats
+    print("=== WiC-Kazakh Stats (Stanza) ===")
+    print(f"Instances (pairs): {len(df)}")
+    print(f"Unique target words: {unique_words}")
+    print(f"Unique words in context: {unique_words_contexts}")
+    print(f"Avg context length (per sentence): {avg_context_len:.2f}")
+    print(f"True labels: {true_count}")
+    print(f"False labels: {false_count}")
+
+    print("\nPOS Tag Counts:")
+    for pos, count in pos_counts.items():
+        print(f"{pos} number: {count}")
+
+    print(f"\nTime taken: {elapsed:.2f} seconds "
+          f"({stats['unique']} distinct of {stats['sentences']} sentences, "
+          f"{stats['cached']} from cache, {stats['annotated']} annotated)")
+
+    if args.no_plot:
+        return
+    import matplotlib.pyplot as plt
+    # Plot POS tag counts
+    plt.figure(figsize=(10, 6))
+    pos_counts.plot(kind='bar')
+    plt.title('POS Tag Counts')
+    plt.xlabel('POS Tag')
+    plt.ylabel('Count')
+    plt.tight_layout()
+    plt.show()
+
+if __name__ == "__main__":
+    main()
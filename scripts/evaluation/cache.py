@@ -0,0 +1,139 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+
+import callstats
+
+# off: never touch the cache; read: serve hits, don't store; readwrite: serve hits and store misses;
+# refresh: always call the model and overwrite what is stored
+CACHE_MODES = ("off", "read", "readwrite", "refresh")
+
+# per-call measurements that belong to the answer itself (the cascade escalates on the
+# margin), so they are stored with the response and replayed through callstats on a hit
+META_KEYS = ("margin", "prob_true")
+
+class ResponseCache:
+    """
+    Persistent SQLite cache of raw model responses.
+    Entries are keyed by provider, model, decoding options and a hash of the rendered prompt,
+    and the least recently used ones are evicted once `max_entries` is exceeded.
+    """
+    def __init__(self, path: str, max_entries: int = 200_000):
+        parent = os.path.dirname(os.path.abspath(path))
+        os.makedirs(parent, exist_ok=True)
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._puts = 0
+        self._lock = threading.Lock()
+        # one connection shared by the worker threads, guarded by the lock
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY,"
+            " provider TEXT, model TEXT, options TEXT,"
+            " response TEXT,"
+            " created REAL, last_used REAL)"
+        )
+        columns = {r[1] for r in self._conn.execute("PRAGMA table_info(responses)")}
+        if "meta" not in columns:
+            # caches created before answer metadata was stored
+            self._conn.execute("ALTER TABLE responses ADD COLUMN meta TEXT")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses(last_used)")
+
+    @staticmethod
+    def make_key(provider: str, model: str, options: dict, prompt: str) -> str:
+        prompt_hash = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        ident = json.dumps([provider, model, options or {}, prompt_hash], sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(ident.encode("utf-8")).hexdigest()
+
+    def get(self, key: str):
+        """Return the stored response (refreshing its LRU stamp) or None on a miss."""
+        entry = self.get_entry(key)
+        return entry[0] if entry is not None else None
+
+    def get_entry(self, key: str):
+        """(response, meta dict) of a stored entry (refreshing its LRU stamp), or None on a miss."""
+        with self._lock:
+            row = self._conn.execute("SELECT response, meta FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            self._conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (time.time(), key))
+            return row[0], (json.loads(row[1]) if row[1] else {})
+
+    def put(self, key: str, provider: str, model: str, options: dict, response: str, meta: dict = None):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, provider, model, options, response, meta, created, last_used)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, provider, model, json.dumps(options or {}, sort_keys=True), response,
+                 json.dumps(meta) if meta else None, now, now),
+            )
+            self._puts += 1
+            # counting rows on every insert is wasteful, so only check the cap now and then
+            if self._puts % 256 == 0:
+                self._evict()
+
+    def _evict(self):
+        n = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        excess = n - self.max_entries
+        if excess > 0:
+            self._conn.execute(
+                "DELETE FROM responses WHERE key IN"
+                " (SELECT key FROM responses ORDER BY last_used ASC LIMIT ?)",
+                (excess,),
+            )
+
+    def close(self):
+        with self._lock:
+            self._evict()
+            self._conn.close()
+
+def cached_infer(infer, cache, provider: str, model: str, options: dict, mode: str = "readwrite",
+                 valid=None):
+    """
+    Wrap an `infer(prompt) -> str` callable so it goes through the response cache.
+    The wrapper's own hit/miss counts are kept in `wrapped.stats`, so several runs
+    sharing one cache can still report their counters separately. `valid(text) -> bool`
+    decides which replies are stored (default: all), so a bad generation is retried
+    on the next run instead of being served from the cache.
+    """
+    if mode not in CACHE_MODES:
+        raise ValueError(f"Unknown cache mode: {mode!r}")
+    if cache is None or mode == "off":
+        return infer
+
+    stats = {"hits": 0, "misses": 0}
+
+    def count(kind: str):
+        with cache._lock:
+            stats[kind] += 1
+            setattr(cache, kind, getattr(cache, kind) + 1)
+
+    def wrapped(prompt: str) -> str:
+        key = cache.make_key(provider, model, options, prompt)
+        hit = None if mode == "refresh" else cache.get_entry(key)
+        if hit is not None:
+            count("hits")
+            # lets the runner keep this item out of latency / throughput stats
+            callstats.record("cached", True)
+            for k, v in hit[1].items():
+                callstats.record(k, v)
+            return hit[0]
+        count("misses")
+        out = infer(prompt)
+        if mode in ("readwrite", "refresh") and (valid is None or valid(out)):
+            stats = callstats.current()
+            meta = {k: stats[k] for k in META_KEYS if stats.get(k) is not None}
+            cache.put(key, provider, model, options, out, meta)
+        return out
+
+    wrapped.stats = stats
+    return wrapped
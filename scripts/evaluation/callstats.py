@@ -0,0 +1,24 @@
+import threading
+
+# Per-call measurements (time to first token, retries, ...) that the client and
+# wrapper layers report for the item currently being evaluated on this thread.
+_local = threading.local()
+
+def begin() -> dict:
+    """Start a fresh record for the call about to be made on this thread and return it."""
+    _local.stats = {}
+    return _local.stats
+
+def current() -> dict:
+    stats = getattr(_local, "stats", None)
+    return stats if stats is not None else {}
+
+def record(key: str, value):
+    stats = getattr(_local, "stats", None)
+    if stats is not None:
+        stats[key] = value
+
+def incr(key: str, n=1):
+    stats = getattr(_local, "stats", None)
+    if stats is not None:
+        stats[key] = stats.get(key, 0) + n
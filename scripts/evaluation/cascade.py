@@ -0,0 +1,102 @@
+import time
+import pandas as pd
+
+from utils import latency_percentiles, compute_metrics, uncached_rows, _csv_bool
+
+# Two-tier cascade: a cheap model answers every item and only the items it is unsure
+# about are sent to a stronger model. An item is escalated when
+#   unparsed  the cheap reply is not a True/False answer,
+#   margin    the cheap model's |P(True) - P(False)| on its first answer token is below
+#             the threshold (OpenAI logprobs, HF scores; unknown margins never escalate),
+#   variants  the cheap model answers differently under the other-language prompt.
+# The response cache stores the margin with each reply, so reruns escalate the same items.
+
+REASONS = ("unparsed", "margin", "variants")
+
+class Cascade:
+    """
+    `strong_infer` answers escalated items with `template` (the run's prompt);
+    `variant_template`, if given, is asked of the cheap model as well (other language,
+    same mode). `margin` = 0 turns the logprob check off.
+    """
+    def __init__(self, strong_infer, margin: float = 0.0, variant_template: str = None):
+        self.strong_infer = strong_infer
+        self.margin = margin
+        self.variant_template = variant_template
+
+    def evaluate(self, evaluate_row, infer, template: str, row: dict) -> dict:
+        t0 = time.perf_counter()
+        first = evaluate_row(infer, template, row)
+        calls = 1
+        # the item only counts as served from cache if every call it made was
+        cached = first["cached"]
+        reasons = []
+        if not first["parse_ok"]:
+            reasons.append("unparsed")
+        if self.margin > 0 and first.get("margin") is not None and first["margin"] < self.margin:
+            reasons.append("margin")
+        if self.variant_template is not None and not reasons:
+            other = evaluate_row(infer, self.variant_template, row)
+            calls += 1
+            cached = cached and other["cached"]
+            if not other["parse_ok"] or other["pred"] != first["pred"]:
+                reasons.append("variants")
+        tier1_s = time.perf_counter() - t0
+
+        out = dict(first)
+        out.update({"tier": 1, "tier1_pred": first["pred"], "tier1_latency_s": round(tier1_s, 6),
+                    "cascade_reason": "+".join(reasons) or None})
+        if reasons:
+            second = evaluate_row(self.strong_infer, template, row)
+            calls += 1
+            out.update({k: second[k] for k in ("pred", "raw_output", "ttft_s", "parse_s")})
+            out["retries"] = first["retries"] + second["retries"]
+            cached = cached and second["cached"]
+            out["tier"] = 2
+        # what the item cost end to end, both tiers included
+        out["latency_s"] = round(time.perf_counter() - t0, 6)
+        out["cascade_calls"] = calls
+        out["cached"] = cached
+        return out
+
+def cascade_summary(results_df: pd.DataFrame) -> dict:
+    """Per-tier share, latency and accuracy of a cascade run, plus how many strong calls it saved."""
+    df = results_df[results_df["tier"].notna()]
+    n = len(df)
+    if n == 0:
+        return {}
+    tier = df["tier"].astype(int)
+    gold = df["gold"].astype(bool)
+    final = df["pred"].astype(bool)
+    cheap = df["tier1_pred"].map(_csv_bool).fillna(False).astype(bool)
+    escalated = tier == 2
+
+    def acc(mask, pred):
+        return float((pred[mask] == gold[mask]).mean()) if mask.any() else None
+
+    out = {
+        "cascade_items": n,
+        "tier1_share": float((~escalated).mean()),
+        "tier2_share": float(escalated.mean()),
+        "strong_calls": int(escalated.sum()),
+        # a full pass of the strong model would have made one call per item
+        "strong_call_reduction": float(n / escalated.sum()) if escalated.any() else None,
+        "tier1_accuracy_all": compute_metrics(gold.tolist(), cheap.tolist())["accuracy"],
+        "tier1_accuracy_kept": acc(~escalated, final),
+        "tier1_accuracy_escalated": acc(escalated, cheap),
+        "tier2_accuracy_escalated": acc(escalated, final),
+    }
+    # latencies leave out items served from the response cache
+    live = uncached_rows(df)
+    live_escalated = live["tier"].astype(int) == 2
+    # cheap-tier time of every item, escalated ones included
+    out["cheap_latency_mean_s"] = float(live["tier1_latency_s"].astype(float).mean()) if len(live) else None
+    # end-to-end latency of the items each tier settled
+    for t, mask in ((1, ~live_escalated), (2, live_escalated)):
+        lat = live.loc[mask, "latency_s"].astype(float)
+        out[f"tier{t}_latency_mean_s"] = float(lat.mean()) if len(lat) else None
+        out[f"tier{t}_latency_p95_s"] = latency_percentiles(lat)["p95"]
+    reasons = df["cascade_reason"].dropna().astype(str)
+    for r in REASONS:
+        out[f"escalated_{r}"] = int(reasons.str.contains(r).sum())
+    return out
@@ -0,0 +1,213 @@
+import os
+import re
+import json
+import glob
+import shutil
+import argparse
+import numpy as np
+import pandas as pd
+
+# Typed columnar copies of the dataset JSONL and the prediction CSVs, kept next to the
+# source in a hidden `.columnar/` folder:
+#   <col>.npy           numeric columns (memory-mapped on load, no copy)
+#   <col>.bits.npy      bool columns, bit-packed (np.packbits)
+#   <col>.offsets.npy   string columns: int64 offsets into <col>.blob (UTF-8)
+#   <col>.valid.npy     bit-packed "not null" mask, only for columns with missing values
+#   meta.json           row count, column kinds and the source size / mtime
+# A store is named after the source's size and mtime, so an edited source simply gets a
+# new store and a stale one is never read. This module has no local imports, so the
+# analysis scripts can use it as well.
+
+STORE_DIR = ".columnar"
+FORMAT_VERSION = 1
+
+BOOL_TRUE = {"true", "t", "1", "1.0"}
+BOOL_FALSE = {"false", "f", "0", "0.0"}
+
+def parse_bool_column(values) -> tuple:
+    """(values, valid) bool arrays from True/False, 'TRUE'/'false', 1/0 ...; anything else is missing."""
+    vals = np.zeros(len(values), dtype=bool)
+    valid = np.zeros(len(values), dtype=bool)
+    for i, x in enumerate(values):
+        if isinstance(x, (bool, np.bool_)):
+            vals[i], valid[i] = bool(x), True
+            continue
+        if x is None or (isinstance(x, float) and np.isnan(x)):
+            continue
+        s = str(x).strip().lower()
+        if s in BOOL_TRUE:
+            vals[i], valid[i] = True, True
+        elif s in BOOL_FALSE:
+            valid[i] = True
+    return vals, valid
+
+def _fingerprint(path: str) -> dict:
+    st = os.stat(path)
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+def store_path(source: str) -> str:
+    fp = _fingerprint(source)
+    name = os.path.basename(source)
+    return os.path.join(os.path.dirname(os.path.abspath(source)), STORE_DIR,
+                        f"{name}.{fp['size']}.{fp['mtime_ns']}")
+
+def _save_bits(path: str, bits: np.ndarray):
+    np.save(path, np.packbits(bits))
+
+def _load_bits(path: str, n: int) -> np.ndarray:
+    return np.unpackbits(np.load(path), count=n).astype(bool)
+
+def write_store(df: pd.DataFrame, out_dir: str, source: str = None, bool_columns=()):
+    """Write `df` column by column into `out_dir` (built in a temp folder, renamed into place)."""
+    tmp = f"{out_dir}.tmp{os.getpid()}"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    columns = {}
+    for col in df.columns:
+        s = df[col]
+        if col in bool_columns or s.dtype == bool:
+            vals, valid = parse_bool_column(s.to_numpy(dtype=object))
+            _save_bits(os.path.join(tmp, f"{col}.bits.npy"), vals)
+            kind = "bool"
+        elif pd.api.types.is_numeric_dtype(s.dtype):
+            arr = s.to_numpy()
+            np.save(os.path.join(tmp, f"{col}.npy"), arr)
+            valid = ~np.isnan(arr) if arr.dtype.kind == "f" else np.ones(len(arr), dtype=bool)
+            kind = "num"
+        else:
+            valid = s.notna().to_numpy()
+            encoded = [str(v).encode("utf-8") if ok else b"" for v, ok in zip(s.to_numpy(dtype=object), valid)]
+            offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+            np.cumsum([len(b) for b in encoded], out=offsets[1:])
+            np.save(os.path.join(tmp, f"{col}.offsets.npy"), offsets)
+            with open(os.path.join(tmp, f"{col}.blob"), "wb") as f:
+                f.write(b"".join(encoded))
+            kind = "str"
+        nullable = not bool(valid.all())
+        if nullable:
+            _save_bits(os.path.join(tmp, f"{col}.valid.npy"), valid)
+        columns[col] = {"kind": kind, "nullable": nullable}
+
+    meta = {"format": FORMAT_VERSION, "rows": len(df), "columns": columns,
+            "source": {"path": source, **_fingerprint(source)} if source else None}
+    with open(os.path.join(tmp, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False)
+    try:
+        os.rename(tmp, out_dir)
+    except OSError:
+        # another process finished the same store first; theirs is identical
+        shutil.rmtree(tmp, ignore_errors=True)
+
+class StringColumn:
+    """Strings of one column, decoded from the memory-mapped blob only when accessed."""
+    def __init__(self, offsets: np.ndarray, blob: np.ndarray, valid: np.ndarray = None):
+        self.offsets = offsets
+        self.blob = blob
+        self.valid = valid
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i: int):
+        if self.valid is not None and not self.valid[i]:
+            return None
+        return bytes(self.blob[self.offsets[i]:self.offsets[i + 1]]).decode("utf-8")
+
+    def to_list(self) -> list:
+        data = bytes(self.blob)
+        offs = self.offsets.tolist()
+        out = [data[a:b].decode("utf-8") for a, b in zip(offs[:-1], offs[1:])]
+        if self.valid is not None:
+            out = [v if ok else None for v, ok in zip(out, self.valid)]
+        return out
+
+def read_store(store: str, columns=None) -> dict:
+    """
+    {column: array} from a store. Numeric columns are read-only memmaps, bools are
+    unpacked into bool arrays, strings are StringColumns; `valid` masks of nullable
+    columns are returned under "<col>.valid".
+    """
+    with open(os.path.join(store, "meta.json"), "r", encoding="utf-8") as f:
+        meta = json.load(f)
+    n = meta["rows"]
+    out = {}
+    for col, info in meta["columns"].items():
+        if columns is not None and col not in columns:
+            continue
+        base = os.path.join(store, col)
+        valid = _load_bits(base + ".valid.npy", n) if info["nullable"] else None
+        if info["kind"] == "bool":
+            out[col] = _load_bits(base + ".bits.npy", n)
+        elif info["kind"] == "num":
+            out[col] = np.load(base + ".npy", mmap_mode="r")
+        else:
+            blob_path = base + ".blob"
+            blob = (np.memmap(blob_path, dtype=np.uint8, mode="r") if os.path.getsize(blob_path)
+                    else np.zeros(0, dtype=np.uint8))  # an empty file cannot be mapped
+            out[col] = StringColumn(np.load(base + ".offsets.npy", mmap_mode="r"), blob, valid)
+        if valid is not None:
+            out[col + ".valid"] = valid
+    return out
+
+def to_frame(cols: dict) -> pd.DataFrame:
+    """DataFrame of read_store() output; nullable bools become object columns holding None."""
+    data = {}
+    for col, arr in cols.items():
+        if col.endswith(".valid"):
+            continue
+        valid = cols.get(col + ".valid")
+        if isinstance(arr, StringColumn):
+            data[col] = arr.to_list()
+        elif valid is not None and arr.dtype == bool:
+            obj = arr.astype(object)
+            obj[~valid] = None
+            data[col] = obj
+        else:
+            data[col] = arr
+    return pd.DataFrame(data)
+
+def cached_store(source: str, parse, bool_columns=()) -> str:
+    """Path of the up-to-date store of `source`, building it with `parse(source) -> DataFrame` if needed."""
+    store = store_path(source)
+    if not os.path.exists(os.path.join(store, "meta.json")):
+        parent = os.path.dirname(store)
+        os.makedirs(parent, exist_ok=True)
+        # stores of older versions of this source are dead weight
+        old_re = re.compile(re.escape(os.path.basename(source)) + r"\.\d+\.\d+")
+        for old in os.listdir(parent):
+            if old_re.fullmatch(old):
+                shutil.rmtree(os.path.join(parent, old), ignore_errors=True)
+        write_store(parse(source), store, source=source, bool_columns=bool_columns)
+    return store
+
+# conversion step
+def _read_jsonl(path: str) -> pd.DataFrame:
+    return pd.read_json(path, lines=True, dtype=False)
+
+def _read_predictions_csv(path: str) -> pd.DataFrame:
+    # text stays text even when a run's raw outputs all look like booleans;
+    # gold / pred / ... are parsed into bools by the store
+    text = ("word", "sentence1", "sentence2", "raw_output") + PREDICTION_BOOLS
+    return pd.read_csv(path, dtype={c: object for c in text})
+
+DATASET_BOOLS = ("label",)
+PREDICTION_BOOLS = ("gold", "pred", "correct", "packed")
+
+def dataset_store(path: str) -> str:
+    return cached_store(path, _read_jsonl, bool_columns=DATASET_BOOLS)
+
+def predictions_store(path: str) -> str:
+    return cached_store(path, _read_predictions_csv, bool_columns=PREDICTION_BOOLS)
+
+def main():
+    ap = argparse.ArgumentParser(description="Convert the dataset and every prediction CSV to the columnar format.")
+    ap.add_argument("--data", default="../../processed_data/final_dataset_lastE.jsonl")
+    ap.add_argument("--csv_dir", default="../../results_evaluation/csv_results")
+    args = ap.parse_args()
+
+    print(f"{args.data} -> {dataset_store(args.data)}")
+    for path in sorted(glob.glob(os.path.join(args.csv_dir, "predictions_*.csv"))):
+        print(f"{path} -> {predictions_store(path)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,252 @@
+import os
+import json
+import time
+import hashlib
+import argparse
+import numpy as np
+import pandas as pd
+from sklearn.model_selection import StratifiedKFold
+
+from utils import load_dataset, compute_metrics, model_label, PREDICTION_COLUMNS
+from metrics_store import METRICS_LOG, append_metrics_row
+
+# Non-generative WiC baseline: encode both sentences, mean-pool the hidden states of the
+# tokens inside the target-word span (start/end from preprocess_data.py) and call the pair
+# "same meaning" when the cosine similarity of the two span vectors clears a threshold
+# tuned by cross-validation.
+
+def span_key(sentence: str, start: int, end: int) -> str:
+    return hashlib.sha1(f"{start}\t{end}\t{sentence}".encode("utf-8")).hexdigest()
+
+class SpanVectorCache:
+    """
+    Span vectors of every hidden layer, stored as one memory-mapped float16 array
+    (rows x layers x hidden) plus a JSON index from sentence/span hash to row.
+    New rows are appended to the file; existing rows are never re-encoded.
+    """
+    def __init__(self, cache_dir: str, model: str):
+        os.makedirs(cache_dir, exist_ok=True)
+        self.vec_path = os.path.join(cache_dir, "vectors.f16")
+        self.index_path = os.path.join(cache_dir, "index.json")
+        self.meta = {"model": model, "n_layers": None, "hidden": None, "keys": {}}
+        if os.path.exists(self.index_path):
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                self.meta = json.load(f)
+            if self.meta["model"] != model:
+                raise ValueError(f"{cache_dir} holds vectors of {self.meta['model']}, not {model}")
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.meta["keys"]
+
+    def append(self, keys: list, vectors: np.ndarray):
+        """Add vectors of shape (len(keys), n_layers, hidden)."""
+        if self.meta["n_layers"] is None:
+            self.meta["n_layers"], self.meta["hidden"] = int(vectors.shape[1]), int(vectors.shape[2])
+        start = len(self.meta["keys"])
+        row_bytes = self.meta["n_layers"] * self.meta["hidden"] * 2
+        if os.path.exists(self.vec_path) and os.path.getsize(self.vec_path) != start * row_bytes:
+            # rows written before a crash but never indexed are dropped
+            with open(self.vec_path, "r+b") as f:
+                f.truncate(start * row_bytes)
+        with open(self.vec_path, "ab") as f:
+            f.write(np.ascontiguousarray(vectors, dtype=np.float16).tobytes())
+        for i, key in enumerate(keys):
+            self.meta["keys"][key] = start + i
+        tmp = self.index_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.meta, f)
+        os.replace(tmp, self.index_path)
+
+    def array(self) -> np.ndarray:
+        n = len(self.meta["keys"])
+        return np.memmap(self.vec_path, dtype=np.float16, mode="r",
+                         shape=(n, self.meta["n_layers"], self.meta["hidden"]))
+
+    def rows(self, keys: list) -> np.ndarray:
+        return np.fromiter((self.meta["keys"][k] for k in keys), dtype=np.int64, count=len(keys))
+
+def hidden_state_count(model_name: str) -> int:
+    """Hidden states the model returns: the embedding output plus one per layer."""
+    from transformers import AutoConfig
+
+    return int(AutoConfig.from_pretrained(model_name).num_hidden_layers) + 1
+
+def encode_spans(model_name: str, items: list, batch_size: int = 16) -> np.ndarray:
+    """
+    Mean-pooled span vectors for (sentence, start, end) items, for every hidden layer.
+    Items without a span (start == -1) fall back to the mean over all word tokens.
+    """
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = AutoModel.from_pretrained(model_name, output_hidden_states=True)
+    model.eval()
+
+    out = None
+    order = sorted(range(len(items)), key=lambda i: len(items[i][0]))
+    with torch.inference_mode():
+        for b in range(0, len(order), batch_size):
+            batch = order[b:b + batch_size]
+            enc = tokenizer([items[i][0] for i in batch], return_tensors="pt", padding=True,
+                            truncation=True, max_length=256, return_offsets_mapping=True)
+            offsets = enc.pop("offset_mapping")
+            hidden = torch.stack(model(**enc).hidden_states, dim=1)  # batch x layers x tokens x hidden
+            if out is None:
+                out = np.zeros((len(items), hidden.shape[1], hidden.shape[3]), dtype=np.float32)
+
+            tok_start, tok_end = offsets[..., 0], offsets[..., 1]
+            real = (tok_end > tok_start) & enc["attention_mask"].bool()
+            for j, i in enumerate(batch):
+                _, start, end = items[i]
+                mask = real[j]
+                if start >= 0:
+                    in_span = mask & (tok_start[j] < end) & (tok_end[j] > start)
+                    if in_span.any():
+                        mask = in_span
+                out[i] = hidden[j][:, mask, :].mean(dim=1).float().numpy()
+    return out
+
+def ensure_vectors(cache: SpanVectorCache, model_name: str, items: list, batch_size: int) -> float:
+    """Encode whatever (sentence, span) items are not cached yet; returns the encoding time."""
+    todo, seen = [], set()
+    for sentence, start, end in items:
+        key = span_key(sentence, start, end)
+        if key not in cache and key not in seen:
+            seen.add(key)
+            todo.append((sentence, start, end))
+    if not todo:
+        return 0.0
+    print(f"Encoding {len(todo)} new spans with {model_name} ...")
+    t0 = time.perf_counter()
+    vecs = encode_spans(model_name, todo, batch_size=batch_size)
+    cache.append([span_key(*it) for it in todo], vecs)
+    return time.perf_counter() - t0
+
+def layer_similarity(v1: np.ndarray, v2: np.ndarray, layer: int) -> np.ndarray:
+    a = np.asarray(v1[:, layer, :], dtype=np.float32)
+    b = np.asarray(v2[:, layer, :], dtype=np.float32)
+    num = (a * b).sum(axis=1)
+    den = np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1)
+    return num / np.maximum(den, 1e-8)
+
+def best_threshold(sims: np.ndarray, labels: np.ndarray) -> float:
+    """Threshold (midpoint between neighbouring similarities) with the highest training accuracy."""
+    s = np.sort(np.unique(sims))
+    cands = np.concatenate([[s[0] - 1e-6], (s[:-1] + s[1:]) / 2, [s[-1] + 1e-6]])
+    # accuracy of every candidate at once: items x candidates comparison
+    acc = ((sims[:, None] >= cands[None, :]) == labels[:, None]).mean(axis=0)
+    return float(cands[int(acc.argmax())])
+
+def cv_predict(sims: np.ndarray, labels: np.ndarray, folds: int = 5, seed: int = 0):
+    """Out-of-fold predictions: each fold is classified with the threshold tuned on the others."""
+    preds = np.zeros(len(sims), dtype=bool)
+    thresholds = []
+    skf = StratifiedKFold(n_splits=folds, shuffle=True, random_state=seed)
+    for train, test in skf.split(sims, labels):
+        thr = best_threshold(sims[train], labels[train])
+        thresholds.append(thr)
+        preds[test] = sims[test] >= thr
+    return preds, thresholds
+
+def main():
+    ap = argparse.ArgumentParser(description="Cosine-similarity WiC baseline on contextual span embeddings.")
+    ap.add_argument("--data", default="../../processed_data/final_dataset_lastE.jsonl",
+                    help="Path to WiC JSONL.")
+    ap.add_argument("--model", default="xlm-roberta-base",
+                    help="Encoder on the Hub or a local path.")
+    ap.add_argument("--layer", type=int, default=-4,
+                    help="Hidden layer to compare (0 = embeddings, -1 = last).")
+    ap.add_argument("--scan-layers", action="store_true",
+                    help="Also print the cross-validated accuracy of every layer (uses cached vectors only).")
+    ap.add_argument("--folds", type=int, default=5)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--batch-size", type=int, default=16)
+    ap.add_argument("--cache-dir", default=None,
+                    help="Span vector cache (default: results_evaluation/cache/span_vectors/<model>).")
+    ap.add_argument("--outfile", default=None,
+                    help="CSV name in csv_results (default: predictions_<model>L<layer>cos_zero_kk.csv).")
+    ap.add_argument("--metrics_log", default=METRICS_LOG)
+    args = ap.parse_args()
+
+    df = load_dataset(args.data)
+    df["idx"] = df["idx"].astype(int)
+    label = model_label(args.model)
+    cache_dir = args.cache_dir or f"../../results_evaluation/cache/span_vectors/{label}"
+    cache = SpanVectorCache(cache_dir, args.model)
+
+    # hidden states = embeddings + one per layer; check --layer before any encoding is done
+    n_states = cache.meta["n_layers"] or hidden_state_count(args.model)
+    if not -n_states <= args.layer < n_states:
+        ap.error(f"--layer {args.layer} is out of range for {args.model}: it has {n_states} hidden states "
+                 f"(0..{n_states - 1}, or -{n_states}..-1)")
+
+    items1 = list(zip(df["sentence1"], df["start1"].astype(int), df["end1"].astype(int)))
+    items2 = list(zip(df["sentence2"], df["start2"].astype(int), df["end2"].astype(int)))
+    encode_s = ensure_vectors(cache, args.model, items1 + items2, args.batch_size)
+
+    vecs = cache.array()
+    v1 = vecs[cache.rows([span_key(*it) for it in items1])]
+    v2 = vecs[cache.rows([span_key(*it) for it in items2])]
+    labels = df["label"].astype(bool).to_numpy()
+
+    if args.scan_layers:
+        print("=== CV accuracy per layer ===")
+        for layer in range(vecs.shape[1]):
+            preds, _ = cv_predict(layer_similarity(v1, v2, layer), labels, args.folds, args.seed)
+            print(f"layer {layer:2d}: {float((preds == labels).mean()):.4f}")
+
+    t0 = time.perf_counter()
+    sims = layer_similarity(v1, v2, args.layer)
+    preds, thresholds = cv_predict(sims, labels, args.folds, args.seed)
+    score_s = time.perf_counter() - t0
+
+    # same columns as the LLM runs so pos_accuracy.py / outputs_analysis.py pick the file up;
+    # "zero_kk": no in-context examples, Kazakh input
+    layer_name = args.layer if args.layer >= 0 else vecs.shape[1] + args.layer
+    outfile = args.outfile or f"predictions_{label}L{layer_name}cos_zero_kk.csv"
+    per_item = (encode_s + score_s) / len(df) if len(df) else 0.0
+    results_df = pd.DataFrame({
+        "idx": df["idx"],
+        "word": df["word"],
+        "sentence1": df["sentence1"],
+        "sentence2": df["sentence2"],
+        "gold": labels,
+        "pred": preds,
+        "raw_output": [f"cos={s:.6f}" for s in sims],
+        "latency_s": round(per_item, 6),
+    })
+    results_df["correct"] = results_df["gold"] == results_df["pred"]
+    results_df = results_df.reindex(columns=PREDICTION_COLUMNS)
+    csv_output_path = "../../results_evaluation/csv_results/" + outfile
+    results_df.to_csv(csv_output_path, index=False, encoding="utf-8")
+    print(f"Saved CSV predictions to: {csv_output_path}")
+
+    met = compute_metrics(labels, preds)
+    metrics_row = {
+        "provider": "embedding",
+        "model": args.model,
+        "prompt_mode": "zero",
+        "language": "kk",
+        "items": len(df),
+        **{k: met[k] for k in ("accuracy", "f1", "cohens_kappa", "macro_f1", "weighted_f1",
+                               "precision", "recall", "tp", "tn", "fp", "fn")},
+        "avg_latency_s": per_item,
+        "layer": int(layer_name),
+        "cv_folds": args.folds,
+        "threshold_mean": float(np.mean(thresholds)),
+        "encode_s": encode_s,
+    }
+    append_metrics_row(args.metrics_log, metrics_row)
+    print(f"Appended metrics to: {args.metrics_log}")
+
+    print("\n=== WiC Embedding Baseline ===")
+    print(f"Model: {args.model} | Layer: {layer_name} | {args.folds}-fold CV")
+    print(f"Thresholds per fold: {', '.join(f'{t:.4f}' for t in thresholds)}")
+    print(f"Accuracy:       {met['accuracy']:.4f}")
+    print(f"Cohen's κ:      {met['cohens_kappa']:.4f}")
+    print(f"Macro F1:       {met['macro_f1']:.4f}   Weighted F1: {met['weighted_f1']:.4f}")
+    print(f"Encoding time:  {encode_s:.1f}s (0 when every span was cached)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,35 @@
+import collections
+from concurrent.futures import ThreadPoolExecutor
+
+def run_ordered(fn, items, concurrency: int = 1, executor=None):
+    """
+    Apply `fn` to every item and yield the results in input order.
+    Up to `concurrency` calls are kept in flight on a thread pool; results that
+    finish early are buffered until every item before them has been yielded.
+    A shared `executor` can be passed in (e.g. one pool per provider), in which
+    case `concurrency` only bounds how far ahead this caller submits work.
+    """
+    if concurrency <= 1 and executor is None:
+        for item in items:
+            yield fn(item)
+        return
+
+    own_executor = executor is None
+    if own_executor:
+        executor = ThreadPoolExecutor(max_workers=concurrency)
+
+    # submitting a few items ahead keeps the pool busy while we wait on a slow head item
+    window = max(1, concurrency) * 4
+    pending = collections.deque()
+    try:
+        for item in items:
+            pending.append(executor.submit(fn, item))
+            if len(pending) >= window:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        for fut in pending:
+            fut.cancel()
+        if own_executor:
+            executor.shutdown(wait=True)
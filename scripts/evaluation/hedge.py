@@ -0,0 +1,169 @@
+import time
+import threading
+import collections
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import numpy as np
+import pandas as pd
+
+import callstats
+from metrics_store import read_metrics
+
+# Hedged requests: when a call has not answered within the provider/model's recent p95
+# latency, a duplicate is sent and whichever valid answer arrives first is used.
+# Duplicates are capped at `budget` x calls, so at most that fraction of extra load
+# goes to the provider. The losing attempt is cancelled only if it has not started yet
+# or is cooperative (Ollama streaming checks callstats "cancel" and closes the
+# connection). A non-streaming loser (OpenAI, Gemini, plain Ollama) is dropped, not
+# cancelled: it runs to the end, holding its pool and limiter slots, and its answer is
+# ignored. Time saved is counted when a hedge wins: how long the primary had been
+# running by then, minus what the winning duplicate took.
+# Attempts run on their own threads, so their callstats (retries, throttled, ttft_s)
+# are copied back onto the caller's thread: counters summed, the rest from the winner.
+
+SUMMED_STATS = ("retries", "throttled")
+
+class HedgePolicy:
+    """
+    Hedging threshold and budget for one provider/model. The threshold is the
+    `quantile` of the last `window` primary-call latencies once `min_samples` are in,
+    `initial_s` (e.g. a logged p95) before that; `fixed_s` overrides both.
+    """
+    def __init__(self, budget: float = 0.05, quantile: float = 0.95, min_samples: int = 20,
+                 window: int = 500, initial_s: float = None, fixed_s: float = None, max_workers: int = 16):
+        self.budget = budget
+        self.quantile = quantile
+        self.min_samples = min_samples
+        self.initial_s = initial_s
+        self.fixed_s = fixed_s
+        self.latencies = collections.deque(maxlen=window)
+        self.calls = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.saved_s = 0.0
+        self._lock = threading.Lock()
+        # primary + hedge for every caller thread
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    def threshold(self):
+        if self.fixed_s is not None:
+            return self.fixed_s
+        with self._lock:
+            if len(self.latencies) >= self.min_samples:
+                return float(np.quantile(self.latencies, self.quantile))
+        return self.initial_s
+
+    def start_call(self):
+        with self._lock:
+            self.calls += 1
+
+    def try_hedge(self) -> bool:
+        with self._lock:
+            if self.hedges + 1 > self.budget * self.calls:
+                return False
+            self.hedges += 1
+            return True
+
+    def observe(self, latency_s: float):
+        with self._lock:
+            self.latencies.append(latency_s)
+
+    def record_win(self):
+        with self._lock:
+            self.hedge_wins += 1
+
+    def add_saved(self, seconds: float):
+        with self._lock:
+            self.saved_s += max(0.0, seconds)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"hedge_calls": self.calls, "hedges": self.hedges, "hedge_wins": self.hedge_wins,
+                    "hedge_saved_s": self.saved_s}
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+def logged_p95(metrics_log: str, provider: str, model: str):
+    """Latest logged p95 latency of a provider/model, or None."""
+    df = read_metrics(metrics_log)
+    if df.empty or "latency_p95_s" not in df:
+        return None
+    rows = df[(df["provider"] == provider) & (df["model"] == model) & df["latency_p95_s"].notna()]
+    if "cache_hits" in rows:
+        # rows logged before cache hits were left out of the latency columns (no cached_items) are skewed by them
+        legacy = rows["cached_items"].isna() if "cached_items" in rows else pd.Series(True, index=rows.index)
+        rows = rows[~(legacy & (rows["cache_hits"].fillna(0) > 0))]
+    return float(rows["latency_p95_s"].iloc[-1]) if len(rows) else None
+
+def _attempt(infer, prompt: str, cancel: threading.Event):
+    stats = callstats.begin()
+    callstats.record("cancel", cancel)
+    t0 = time.perf_counter()
+    try:
+        return infer(prompt), None, stats, time.perf_counter() - t0
+    except Exception as e:
+        return None, e, stats, time.perf_counter() - t0
+
+def hedged_infer(infer, policy: HedgePolicy, valid=None):
+    """
+    Wrap an `infer(prompt) -> str` callable with hedging. `valid(text) -> bool` decides
+    whether an answer may win (default: any answer that did not raise).
+    """
+    def ok(result):
+        out, err, _, _ = result
+        return err is None and (valid is None or valid(out))
+
+    def wrapped(prompt: str) -> str:
+        policy.start_call()
+        t0 = time.perf_counter()
+        cancels = [threading.Event()]
+        futures = [policy.executor.submit(_attempt, infer, prompt, cancels[0])]
+        threshold = policy.threshold()
+        done, _ = wait(futures, timeout=threshold)
+        if not done and policy.try_hedge():
+            cancels.append(threading.Event())
+            futures.append(policy.executor.submit(_attempt, infer, prompt, cancels[1]))
+            callstats.incr("hedged")
+
+        # first valid answer wins; if none is valid, the primary's outcome stands
+        winner = None
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            good = [f for f in futures if f in done and ok(f.result())]
+            if good:
+                winner = good[0]
+                break
+        if winner is None:
+            winner = futures[0]
+        won_at = time.perf_counter()
+
+        out, err, stats, took = winner.result()
+        if winner is futures[0]:
+            policy.observe(took)
+        else:
+            # the primary took at least this long; its real latency may never be seen
+            policy.observe(won_at - t0)
+            policy.record_win()
+            policy.add_saved((won_at - t0) - took)
+            callstats.incr("hedge_won")
+
+        for f, cancel in zip(futures, cancels):
+            if f is winner:
+                continue
+            cancel.set()
+            f.cancel()
+        for key in SUMMED_STATS:
+            total = sum(f.result()[2].get(key, 0) for f in futures if f.done() and not f.cancelled())
+            if total:
+                callstats.record(key, total)
+        for key, val in stats.items():
+            if key not in SUMMED_STATS and key != "cancel":
+                callstats.record(key, val)
+        if err is not None:
+            raise err
+        return out
+
+    wrapped.policy = policy
+    return wrapped
@@ -0,0 +1,123 @@
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+import urllib.request
+
+import pandas as pd
+
+from metrics_store import read_metrics
+from sim_server import add_config_args, config_from_args, load_gold, make_server, serve_in_thread
+
+# Load test of runner.py against sim_server.py: the simulated provider is started in
+# this process, then runner.py is run end to end (as a subprocess, exactly as from the
+# command line) once per concurrency setting. Each run logs its metrics row to a
+# separate metrics log; the report joins that with the server-side counters (requests
+# received, injected 429s/5xx, peak in-flight requests) and the runner's exit code, since
+# a call that still fails after --max-retries ends the run.
+
+OUT_DIR = "../../results_evaluation/loadtest"
+
+def _http(url: str, data: bytes = None) -> dict:
+    with urllib.request.urlopen(urllib.request.Request(url, data=data), timeout=10) as resp:
+        return json.loads(resp.read())
+
+def run_once(args, base: str, concurrency: int, metrics_log: str) -> dict:
+    """One runner.py invocation at `concurrency`; its metrics row plus the server counters."""
+    url = f"{base}/api/chat" if args.provider == "ollama" else f"{base}/v1"
+    outfile = os.path.join(OUT_DIR, f"pred_{args.provider}_c{concurrency}.csv")
+    cmd = [sys.executable, "runner.py", "--provider", args.provider, "--model", args.model,
+           "--base-url", url, "--data", args.data, "--mode", args.mode, "--lang", args.lang,
+           "--limit", str(args.limit), "--concurrency", str(concurrency),
+           "--cache-mode", "off", "--max-retries", str(args.max_retries),
+           "--output-path", outfile, "--metrics_log", metrics_log] + args.runner_args
+    if args.stream:
+        cmd.append("--stream")
+    if os.path.exists(outfile):
+        os.remove(outfile)
+
+    _http(f"{base}/reset", data=b"{}")
+    logged = len(read_metrics(metrics_log))
+    t0 = time.perf_counter()
+    proc = subprocess.run(cmd, env={**os.environ, "OPENAI_API_KEY": "sim"},
+                          capture_output=not args.verbose, text=True)
+    wall = time.perf_counter() - t0
+    server = _http(f"{base}/stats")
+
+    row = {"provider": args.provider, "concurrency": concurrency, "exit_code": proc.returncode,
+           "process_wall_s": wall}
+    metrics = read_metrics(metrics_log)
+    if proc.returncode == 0 and len(metrics) > logged:
+        row.update(metrics.iloc[-1].to_dict())
+    elif not args.verbose:
+        tail = (proc.stderr or "").strip().splitlines()[-1:] or ["(no output)"]
+        row["error"] = tail[0]
+    row.update({f"server_{k}" if not k.startswith("server_") else k: v for k, v in server.items()})
+    return row
+
+def print_table(rows: list):
+    def fmt(v, spec=".3f"):
+        return "-" if v is None or (isinstance(v, float) and pd.isna(v)) else format(v, spec)
+
+    print(f"\n{'conc':>5} {'exit':>4} {'items/s':>8} {'p50':>7} {'p95':>7} {'p99':>7} {'acc':>6}"
+          f" {'retries':>7} {'thrott':>6} {'429':>5} {'5xx':>5} {'reqs':>6} {'peak':>5}")
+    for r in rows:
+        print(f"{r['concurrency']:>5} {r['exit_code']:>4} {fmt(r.get('throughput_items_s'), '.2f'):>8}"
+              f" {fmt(r.get('latency_p50_s')):>7} {fmt(r.get('latency_p95_s')):>7} {fmt(r.get('latency_p99_s')):>7}"
+              f" {fmt(r.get('accuracy'), '.3f'):>6} {fmt(r.get('retries'), '.0f'):>7} {fmt(r.get('throttled'), '.0f'):>6}"
+              f" {r['server_injected_429']:>5} {r['server_injected_5xx']:>5} {r['server_requests']:>6}"
+              f" {r['server_in_flight_max']:>5}")
+        if r.get("error"):
+            print(f"      failed: {r['error']}")
+
+def main():
+    ap = argparse.ArgumentParser(description="Drive runner.py against the simulated provider at several concurrencies.")
+    ap.add_argument("--provider", choices=["ollama", "openai"], default="ollama",
+                    help="Protocol the runner speaks to the simulator.")
+    ap.add_argument("--model", default="sim", help="Model name sent to the simulator (seeds its answers).")
+    ap.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16],
+                    help="Concurrency settings to run, one runner invocation each.")
+    ap.add_argument("--limit", type=int, default=200, help="Items per run.")
+    ap.add_argument("--data", default="../../processed_data/final_dataset_lastE.jsonl")
+    ap.add_argument("--mode", choices=["zero", "few"], default="few")
+    ap.add_argument("--lang", choices=["kk", "en"], default="kk")
+    ap.add_argument("--stream", action="store_true", help="Ollama streaming.")
+    ap.add_argument("--max-retries", type=int, default=5)
+    ap.add_argument("--runner-args", nargs=argparse.REMAINDER, default=[],
+                    help="Everything after this is passed to runner.py as is (e.g. --hedge, --pack 4).")
+    ap.add_argument("--verbose", action="store_true", help="Show the runner's own output.")
+    add_config_args(ap)
+    args = ap.parse_args()
+
+    os.makedirs(OUT_DIR, exist_ok=True)
+    server = make_server(load_gold(args.data), config_from_args(args))
+    serve_in_thread(server)
+    host, port = server.server_address[:2]
+    base = f"http://{host}:{port}"
+    print(f"Simulated provider on {base}")
+
+    stamp = time.strftime("%Y%m%d_%H%M%S")
+    metrics_log = os.path.join(OUT_DIR, f"metrics_{stamp}.jsonl")
+    rows = []
+    try:
+        for c in args.concurrency:
+            print(f"[loadtest] {args.provider} concurrency={c} limit={args.limit} ...")
+            rows.append(run_once(args, base, c, metrics_log))
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    print_table(rows)
+    summary = pd.DataFrame(rows)
+    out_csv = os.path.join(OUT_DIR, f"loadtest_{stamp}.csv")
+    summary.to_csv(out_csv, index=False, encoding="utf-8")
+    with open(os.path.join(OUT_DIR, f"loadtest_{stamp}.json"), "w", encoding="utf-8") as f:
+        json.dump({"config": {k: v for k, v in vars(args).items()}, "runs": rows}, f,
+                  ensure_ascii=False, indent=2, default=str)
+    print(f"\nSaved: {out_csv}")
+    sys.exit(1 if any(r["exit_code"] != 0 for r in rows) else 0)
+
+if __name__ == "__main__":
+    main()
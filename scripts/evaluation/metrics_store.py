@@ -0,0 +1,95 @@
+import os
+import json
+import argparse
+import datetime
+import pandas as pd
+
+try:
+    import fcntl
+except ImportError:  # Windows: O_APPEND writes of one small line are still atomic enough
+    fcntl = None
+
+METRICS_LOG = "../../results_evaluation/metrics_log.jsonl"
+
+def _json_default(x):
+    # numpy scalars (np.int64, np.float64, np.bool_) expose .item()
+    if hasattr(x, "item"):
+        return x.item()
+    return str(x)
+
+def append_metrics_row(path: str, row: dict):
+    """
+    Append one metrics row to the JSONL log (creates it if missing).
+    The row is written with a single O_APPEND write under an exclusive lock,
+    so parallel runs never interleave or drop each other's rows.
+    """
+    record = dict(row)
+    record.setdefault("logged_at", datetime.datetime.now().isoformat(timespec="seconds"))
+    data = (json.dumps(record, ensure_ascii=False, default=_json_default) + "\n").encode("utf-8")
+
+    parent = os.path.dirname(os.path.abspath(path))
+    os.makedirs(parent, exist_ok=True)
+    fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        if fcntl:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+        os.write(fd, data)
+    finally:
+        if fcntl:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
+
+def read_metrics(path: str) -> pd.DataFrame:
+    """Load every logged row; columns are the union of all rows' keys, in first-seen order."""
+    rows = []
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    rows.append(json.loads(line))
+                except json.JSONDecodeError:
+                    print(f"Skipping unreadable metrics line: {line[:80]!r}")
+    return pd.DataFrame(rows)
+
+def export_metrics(path: str, xlsx_path: str = None, csv_path: str = None) -> pd.DataFrame:
+    """Render the JSONL log into the xlsx / CSV views."""
+    df = read_metrics(path)
+    if xlsx_path:
+        df.to_excel(xlsx_path, index=False)
+        print(f"Exported {len(df)} rows to: {xlsx_path}")
+    if csv_path:
+        df.to_csv(csv_path, index=False, encoding="utf-8")
+        print(f"Exported {len(df)} rows to: {csv_path}")
+    return df
+
+def import_xlsx(xlsx_path: str, path: str):
+    """One-off migration of the legacy metrics_log.xlsx rows into the JSONL log."""
+    old = pd.read_excel(xlsx_path)
+    for rec in old.to_dict(orient="records"):
+        rec.setdefault("logged_at", None)  # the legacy log has no timestamps
+        append_metrics_row(path, {k: (None if pd.isna(v) else v) for k, v in rec.items()})
+    print(f"Imported {len(old)} rows from {xlsx_path} into {path}")
+
+def main():
+    ap = argparse.ArgumentParser(description="Append-only metrics log: export views or import the legacy Excel log.")
+    ap.add_argument("--log", default=METRICS_LOG, help="JSONL metrics log.")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    exp = sub.add_parser("export", help="Write xlsx and/or CSV views of the log.")
+    exp.add_argument("--xlsx", default="../../results_evaluation/metrics_log.xlsx")
+    exp.add_argument("--csv", default=None)
+
+    imp = sub.add_parser("import-xlsx", help="Append the rows of a legacy Excel log.")
+    imp.add_argument("xlsx")
+
+    args = ap.parse_args()
+    if args.cmd == "export":
+        export_metrics(args.log, xlsx_path=args.xlsx, csv_path=args.csv)
+    else:
+        import_xlsx(args.xlsx, args.log)
+
+if __name__ == "__main__":
+    main()
@@ -3,12 +3,17 @@ import google.generativeai as genai
 
 class GeminiChat:
     """Gemini 1.5 Pro/Flash via google-generativeai."""
+    provider = "gemini"
+
     def __init__(self, model: str = "gemini-1.5-pro", api_key_env: str = "GOOGLE_API_KEY"):
         key = os.getenv(api_key_env)
         if not key:
             raise RuntimeError(f"{api_key_env} is not set")
         genai.configure(api_key=key)
+        self.model_name = model
         self.model = genai.GenerativeModel(model)
+        # SDK defaults are used for decoding; kept for the response-cache key
+        self.options = {}
 
     def infer(self, prompt: str) -> str:
         out = self.model.generate_content(prompt)
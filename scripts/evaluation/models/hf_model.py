@@ -0,0 +1,91 @@
+import torch
+from transformers import AutoModelForCausalLM, AutoTokenizer
+
+import callstats
+
+class HFScorer:
+    """
+    Local causal LM via transformers, on CPU.
+    Instead of generating, each prompt is run through the model once and the
+    next-token logits of "True" and "False" are compared, which also gives
+    P(True) for calibrated thresholds. Prompts are batched by length bucket.
+    """
+    provider = "hf"
+
+    def __init__(self, model: str = "Qwen/Qwen2-0.5B-Instruct", batch_size: int = 8,
+                 quantize: bool = False, threshold: float = 0.5, max_length: int = 1024,
+                 lm=None, tokenizer=None):
+        self.model = model
+        self.batch_size = max(1, batch_size)
+        self.threshold = threshold
+        self.max_length = max_length
+
+        # `lm` / `tokenizer` can be passed in directly, e.g. a tiny randomly initialised model
+        self.tokenizer = tokenizer or AutoTokenizer.from_pretrained(model)
+        self.tokenizer.padding_side = "left"  # so position -1 is the last real token of every row
+        self.tokenizer.truncation_side = "left"  # over-long prompts lose the instructions, not the question
+        if self.tokenizer.pad_token is None:
+            self.tokenizer.pad_token = self.tokenizer.eos_token
+
+        self.lm = lm or AutoModelForCausalLM.from_pretrained(model, torch_dtype=torch.float32)
+        self.lm.eval()
+        if quantize:
+            # dynamic int8 for the Linear layers; activations stay float
+            self.lm = torch.quantization.quantize_dynamic(self.lm, {torch.nn.Linear}, dtype=torch.qint8)
+
+        self.use_chat_template = bool(getattr(self.tokenizer, "chat_template", None))
+        true_ids = self._first_token_ids("True")
+        false_ids = self._first_token_ids("False")
+        # a first token both spellings share (a bare space, a common subword) says nothing
+        # either way, and counted on both sides it would pull P(True) toward 0.5
+        shared = set(true_ids) & set(false_ids)
+        self.true_ids = [i for i in true_ids if i not in shared]
+        self.false_ids = [i for i in false_ids if i not in shared]
+        if not self.true_ids or not self.false_ids:
+            raise ValueError(f"{model}: the tokenizer gives no first token that tells True from False")
+        self.options = {"scoring": "next_token_logits", "quantize": quantize,
+                        "chat_template": self.use_chat_template, "threshold": threshold}
+
+    def _first_token_ids(self, word: str) -> list:
+        # "True" and " True" are usually different tokens; either may follow the prompt
+        ids = set()
+        for variant in (word, " " + word, word.lower(), " " + word.lower()):
+            toks = self.tokenizer.encode(variant, add_special_tokens=False)
+            if toks:
+                ids.add(toks[0])
+        return sorted(ids)
+
+    def _format(self, prompt: str) -> str:
+        if self.use_chat_template:
+            return self.tokenizer.apply_chat_template(
+                [{"role": "user", "content": prompt}], tokenize=False, add_generation_prompt=True)
+        return prompt
+
+    @torch.inference_mode()
+    def score_batch(self, prompts: list) -> list:
+        """P(True) for every prompt, in input order."""
+        texts = [self._format(p) for p in prompts]
+        lengths = [len(self.tokenizer.encode(t, add_special_tokens=False)) for t in texts]
+        # similar lengths share a batch, so little compute is spent on padding
+        order = sorted(range(len(texts)), key=lambda i: lengths[i])
+        probs = [0.0] * len(texts)
+        for start in range(0, len(order), self.batch_size):
+            bucket = order[start:start + self.batch_size]
+            enc = self.tokenizer([texts[i] for i in bucket], return_tensors="pt", padding=True,
+                                 truncation=True, max_length=self.max_length)
+            # positions must count real tokens only, or left padding shifts them
+            position_ids = (enc["attention_mask"].long().cumsum(-1) - 1).clamp(min=0)
+            logits = self.lm(input_ids=enc["input_ids"], attention_mask=enc["attention_mask"],
+                             position_ids=position_ids).logits[:, -1, :].float()
+            lt = torch.logsumexp(logits[:, self.true_ids], dim=-1)
+            lf = torch.logsumexp(logits[:, self.false_ids], dim=-1)
+            p_true = torch.sigmoid(lt - lf)
+            for i, p in zip(bucket, p_true.tolist()):
+                probs[i] = p
+        return probs
+
+    def infer(self, prompt: str) -> str:
+        p = self.score_batch([prompt])[0]
+        callstats.record("prob_true", p)
+        callstats.record("margin", abs(2 * p - 1))  # |P(True) - P(False)|
+        return "True" if p >= self.threshold else "False"
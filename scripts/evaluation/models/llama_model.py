@@ -1,27 +1,82 @@
+import json
+import time
 import requests
+from requests.adapters import HTTPAdapter
+
+import callstats
+from utils import parse_bool
 
 class OllamaChat:
     """
     Llama-3 via local Ollama REST API.
     You should do `ollama serve` and `ollama pull llama3` beforehand.
+    Requests go through one keep-alive session. With `stream=True` the reply is read
+    token by token and the connection is dropped (which makes Ollama stop generating)
+    as soon as the text decides True/False.
     """
+    provider = "ollama"
+
     def __init__(self, model: str = "llama3",
-                 url: str = "http://localhost:11434/api/chat"):
+                 url: str = "http://localhost:11434/api/chat",
+                 stream: bool = False, pool_size: int = 8, timeout: float = 300):
         self.model = model
         self.url = url
+        self.stream = stream
+        self.timeout = timeout
+        self.options = {
+            "temperature": 0.0,
+            "num_predict": 8,   # enough for True/False
+            "num_ctx": 1024      # keeping memory small for 8 GB MacOS
+        }
+        # pooled keep-alive connections, one per concurrent worker
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(1, pool_size))
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
 
     def infer(self, prompt: str) -> str:
         payload = {
             "model": self.model,
             "messages": [{"role": "user", "content": prompt}],
-            "stream": False,
-            "options": {
-                "temperature": 0.0,
-                "num_predict": 8,   # enough for True/False
-                "num_ctx": 1024      # keeping memory small for 8 GB MacOS
-            }
+            "stream": self.stream,
+            "options": self.options
         }
-        r = requests.post(self.url, json=payload, timeout=300)
+        if self.stream:
+            return self._infer_stream(payload)
+        r = self.session.post(self.url, json=payload, timeout=self.timeout)
         r.raise_for_status()
         data = r.json()
         return data["message"]["content"].strip()
+
+    def _infer_stream(self, payload: dict) -> str:
+        t0 = time.perf_counter()
+        text = ""
+        first = True
+        with self.session.post(self.url, json=payload, timeout=self.timeout, stream=True) as r:
+            r.raise_for_status()
+            # chunk_size=None hands over each chunk as soon as Ollama sends it
+            for line in r.iter_lines(chunk_size=None):
+                if not line:
+                    continue
+                chunk = json.loads(line)
+                piece = chunk.get("message", {}).get("content", "")
+                if piece and first:
+                    callstats.record("ttft_s", time.perf_counter() - t0)
+                    first = False
+                text += piece
+                if chunk.get("done") or _decided(text):
+                    break
+                # a hedged duplicate already answered: stop generating
+                cancel = callstats.current().get("cancel")
+                if cancel is not None and cancel.is_set():
+                    break
+        # leaving the block closes the response; an unfinished stream is cancelled server-side
+        return text.strip()
+
+def _decided(text: str) -> bool:
+    """True once the output prefix already determines what parse_bool will return."""
+    try:
+        parse_bool(text)
+        return True
+    except ValueError:
+        return False
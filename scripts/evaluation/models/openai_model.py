@@ -1,20 +1,46 @@
 import os
+import math
 from openai import OpenAI
 
+import callstats
+
 class OpenAIChat:
     """GPT-4o via OpenAI SDK."""
-    def __init__(self, model: str = "gpt-4o", api_key_env: str = "OPENAI_API_KEY"):
+    provider = "openai"
+
+    def __init__(self, model: str = "gpt-4o", api_key_env: str = "OPENAI_API_KEY", logprobs: bool = False,
+                 base_url: str = None):
         key = os.getenv(api_key_env)
         if not key:
             raise RuntimeError(f"{api_key_env} is not set")
-        self.client = OpenAI(api_key=key)
+        # base_url: any OpenAI-compatible endpoint, e.g. the local sim_server.py
+        # max_retries=0: ProviderLimiter does all retrying, so it sees every 429 / 5xx
+        self.client = OpenAI(api_key=key, base_url=base_url, max_retries=0)
         self.model = model
+        # decoding options, also part of the response-cache key
+        self.options = {"temperature": 0.0, "max_tokens": 3}
+        if logprobs:
+            # top alternatives of the first answer token, for the cascade's confidence margin
+            self.options.update({"logprobs": True, "top_logprobs": 5})
 
     def infer(self, prompt: str) -> str:
         r = self.client.chat.completions.create(
             model=self.model,
             messages=[{"role": "user", "content": prompt}],
-            temperature=0.0,
-            max_tokens=3
+            **self.options
         )
-        return r.choices[0].message.content.strip()
+        choice = r.choices[0]
+        if self.options.get("logprobs") and choice.logprobs and choice.logprobs.content:
+            callstats.record("margin", answer_margin(choice.logprobs.content[0].top_logprobs))
+        return choice.message.content.strip()
+
+def answer_margin(top_logprobs) -> float:
+    """|P(True) - P(False)| over the first token's alternatives ("True", " true", ... all count)."""
+    p = {"true": 0.0, "false": 0.0}
+    for alt in top_logprobs:
+        word = alt.token.strip().lower()
+        for answer in p:
+            if word and answer.startswith(word):
+                p[answer] += math.exp(alt.logprob)
+                break
+    return abs(p["true"] - p["false"])
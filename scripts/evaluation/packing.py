@@ -0,0 +1,49 @@
+import re
+import copy
+
+# "3: True", "3) false", "Pair 3 - TRUE", "**3.** True", "Жұп 3: False"
+ANSWER_RE = re.compile(
+    r"^\W*(?:pair|жұп)?\s*(\d+)\W*(true|false)\b",
+    flags=re.IGNORECASE | re.MULTILINE | re.UNICODE,
+)
+
+def render_packed(template: str, item_template: str, rows: list) -> str:
+    """Build one prompt holding every row of the pack as a numbered pair (1-based)."""
+    pairs = "\n".join(
+        item_template.format(n=n, sentence1=row["sentence1"], sentence2=row["sentence2"],
+                             target_word=row["word"])
+        for n, row in enumerate(rows, start=1)
+    )
+    return template.format(pairs=pairs)
+
+def parse_packed(text: str, n_items: int) -> dict:
+    """
+    Map pair numbers (1..n_items) to booleans. Numbers outside the range and numbers
+    answered twice with different values are left out, so those items fall back
+    to a single-item call.
+    """
+    answers, conflicts = {}, set()
+    for m in ANSWER_RE.finditer(text or ""):
+        n = int(m.group(1))
+        if not 1 <= n <= n_items:
+            continue
+        val = m.group(2).lower() == "true"
+        if n in answers and answers[n] != val:
+            conflicts.add(n)
+        answers[n] = val
+    for n in conflicts:
+        del answers[n]
+    return answers
+
+def widen_output_budget(client, pack_size: int):
+    """
+    Copy of `client` whose output-length option leaves room for `pack_size` answer lines.
+    The copy shares the underlying SDK client / HTTP session.
+    """
+    packed = copy.copy(client)
+    packed.options = dict(client.options)
+    budget = 6 * pack_size + 8  # "12: False\n" is ~5 tokens
+    for key in ("max_tokens", "num_predict"):
+        if key in packed.options:
+            packed.options[key] = max(packed.options[key], budget)
+    return packed
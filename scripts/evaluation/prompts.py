@@ -79,3 +79,97 @@ PROMPTS = {
     ("zero", "kk"): ZERO_SHOT_KK,
     ("few", "kk"): FEW_SHOT_KK,
 }
+
+# packed prompts: several numbered pairs per request, one "<n>: True|False" line per pair
+PACKED_ITEM_EN = """Pair {n}:
+Sentence 1: {sentence1}
+Sentence 2: {sentence2}
+Word: {target_word}
+"""
+
+PACKED_ITEM_KK = """Жұп {n}:
+Сөйлем 1: {sentence1}
+Сөйлем 2: {sentence2}
+Сөз: {target_word}
+"""
+
+PACKED_ZERO_SHOT_EN = """You are given several numbered pairs of sentences. Both sentences of a pair contain the same target word.
+For each pair, determine whether the word has the same meaning in both sentences.
+If the meaning is the same, answer "True".
+If the meaning is different, answer "False".
+Write exactly one line per pair in the form "<pair number>: True" or "<pair number>: False", and nothing else.
+
+{pairs}
+Answers:
+"""
+
+PACKED_FEW_SHOT_EN = """You are given several numbered pairs of sentences. Both sentences of a pair contain the same target word.
+For each pair, determine whether the word has the same meaning in both sentences.
+If the meaning is the same, answer "True".
+If the meaning is different, answer "False".
+Write exactly one line per pair in the form "<pair number>: True" or "<pair number>: False", and nothing else.
+
+Examples:
+
+Pair 1:
+Sentence 1: Ол үстелдің басында отырды.
+Sentence 2: Оның басы ауырды.
+Word: бас
+
+Pair 2:
+Sentence 1: Ол ағылшын тілін үйреніп жүр.
+Sentence 2: Қазақ тілі - мемлекеттік тіл.
+Word: тіл
+
+Answers:
+1: False
+2: True
+
+Now your task:
+{pairs}
+Answers:
+"""
+
+PACKED_ZERO_SHOT_KK = """Саған нөмірленген бірнеше сөйлем жұбы берілген. Әр жұптың екі сөйлемі де бірдей мақсатты сөзді қамтиды.
+Әр жұп үшін осы сөздің екі сөйлемде де бірдей мағынада қолданылған-қолданылмағанын анықта.
+Егер мағынасы бірдей болса, "True" деп жауап бер.
+Егер мағынасы әртүрлі болса, "False" деп жауап бер.
+Әр жұпқа бір жол жаз: "<жұп нөмірі>: True" немесе "<жұп нөмірі>: False". Басқа ештеңе жазба.
+
+{pairs}
+Жауаптар:
+"""
+
+PACKED_FEW_SHOT_KK = """Саған нөмірленген бірнеше сөйлем жұбы берілген. Әр жұптың екі сөйлемі де бірдей мақсатты сөзді қамтиды.
+Әр жұп үшін осы сөздің екі сөйлемде де бірдей мағынада қолданылған-қолданылмағанын анықта.
+Егер мағынасы бірдей болса, "True" деп жауап бер.
+Егер мағынасы әртүрлі болса, "False" деп жауап бер.
+Әр жұпқа бір жол жаз: "<жұп нөмірі>: True" немесе "<жұп нөмірі>: False". Басқа ештеңе жазба.
+
+Мысалдар:
+
+Жұп 1:
+Сөйлем 1: Ол үстелдің басында отырды.
+Сөйлем 2: Оның басы ауырды.
+Сөз: бас
+
+Жұп 2:
+Сөйлем 1: Ол ағылшын тілін үйреніп жүр.
+Сөйлем 2: Қазақ тілі - мемлекеттік тіл.
+Сөз: тіл
+
+Жауаптар:
+1: False
+2: True
+
+Енді сенің тапсырмаң:
+{pairs}
+Жауаптар:
+"""
+
+PACKED_PROMPTS = {
+    ("zero", "en"): (PACKED_ZERO_SHOT_EN, PACKED_ITEM_EN),
+    ("few", "en"): (PACKED_FEW_SHOT_EN, PACKED_ITEM_EN),
+    ("zero", "kk"): (PACKED_ZERO_SHOT_KK, PACKED_ITEM_KK),
+    ("few", "kk"): (PACKED_FEW_SHOT_KK, PACKED_ITEM_KK),
+}
@@ -0,0 +1,148 @@
+import time
+import random
+import threading
+
+import callstats
+
+THROTTLE_STATUS = {429}
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+def _status_code(exc):
+    """HTTP status of an SDK / requests error, whichever attribute the library uses."""
+    for obj in (exc, getattr(exc, "response", None)):
+        code = getattr(obj, "status_code", None)
+        if isinstance(code, int):
+            return code
+    # google.api_core errors carry the HTTP status in `.code`
+    code = getattr(exc, "code", None)
+    return code if isinstance(code, int) else None
+
+def is_throttle(exc) -> bool:
+    name = type(exc).__name__
+    return _status_code(exc) in THROTTLE_STATUS or name in ("RateLimitError", "ResourceExhausted")
+
+def is_retryable(exc) -> bool:
+    if is_throttle(exc) or _status_code(exc) in RETRYABLE_STATUS:
+        return True
+    name = type(exc).__name__
+    return "Timeout" in name or "Connection" in name or name in ("DeadlineExceeded", "ServiceUnavailable")
+
+def _retry_after(exc):
+    headers = getattr(getattr(exc, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+def estimate_tokens(prompt: str, max_output_tokens: int = 8) -> int:
+    # rough: Kazakh Cyrillic splits into more sub-word tokens than English, ~3 chars per token
+    return len(prompt) // 3 + max_output_tokens
+
+class TokenBucket:
+    """Refills `per_minute` units per minute up to one minute's worth; take() blocks until enough are there."""
+    def __init__(self, per_minute: float):
+        self.rate = per_minute / 60.0
+        self.capacity = float(per_minute)
+        self.tokens = self.capacity
+        self.stamp = time.monotonic()
+        self._lock = threading.Lock()
+
+    def take(self, n: float = 1.0):
+        n = min(float(n), self.capacity)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.stamp) * self.rate)
+                self.stamp = now
+                if self.tokens >= n:
+                    self.tokens -= n
+                    return
+                wait = (n - self.tokens) / self.rate
+            time.sleep(wait)
+
+class AIMDLimiter:
+    """
+    In-flight limit that grows by `increase` per window of successful calls and is
+    cut by `decrease` when the provider throttles (at most once per `cooldown_s`).
+    """
+    def __init__(self, max_limit: int, min_limit: int = 1, increase: float = 1.0,
+                 decrease: float = 0.5, cooldown_s: float = 2.0):
+        self.max_limit = max(1, max_limit)
+        self.min_limit = max(1, min(min_limit, self.max_limit))
+        self.limit = float(self.max_limit)
+        self.increase = increase
+        self.decrease = decrease
+        self.cooldown_s = cooldown_s
+        self.in_flight = 0
+        self.throttled = 0
+        self._last_cut = 0.0
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                self._cond.wait()
+            self.in_flight += 1
+
+    def release(self, throttled: bool = False):
+        with self._cond:
+            self.in_flight -= 1
+            now = time.monotonic()
+            if throttled:
+                self.throttled += 1
+                if now - self._last_cut >= self.cooldown_s:
+                    self.limit = max(self.min_limit, self.limit * self.decrease)
+                    self._last_cut = now
+            else:
+                # +increase spread over one "window" of `limit` successful calls
+                self.limit = min(self.max_limit, self.limit + self.increase / self.limit)
+            self._cond.notify_all()
+
+class ProviderLimiter:
+    """
+    Client-side limits for one provider: requests/minute and tokens/minute buckets,
+    an AIMD concurrency limit, and retries with jittered exponential backoff
+    on throttling, 5xx and timeout errors.
+    """
+    def __init__(self, provider: str, max_concurrency: int = 8, rpm: float = None, tpm: float = None,
+                 max_retries: int = 5, base_delay_s: float = 1.0, max_delay_s: float = 60.0):
+        self.provider = provider
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+        self.aimd = AIMDLimiter(max_concurrency)
+        self.max_retries = max_retries
+        self.base_delay_s = base_delay_s
+        self.max_delay_s = max_delay_s
+
+    def _backoff(self, attempt: int) -> float:
+        # "full jitter": uniform in [0, base * 2^attempt], capped
+        return random.uniform(0, min(self.max_delay_s, self.base_delay_s * (2 ** attempt)))
+
+    def call(self, fn, prompt: str) -> str:
+        for attempt in range(self.max_retries + 1):
+            if self.requests:
+                self.requests.take(1)
+            if self.tokens:
+                self.tokens.take(estimate_tokens(prompt))
+            self.aimd.acquire()
+            try:
+                out = fn(prompt)
+            except Exception as e:
+                throttled = is_throttle(e)
+                self.aimd.release(throttled=throttled)
+                if throttled:
+                    callstats.incr("throttled")
+                if not is_retryable(e) or attempt == self.max_retries:
+                    raise
+                callstats.incr("retries")
+                delay = _retry_after(e)
+                time.sleep(delay if delay is not None else self._backoff(attempt))
+                continue
+            self.aimd.release()
+            return out
+
+def limited_infer(infer, limiter: ProviderLimiter):
+    """Wrap an `infer(prompt) -> str` callable so every call goes through the provider limiter."""
+    def wrapped(prompt: str) -> str:
+        return limiter.call(infer, prompt)
+    return wrapped
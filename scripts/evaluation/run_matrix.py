@@ -0,0 +1,164 @@
+import numpy as np
+import pandas as pd
+
+from utils import load_dataset, metrics_from_counts, METRIC_KEYS, COUNT_KEYS
+from columnar import predictions_store, read_store
+
+# Predictions of many runs on the same items as one items x runs boolean matrix plus a
+# validity mask (False where a run has no usable prediction for the item). Every statistic
+# is computed with array operations over chunks of items, so memory stays bounded for
+# millions of items and the run x run products go through BLAS even for thousands of runs.
+
+class RunMatrix:
+    """
+    values / valid: (items, runs) bool arrays aligned with `idx` and `gold`.
+    With packed=True both are kept bit-packed along the runs axis (8x smaller) and
+    unpacked one chunk of items at a time.
+    """
+    def __init__(self, idx, gold, runs: list, values, valid, packed: bool = False):
+        self.idx = np.asarray(idx)
+        self.gold = np.asarray(gold, dtype=bool)
+        self.runs = list(runs)
+        self.packed = packed
+        if packed:
+            self.values = np.packbits(values, axis=1)
+            self.valid = np.packbits(valid, axis=1)
+        else:
+            self.values = np.asarray(values, dtype=bool)
+            self.valid = np.asarray(valid, dtype=bool)
+
+    @property
+    def n_items(self) -> int:
+        return len(self.idx)
+
+    @property
+    def n_runs(self) -> int:
+        return len(self.runs)
+
+    @staticmethod
+    def load_gold(dataset_path: str):
+        """(idx, gold) of the dataset, sorted by idx -- the item order of every RunMatrix."""
+        gold_df = load_dataset(dataset_path, columns=["idx", "label"])
+        order = np.argsort(gold_df["idx"].to_numpy(), kind="stable")
+        return gold_df["idx"].to_numpy()[order], gold_df["label"].to_numpy(dtype=bool)[order]
+
+    @staticmethod
+    def align_run(idx: np.ndarray, path: str):
+        """(values, valid) of one predictions CSV on the items `idx` (sorted)."""
+        values = np.zeros(len(idx), dtype=bool)
+        valid = np.zeros(len(idx), dtype=bool)
+        # straight from the columnar store: pred is already a bool array plus validity mask
+        cols = read_store(predictions_store(path), ["idx", "pred"])
+        run_idx = np.asarray(cols["idx"]).astype(idx.dtype)
+        ok = cols.get("pred.valid", np.ones(len(run_idx), dtype=bool)).copy()
+        # predictions for items outside the dataset are dropped, missing items stay invalid
+        pos = np.minimum(np.searchsorted(idx, run_idx), len(idx) - 1)
+        ok &= idx[pos] == run_idx
+        values[pos[ok]] = cols["pred"][ok]
+        valid[pos[ok]] = True
+        return values, valid
+
+    @classmethod
+    def from_files(cls, dataset_path: str, runs: dict, packed: bool = False):
+        """`runs` maps run name -> predictions CSV; items are the dataset's, in idx order."""
+        idx, gold = cls.load_gold(dataset_path)
+        values = np.zeros((len(idx), len(runs)), dtype=bool)
+        valid = np.zeros((len(idx), len(runs)), dtype=bool)
+        for j, path in enumerate(runs.values()):
+            values[:, j], valid[:, j] = cls.align_run(idx, path)
+        return cls(idx, gold, list(runs), values, valid, packed=packed)
+
+    def chunks(self, size: int = 65536):
+        """Yield (slice, values, valid) over blocks of items, unpacked if needed."""
+        for start in range(0, self.n_items, size):
+            sl = slice(start, min(start + size, self.n_items))
+            if self.packed:
+                yield (sl,
+                       np.unpackbits(self.values[sl], axis=1, count=self.n_runs).astype(bool),
+                       np.unpackbits(self.valid[sl], axis=1, count=self.n_runs).astype(bool))
+            else:
+                yield sl, self.values[sl], self.valid[sl]
+
+    def dense(self):
+        """(values, valid) as plain (items, runs) bool arrays, unpacked if needed."""
+        if self.packed:
+            return (np.unpackbits(self.values, axis=1, count=self.n_runs).astype(bool),
+                    np.unpackbits(self.valid, axis=1, count=self.n_runs).astype(bool))
+        return self.values, self.valid
+
+    def item_stats(self, chunk: int = 65536) -> dict:
+        """
+        Per item: number of runs with a prediction, majority vote (ties -> True, None when no
+        run answered), majority size, runs disagreeing with the majority and runs wrong vs gold
+        (NaN when no run answered).
+        """
+        total = np.zeros(self.n_items, dtype=np.int64)
+        n_true = np.zeros(self.n_items, dtype=np.int64)
+        wrong = np.zeros(self.n_items, dtype=np.int64)
+        for sl, vals, valid in self.chunks(chunk):
+            total[sl] = valid.sum(axis=1)
+            n_true[sl] = (vals & valid).sum(axis=1)
+            wrong[sl] = ((vals != self.gold[sl, None]) & valid).sum(axis=1)
+        n_false = total - n_true
+        majority_size = np.maximum(n_true, n_false)
+        return {
+            "total_models": total,
+            "majority_vote": n_true >= n_false,
+            "has_vote": total > 0,
+            "majority_size": majority_size,
+            "disagree_among_models": total - majority_size,
+            "num_incorrect_vs_gold": np.where(total > 0, wrong, np.nan),
+        }
+
+    def pair_counts(self, chunk: int = 65536) -> dict:
+        """
+        run x run counts over items both runs answered: both True (tt), first True / second
+        False (tf), first False / second True (ft) and both False (ff). Only T'T needs a full
+        matrix product when every run answered every item of a chunk; otherwise T'V and V'V
+        (T = answered True, V = answered) are needed too.
+        """
+        r = self.n_runs
+        tt = np.zeros((r, r), dtype=np.int64)
+        t_any = np.zeros((r, r), dtype=np.int64)  # first True, second answered
+        shared = np.zeros((r, r), dtype=np.int64)
+        for _, vals, valid in self.chunks(chunk):
+            # float32 products are exact for counts below 2**24, far above any chunk size
+            t = (vals & valid).astype(np.float32)
+            tt += np.rint(t.T @ t).astype(np.int64)
+            if valid.all():
+                t_any += t.sum(axis=0).astype(np.int64)[:, None]
+                shared += len(valid)
+            else:
+                v = valid.astype(np.float32)
+                t_any += np.rint(t.T @ v).astype(np.int64)
+                shared += np.rint(v.T @ v).astype(np.int64)
+        tf = t_any - tt
+        ft = tf.T
+        return {"tt": tt, "tf": tf, "ft": ft, "ff": shared - tt - tf - ft}
+
+    def pairwise(self, chunk: int = 65536) -> dict:
+        """run x run agreement rate and Cohen's kappa (NaN when two runs share no items / kappa is undefined)."""
+        c = self.pair_counts(chunk)
+        n = (c["tt"] + c["tf"] + c["ft"] + c["ff"]).astype(float)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            po = (c["tt"] + c["ff"]) / n
+            # chance agreement from each run's marginals on the shared items
+            pe = ((c["tt"] + c["tf"]) * (c["tt"] + c["ft"]) + (c["ff"] + c["ft"]) * (c["ff"] + c["tf"])) / (n * n)
+            kappa = (po - pe) / (1 - pe)
+        return {"shared_items": n.astype(np.int64), "agreement": po, "kappa": kappa}
+
+    def run_stats(self, chunk: int = 65536) -> pd.DataFrame:
+        """Per run vs gold, on the items it answered: every compute_metrics metric."""
+        tp = np.zeros(self.n_runs, dtype=np.int64)
+        tn = np.zeros(self.n_runs, dtype=np.int64)
+        fp = np.zeros(self.n_runs, dtype=np.int64)
+        fn = np.zeros(self.n_runs, dtype=np.int64)
+        for sl, vals, valid in self.chunks(chunk):
+            g = self.gold[sl, None]
+            tp += (vals & g & valid).sum(axis=0)
+            tn += (~vals & ~g & valid).sum(axis=0)
+            fp += (vals & ~g & valid).sum(axis=0)
+            fn += (~vals & g & valid).sum(axis=0)
+        met = metrics_from_counts(tp, tn, fp, fn)
+        return pd.DataFrame({"run": self.runs, "items": tp + tn + fp + fn,
+                             **{k: met[k] for k in METRIC_KEYS + COUNT_KEYS}})
@@ -1,6 +1,7 @@
 import os
 import time
 import argparse
+from functools import partial
 import pandas as pd
 
 # loading environment variables
@@ -10,39 +11,411 @@ try:
 except Exception:
     pass
 
-from prompts import PROMPTS
-from utils import load_jsonl, parse_bool, compute_metrics
+import callstats
+from prompts import PROMPTS, PACKED_PROMPTS
+from utils import (
+    load_dataset, parse_bool, compute_metrics,
+    PREDICTION_COLUMNS, PredictionWriter, read_partial_predictions,
+    latency_percentiles, model_label, compare_with_reference, uncached_rows,
+)
+from packing import render_packed, parse_packed, widen_output_budget
+from engine import run_ordered
+from cascade import Cascade, cascade_summary
+from sequential import SequentialMonitor, stratified_order, reference_correct
+from hedge import HedgePolicy, hedged_infer, logged_p95
+from cache import CACHE_MODES, ResponseCache, cached_infer
+from metrics_store import METRICS_LOG, append_metrics_row
+from ratelimit import ProviderLimiter, limited_infer
 from models.openai_model import OpenAIChat
 from models.gemini_model import GeminiChat
 from models.llama_model import OllamaChat
 
-def append_metrics_row(xlsx_path: str, row: dict):
+def build_client(provider: str, model: str = None, concurrency: int = 1, stream: bool = False,
+                 logprobs: bool = False, base_url: str = None, **hf_options):
     """
-    Append a single metrics row to an Excel file (creates it if missing).
-    Columns are inferred from the dict keys; future rows should reuse same keys.
+    Create the client for a provider and return (model_name, client).
+    `concurrency` sizes the HTTP connection pool and `stream` enables
+    early-stopping streamed replies (Ollama only); `logprobs` asks OpenAI for the
+    answer token's top logprobs (for cascade margins); `base_url` points OpenAI at
+    another compatible endpoint and Ollama at another /api/chat URL;
+    `hf_options` go to HFScorer.
     """
-    df_row = pd.DataFrame([row])
-    if os.path.exists(xlsx_path):
-        try:
-            old = pd.read_excel(xlsx_path)
-            out = pd.concat([old, df_row], ignore_index=True)
-        except Exception:
-            out = df_row
+    if provider == "openai":
+        model = model or "gpt-4o"
+        client = OpenAIChat(model=model, logprobs=logprobs, base_url=base_url)
+    elif provider == "gemini":
+        model = model or "gemini-1.5-pro"
+        client = GeminiChat(model=model)
+    elif provider == "hf":
+        # torch / transformers are only imported when the local backend is used
+        from models.hf_model import HFScorer
+        model = model or "Qwen/Qwen2-0.5B-Instruct"
+        client = HFScorer(model=model, **hf_options)
     else:
-        out = df_row
-    out.to_excel(xlsx_path, index=False)
+        model = model or "llama3"
+        client = OllamaChat(model=model, stream=stream, pool_size=concurrency,
+                            **({"url": base_url} if base_url else {}))
+    return model, client
+
+def parses_as_bool(text: str) -> bool:
+    try:
+        parse_bool(text)
+        return True
+    except Exception:
+        return False
+
+def evaluate_row(infer, template: str, row: dict) -> dict:
+    """
+    Render the prompt for one WiC item, call the model and parse its answer.
+    Each stage is timed separately; `latency_s` only covers the inference call
+    itself, so it stays a true per-item latency when several items are in flight.
+    """
+    s1, s2, w = row["sentence1"], row["sentence2"], row["word"]
+    gold = bool(row["label"])
+
+    t0 = time.perf_counter()
+    prompt = template.format(sentence1=s1, sentence2=s2, target_word=w)
+    render_s = time.perf_counter() - t0
+
+    stats = callstats.begin()
+    t0 = time.perf_counter()
+    raw = infer(prompt)
+    dt = time.perf_counter() - t0
+    ttft = stats.get("ttft_s")
+
+    t0 = time.perf_counter()
+    parse_ok = True
+    try:
+        pred = parse_bool(raw)
+    except Exception:
+        pred = False  # fallback
+        parse_ok = False
+        print("the word: ", row["idx"], row["word"])
+        print("The message which could not parsed: ", raw)
+    parse_s = time.perf_counter() - t0
+
+    return {
+        "idx": int(row["idx"]),
+        "word": w,
+        "sentence1": s1,
+        "sentence2": s2,
+        "gold": bool(gold),
+        "pred": bool(pred),
+        "raw_output": raw,
+        "latency_s": round(dt, 6),
+        "ttft_s": round(ttft, 6) if ttft is not None else None,
+        "render_s": round(render_s, 6),
+        "parse_s": round(parse_s, 6),
+        "retries": stats.get("retries", 0),
+        "hedged": stats.get("hedged", 0),
+        "cached": bool(stats.get("cached", False)),
+        # not written to the CSV; read by the cascade to decide on escalation
+        "parse_ok": parse_ok,
+        "margin": stats.get("margin"),
+    }
+
+def evaluate_pack(packed_infer, infer, packed_templates, template: str, rows: list) -> list:
+    """
+    Ask for all `rows` in one packed request and map the numbered answers back to idx.
+    Items whose answer can't be found in the reply are re-asked one at a time with
+    the ordinary single-item prompt (`packed` is False on those rows).
+    """
+    packed_template, item_template = packed_templates
+
+    t0 = time.perf_counter()
+    prompt = render_packed(packed_template, item_template, rows)
+    render_s = time.perf_counter() - t0
+
+    stats = callstats.begin()
+    t0 = time.perf_counter()
+    raw = packed_infer(prompt)
+    dt = time.perf_counter() - t0
+    ttft = stats.get("ttft_s")
+
+    t0 = time.perf_counter()
+    answers = parse_packed(raw, len(rows))
+    parse_s = time.perf_counter() - t0
+
+    out = []
+    for n, row in enumerate(rows, start=1):
+        if n not in answers:
+            single = evaluate_row(infer, template, row)
+            single.update({"pack_size": len(rows), "packed": False})
+            out.append(single)
+            continue
+        out.append({
+            "idx": int(row["idx"]),
+            "word": row["word"],
+            "sentence1": row["sentence1"],
+            "sentence2": row["sentence2"],
+            "gold": bool(row["label"]),
+            "pred": answers[n],
+            "raw_output": raw,
+            # every item of the pack waited for the whole request
+            "latency_s": round(dt, 6),
+            "ttft_s": round(ttft, 6) if ttft is not None else None,
+            "render_s": round(render_s / len(rows), 6),
+            "parse_s": round(parse_s / len(rows), 6),
+            "retries": stats.get("retries", 0),
+            "cached": bool(stats.get("cached", False)),
+            "pack_size": len(rows),
+            "packed": True,
+        })
+    return out
+
+def evaluate_scored(scorer, template: str, rows: list) -> list:
+    """
+    Score a chunk of items with a local logit scorer (HFScorer) in length-bucketed batches.
+    Batching means there is no single-item latency, so `latency_s` is the chunk time
+    divided evenly over its items.
+    """
+    t0 = time.perf_counter()
+    prompts = [template.format(sentence1=r["sentence1"], sentence2=r["sentence2"], target_word=r["word"])
+               for r in rows]
+    render_s = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    probs = scorer.score_batch(prompts)
+    dt = time.perf_counter() - t0
+
+    out = []
+    for row, p in zip(rows, probs):
+        out.append({
+            "idx": int(row["idx"]),
+            "word": row["word"],
+            "sentence1": row["sentence1"],
+            "sentence2": row["sentence2"],
+            "gold": bool(row["label"]),
+            "pred": p >= scorer.threshold,
+            "raw_output": f"P(True)={p:.6f}",
+            "latency_s": round(dt / len(rows), 6),
+            "render_s": round(render_s / len(rows), 6),
+            "parse_s": 0.0,
+            "retries": 0,
+            "prob_true": round(p, 6),
+        })
+    return out
+
+def load_records(path: str, limit: int = None) -> list:
+    """Load the WiC JSONL as a list of plain dicts (cheaper than iterrows() Series for worker threads)."""
+    df = load_dataset(path)
+    if limit:
+        df = df.head(limit).copy()
+    records = df.to_dict(orient="records")
+    for pos, rec in zip(df.index, records):
+        rec.setdefault("idx", pos)
+    return records
+
+def run_evaluation(records, infer, template: str, csv_output_path: str,
+                   concurrency: int = 1, flush_every: int = 20, resume: bool = False,
+                   executor=None, pack_size: int = 1, packed_infer=None, packed_templates=None,
+                   scorer=None, cascade=None, monitor=None):
+    """
+    Evaluate `records`, streaming predictions to `csv_output_path` as they complete.
+    With `resume`, idx values already in the CSV are skipped. With `pack_size` > 1,
+    items are sent `pack_size` at a time through `packed_infer` (see evaluate_pack).
+    With a `scorer` (local HFScorer), chunks of items are scored in batches instead.
+    With a `cascade`, `infer` is the cheap tier and uncertain items go on to the strong one.
+    A `monitor` (sequential.SequentialMonitor) sees every finished row, resumed ones
+    included, and ends the run early once it says so; items still in flight are dropped.
+    Returns the merged per-item results read back from the file and a dict with the
+    wall time, items evaluated, model requests made and time spent writing.
+    """
+    if resume:
+        done = read_partial_predictions(csv_output_path)
+        done_idx = set(done["idx"].tolist())
+        records = [rec for rec in records if int(rec["idx"]) not in done_idx]
+        print(f"Resuming: {len(done_idx)} items already in {csv_output_path}, {len(records)} left")
+        # rewriting drops any torn row left by the crash (and aligns older
+        # files to the current columns) before we append to it
+        done = done.reindex(columns=PREDICTION_COLUMNS)
+        done.to_csv(csv_output_path, index=False, encoding="utf-8")
+        if monitor is not None:
+            for row in done[["idx", "gold", "pred"]].to_dict(orient="records"):
+                monitor.update(row)
+
+    if scorer is not None:
+        # a few batches per chunk give the length bucketing something to sort
+        chunk = scorer.batch_size * 8
+        work = [records[i:i + chunk] for i in range(0, len(records), chunk)]
+        fn = partial(evaluate_scored, scorer, template)
+    elif cascade is not None:
+        work = records
+        fn = partial(cascade.evaluate, evaluate_row, infer, template)
+    elif pack_size > 1:
+        work = [records[i:i + pack_size] for i in range(0, len(records), pack_size)]
+        fn = partial(evaluate_pack, packed_infer, infer, packed_templates, template)
+    else:
+        work = records
+        fn = partial(evaluate_row, infer, template)
+
+    evaluated = requests = cached = 0
+    wall_t0 = time.perf_counter()
+    stopped = monitor is not None and monitor.stop_reason is not None
+    with PredictionWriter(csv_output_path, batch_size=flush_every, append=resume) as writer:
+        results = run_ordered(fn, work if not stopped else [], concurrency=concurrency, executor=executor)
+        for result in results:
+            rows = result if isinstance(result, list) else [result]
+            if scorer is not None:
+                requests += -(-len(rows) // scorer.batch_size)  # forward passes
+            elif cascade is not None:
+                requests += sum(r["cascade_calls"] for r in rows)
+            else:
+                # one packed request plus one single call per item it failed to answer
+                requests += 1 + sum(1 for r in rows if r.get("packed") is False)
+            for out in rows:
+                out["correct"] = out["gold"] == out["pred"]
+                writer.write(out)
+                evaluated += 1
+                cached += bool(out.get("cached"))
+                if monitor is not None:
+                    stopped = monitor.update(out) or stopped
+            if stopped:
+                # closing the generator cancels everything not yet started
+                results.close()
+                break
+    wall_s = time.perf_counter() - wall_t0
+    run_info = {"wall_time_s": wall_s, "evaluated": evaluated, "cached": cached, "requests": requests,
+                "write_s": writer.write_s}
+
+    # metrics are computed over everything in the file, including resumed rows
+    results_df = read_partial_predictions(csv_output_path)
+    if not results_df["idx"].is_monotonic_increasing:
+        results_df = results_df.sort_values("idx").reset_index(drop=True)
+        results_df.to_csv(csv_output_path, index=False, encoding="utf-8")
+    return results_df, run_info
+
+def timing_summary(results_df: pd.DataFrame, run_info: dict) -> dict:
+    """
+    Latency/TTFT percentiles, per-stage totals, retries and throughput for the metrics row.
+    Latency and throughput leave out items answered from the response cache.
+    """
+    live = uncached_rows(results_df)
+
+    def col(name, df=results_df):
+        return df[name] if name in df else pd.Series(dtype=float)
+
+    out = {}
+    for key, val in latency_percentiles(col("latency_s", live)).items():
+        out[f"latency_{key}_s"] = val
+    for key, val in latency_percentiles(col("ttft_s", live)).items():
+        out[f"ttft_{key}_s"] = val
+    out["render_total_s"] = float(col("render_s").fillna(0).sum())
+    out["parse_total_s"] = float(col("parse_s").fillna(0).sum())
+    out["write_total_s"] = run_info["write_s"]
+    out["retries"] = int(col("retries").fillna(0).sum())
+    out["requests"] = run_info.get("requests", run_info["evaluated"])
+    out["wall_time_s"] = run_info["wall_time_s"]
+    # throughput only counts what this invocation sent to the model, not resumed rows or cache hits
+    out["cached_items"] = run_info.get("cached", 0)
+    out["throughput_items_s"] = ((run_info["evaluated"] - out["cached_items"]) / run_info["wall_time_s"]
+                                 if run_info["wall_time_s"] > 0 else 0.0)
+    return out
+
+def build_metrics_row(provider: str, model: str, mode: str, lang: str,
+                      results_df: pd.DataFrame, run_info: dict = None, **extra) -> dict:
+    """
+    One metrics-log row for a finished run. Timing columns are added when
+    `run_info` (from run_evaluation) is given; `extra` columns go at the end.
+    """
+    met = compute_metrics(results_df["gold"].tolist(), results_df["pred"].tolist())
+    # cache hits answer in about a millisecond; averaging them in would understate latency
+    live = uncached_rows(results_df)
+    times = live["latency_s"].astype(float).tolist()
+    avg_latency = sum(times) / len(times) if times else 0.0
+    ttfts = live["ttft_s"].dropna().astype(float) if "ttft_s" in live else []
+    avg_ttft = float(sum(ttfts) / len(ttfts)) if len(ttfts) else None
+
+    row = {
+        "provider": provider,
+        "model": model,
+        "prompt_mode": mode,
+        "language": lang,
+        "items": len(results_df),
+        "accuracy": met["accuracy"],
+        "f1": met["f1"],
+        "cohens_kappa": met["cohens_kappa"],
+        "macro_f1": met["macro_f1"],
+        "weighted_f1": met["weighted_f1"],
+        "precision": met["precision"],
+        "recall": met["recall"],
+        "tp": met["tp"], "tn": met["tn"], "fp": met["fp"], "fn": met["fn"],
+        "avg_latency_s": avg_latency,
+        "avg_ttft_s": avg_ttft,
+    }
+    if run_info is not None:
+        row.update(timing_summary(results_df, run_info))
+    row.update(extra)
+    return row
+
+def print_report(row: dict):
+    print("\n=== WiC Evaluation ===")
+    print(f"Provider: {row['provider']} | Model: {row['model']}")
+    print(f"Prompt mode: {row['prompt_mode']} | Language: {row['language']}")
+    print(f"Items: {row['items']}")
+    print(f"Accuracy:       {row['accuracy']:.4f}")
+    print(f"Cohen's κ:      {row['cohens_kappa']:.4f}")
+    print(f"Macro F1:       {row['macro_f1']:.4f}   Weighted F1: {row['weighted_f1']:.4f}")
+    print(f"P: {row['precision']:.4f}  R: {row['recall']:.4f}  F1: {row['f1']:.4f}")
+    print(f"TP={row['tp']}  TN={row['tn']}  FP={row['fp']}  FN={row['fn']}")
+    print(f"Avg latency:    {row['avg_latency_s']:.3f}s")
+    if row.get("latency_p50_s") is not None:
+        print("Latency (s):    p50={latency_p50_s:.3f}  p90={latency_p90_s:.3f}  p95={latency_p95_s:.3f}"
+              "  p99={latency_p99_s:.3f}  max={latency_max_s:.3f}".format(**row))
+    if row.get("ttft_p50_s") is not None:
+        print("TTFT (s):       p50={ttft_p50_s:.3f}  p95={ttft_p95_s:.3f}  p99={ttft_p99_s:.3f}".format(**row))
+    if "render_total_s" in row:
+        print(f"Stage totals:   render={row['render_total_s']:.3f}s  parse={row['parse_total_s']:.3f}s"
+              f"  write={row['write_total_s']:.3f}s  | retries={row['retries']}")
+    print(f"Wall time:      {row['wall_time_s']:.1f}s  (concurrency={row['concurrency']})"
+          f"  | throughput={row.get('throughput_items_s', 0.0):.2f} items/s")
+    if row.get("cached_items"):
+        print(f"Cache:          {row['cached_items']} items served from cache (left out of latency / throughput)")
+    if row.get("pack_size", 1) > 1:
+        print(f"Packed:         K={row['pack_size']}  requests={row['requests']}"
+              f"  answered in pack={row['packed_answered']}  single-item fallbacks={row['pack_fallbacks']}")
+    if "seq_stop_reason" in row:
+        fmt = lambda v: "n/a" if v is None else f"{v:.4f}"
+        print(f"Sequential:     {row['seq_items']} items, stopped by {row['seq_stop_reason']}"
+              f"  (stratified over pos x label{'' if row['seq_strata_covered'] else ', not all strata seen'})")
+        print(f"  accuracy:     {fmt(row['strat_accuracy'])} [{fmt(row['strat_accuracy_ci_low'])}, {fmt(row['strat_accuracy_ci_high'])}]"
+              f"   kappa: {fmt(row['strat_kappa'])} [{fmt(row['strat_kappa_ci_low'])}, {fmt(row['strat_kappa_ci_high'])}]")
+        if row["strat_diff_vs_reference"] is not None:
+            print(f"  vs reference: {row['strat_diff_vs_reference']:+.4f}"
+                  f" [{row['strat_diff_ci_low']:+.4f}, {row['strat_diff_ci_high']:+.4f}]")
+    if row.get("reference_items"):
+        print(f"vs {row['reference_file']} on {row['reference_items']} shared items:"
+              f"  accuracy {row['accuracy_on_shared']:.4f} (this run) vs {row['reference_accuracy']:.4f} (reference)")
+    if row.get("cascade_model"):
+        fmt = lambda v: "n/a" if v is None else f"{v:.4f}"
+        print(f"Cascade:        -> {row['cascade_model']}  tier1 {row['tier1_share']:.1%} / tier2 {row['tier2_share']:.1%}"
+              f"  strong calls={row['strong_calls']} ({fmt(row['strong_call_reduction'])}x fewer than a full pass)"
+              f"  (unparsed={row['escalated_unparsed']} margin={row['escalated_margin']} variants={row['escalated_variants']})")
+        print(f"  accuracy:     cheap on all={fmt(row['tier1_accuracy_all'])}  kept={fmt(row['tier1_accuracy_kept'])}"
+              f"  escalated: cheap={fmt(row['tier1_accuracy_escalated'])} strong={fmt(row['tier2_accuracy_escalated'])}")
+        print(f"  latency (s):  cheap tier={fmt(row['cheap_latency_mean_s'])}"
+              f"  settled by tier1={fmt(row['tier1_latency_mean_s'])} (p95 {fmt(row['tier1_latency_p95_s'])})"
+              f"  tier2={fmt(row['tier2_latency_mean_s'])} (p95 {fmt(row['tier2_latency_p95_s'])})")
+    if "hedges" in row:
+        thr = row["hedge_threshold_s"]
+        print(f"Hedging:        {row['hedges']} duplicates for {row['hedge_calls']} calls"
+              f" (budget {row['hedge_budget']:.0%}), {row['hedge_wins']} won,"
+              f" saved ~{row['hedge_saved_s']:.1f}s  | threshold {'n/a' if thr is None else f'{thr:.2f}s'}")
+    if "throttled" in row:
+        print(f"Throttled:      {row['throttled']} calls  (AIMD limit at end: {row['concurrency_limit_final']:.1f})")
+    print(f"Cache ({row['cache_mode']}): {row['cache_hits']} hits / {row['cache_misses']} misses")
 
 def main():
     base_dir = os.path.dirname(os.path.abspath(__file__))
-    metrics_results_path = "../../results_evaluation/metrics_log.xlsx"
 
     ap = argparse.ArgumentParser()
     ap.add_argument("--data", default="../../processed_data/final_dataset_lastE.jsonl",
                     help="Path to WiC JSONL.")
     ap.add_argument("--provider", required=True,
-                    choices=["openai", "gemini", "ollama"])
+                    choices=["openai", "gemini", "ollama", "hf"])
     ap.add_argument("--model", default=None,
-                    help="openai(gpt-4o), gemini(gemini-1.5-pro|gemini-1.5-flash), ollama(llama3 or your quant).")
+                    help="openai(gpt-4o), gemini(gemini-1.5-pro|gemini-1.5-flash), ollama(llama3 or your quant), "
+                         "hf(any causal LM on the Hub or a local path).")
     ap.add_argument("--mode", choices=["zero","few"], default="few",
                     help="Prompt mode.")
     ap.add_argument("--lang", choices=["kk","en"], default="kk",
@@ -50,111 +423,223 @@ def main():
     ap.add_argument("--limit", type=int, default=None,
                     help="Evaluate first N items only.")
     ap.add_argument("--outfile", default="predictions.csv",
-                    help="CSV path to save predictions.")
-    ap.add_argument("--metrics_xlsx", default=metrics_results_path,
-                    help="Excel file to append one row of metrics for this run.")
+                    help="CSV file name to save predictions under results_evaluation/csv_results.")
+    ap.add_argument("--output-path", default=None,
+                    help="Full CSV path to save predictions to instead (e.g. for load tests); overrides --outfile.")
+    ap.add_argument("--metrics_log", default=METRICS_LOG,
+                    help="JSONL metrics log to append one row for this run (export views with metrics_store.py).")
+    ap.add_argument("--concurrency", type=int, default=1,
+                    help="Number of inference requests kept in flight at once.")
+    ap.add_argument("--cache-mode", choices=CACHE_MODES, default="readwrite",
+                    help="Response cache: off, read (hits only), readwrite, refresh (re-query and overwrite).")
+    ap.add_argument("--cache-path", default="../../results_evaluation/cache/responses.sqlite",
+                    help="SQLite file holding cached model responses.")
+    ap.add_argument("--cache-max-entries", type=int, default=200_000,
+                    help="Least recently used responses are evicted beyond this many entries.")
+    ap.add_argument("--rpm", type=float, default=None,
+                    help="Client-side requests-per-minute limit for the provider.")
+    ap.add_argument("--tpm", type=float, default=None,
+                    help="Client-side tokens-per-minute limit (prompt tokens are estimated).")
+    ap.add_argument("--max-retries", type=int, default=5,
+                    help="Retries with jittered backoff on 429/5xx/timeouts before giving up on an item.")
+    ap.add_argument("--pack", type=int, default=1,
+                    help="Put this many items into one request (numbered pairs); 1 = one item per request.")
+    ap.add_argument("--reference", default=None,
+                    help="Predictions CSV to report accuracy against on shared items. With --pack > 1 it "
+                         "defaults to the unpacked predictions_<model>_<mode>_<lang>.csv if present, with "
+                         "--cascade-model to the cascade model's one.")
+    ap.add_argument("--base-url", default=None,
+                    help="openai: OpenAI-compatible API base URL (e.g. http://127.0.0.1:8000/v1); "
+                         "ollama: chat endpoint URL (e.g. http://127.0.0.1:8000/api/chat).")
+    ap.add_argument("--batch-size", type=int, default=8,
+                    help="hf: prompts per forward pass.")
+    ap.add_argument("--quantize", action="store_true",
+                    help="hf: dynamic int8 quantization of the Linear layers.")
+    ap.add_argument("--threshold", type=float, default=0.5,
+                    help="hf: predict True when P(True) is at least this.")
+    ap.add_argument("--stream", action="store_true",
+                    help="Ollama: stream the reply and stop as soon as True/False is decided.")
+    ap.add_argument("--cascade-model", default=None,
+                    help="Escalate uncertain items to this stronger model (--model / --provider is the cheap tier).")
+    ap.add_argument("--cascade-provider", default=None,
+                    choices=["openai", "gemini", "ollama", "hf"],
+                    help="Provider of --cascade-model (default: --provider).")
+    ap.add_argument("--escalate-margin", type=float, default=0.0,
+                    help="Cascade: escalate when |P(True) - P(False)| of the cheap answer is below this "
+                         "(OpenAI logprobs / hf scores; 0 = off).")
+    ap.add_argument("--cascade-variants", action="store_true",
+                    help="Cascade: also ask the cheap model with the other-language prompt and escalate on disagreement.")
+    ap.add_argument("--sequential", action="store_true",
+                    help="Visit items in a pos x label stratified random order and stop once the accuracy CI "
+                         "is narrower than --ci-width (or the run is clearly worse than --reference).")
+    ap.add_argument("--ci-width", type=float, default=0.05,
+                    help="Sequential: stop when the stratified accuracy CI is narrower than this.")
+    ap.add_argument("--alpha", type=float, default=0.05,
+                    help="Sequential: CIs are at the 1 - alpha level.")
+    ap.add_argument("--min-items", type=int, default=40,
+                    help="Sequential: never stop before this many items.")
+    ap.add_argument("--seed", type=int, default=0,
+                    help="Sequential: seed of the stratified item order.")
+    ap.add_argument("--hedge", action="store_true",
+                    help="Send a duplicate request when a call outlasts the provider/model's p95 latency; first valid answer wins. "
+                         "With --stream on Ollama the losing request is cancelled; with non-streaming clients it is "
+                         "dropped, not cancelled (it runs to the end and its answer is ignored).")
+    ap.add_argument("--hedge-budget", type=float, default=0.05,
+                    help="Hedge: at most this fraction of calls get a duplicate.")
+    ap.add_argument("--hedge-quantile", type=float, default=0.95,
+                    help="Hedge: latency quantile (of recent calls) after which a duplicate is sent.")
+    ap.add_argument("--hedge-after", type=float, default=None,
+                    help="Hedge: fixed threshold in seconds instead of the learned quantile.")
+    ap.add_argument("--flush-every", type=int, default=20,
+                    help="Append predictions to the CSV in batches of this many rows.")
+    ap.add_argument("--resume", action="store_true",
+                    help="Keep the rows already in the output CSV and only evaluate the missing idx values.")
     args = ap.parse_args()
 
     # picking model based on provider
-    if args.provider == "openai":
-        model = args.model or "gpt-4o"
-        infer = OpenAIChat(model=model).infer
-    elif args.provider == "gemini":
-        model = args.model or "gemini-1.5-pro"
-        infer = GeminiChat(model=model).infer
-    else:
-        model = args.model or "llama3"
-        infer = OllamaChat(model=model).infer
+    hf_options = {}
+    if args.provider == "hf":
+        hf_options = {"batch_size": args.batch_size, "quantize": args.quantize, "threshold": args.threshold}
+    if args.cascade_model and args.pack > 1:
+        ap.error("--cascade-model works per item; it cannot be combined with --pack")
+    if args.provider == "hf" and args.pack > 1:
+        ap.error("--provider hf scores items in batches (--batch-size); it cannot be combined with --pack")
+    model, client = build_client(args.provider, args.model,
+                                 concurrency=args.concurrency, stream=args.stream, base_url=args.base_url,
+                                 logprobs=bool(args.cascade_model) and args.escalate_margin > 0, **hf_options)
+    # the local scorer is batched directly; caching and rate limits are for remote calls
+    # (a cascade asks the cheap tier item by item, so it goes through client.infer)
+    scorer = client if args.provider == "hf" and not args.cascade_model else None
 
-    # data
-    df = load_jsonl(args.data)
-    if args.limit:
-        df = df.head(args.limit).copy()
+    cache = None
+    if args.cache_mode != "off":
+        cache = ResponseCache(args.cache_path, max_entries=args.cache_max_entries)
+    # the limiter sits inside the cache so cache hits don't use up the rate budget;
+    # --concurrency is the ceiling that AIMD backs off from when the provider throttles
+    limiter = ProviderLimiter(client.provider, max_concurrency=args.concurrency,
+                              rpm=args.rpm, tpm=args.tpm, max_retries=args.max_retries)
+    # hedges sit inside the cache (hits are never hedged) and outside the limiter (duplicates use the rate budget)
+    hedge_policies = []
 
-    template = PROMPTS[(args.mode, args.lang)]
+    def hedge(fn, provider, model_name, valid=None):
+        if not args.hedge:
+            return fn
+        policy = HedgePolicy(budget=args.hedge_budget, quantile=args.hedge_quantile, fixed_s=args.hedge_after,
+                             initial_s=logged_p95(args.metrics_log, provider, model_name),
+                             max_workers=2 * args.concurrency + 2)
+        hedge_policies.append(policy)
+        return hedged_infer(fn, policy, valid=valid)
 
-    detailed_rows = []
-    preds, golds, times = [], [], []
-
-    for _, row in df.iterrows():
-        s1, s2, w = row["sentence1"], row["sentence2"], row["word"]
-        gold = bool(row["label"])
-        idx_val = row.get("idx", _)
-
-        prompt = template.format(sentence1=s1, sentence2=s2, target_word=w)
-
-        t0 = time.perf_counter()
-        raw = infer(prompt)
-        dt = time.perf_counter() - t0
-
-        try:
-            pred = parse_bool(raw)
-        except Exception:
-            pred = False  # fallback
-            print("the word: ", row["idx"], row["word"])
-            print("The message which could not parsed: ", raw)
-
-        preds.append(pred)
-        golds.append(gold)
-        times.append(dt)
-
-        detailed_rows.append({
-            "idx": int(idx_val),
-            "word": w,
-            "sentence1": s1,
-            "sentence2": s2,
-            "gold": bool(gold),
-            "pred": bool(pred),
-            "raw_output": raw,
-            "latency_s": round(dt, 6),
-        })
+    infer = limited_infer(client.infer, limiter)
+    infer = hedge(infer, args.provider, model, valid=parses_as_bool)
+    infer = cached_infer(infer, cache, client.provider, model, client.options, args.cache_mode,
+                         valid=parses_as_bool)
 
-    # Save per-item predictions BEFORE metrics
-    results_df = pd.DataFrame(detailed_rows)
-    results_df["correct"] = results_df["gold"] == results_df["pred"]
+    packed_infer = None
+    if args.pack > 1:
+        packed_client = widen_output_budget(client, args.pack)
+        packed_infer = limited_infer(packed_client.infer, limiter)
+        packed_infer = hedge(packed_infer, args.provider, model)
+        packed_infer = cached_infer(packed_infer, cache, client.provider, model,
+                                    packed_client.options, args.cache_mode,
+                                    valid=lambda text: bool(parse_packed(text, args.pack)))
 
-    # CSV (predictions)
-    csv_output_path = "../../results_evaluation/csv_results/" + args.outfile
-    results_df.to_csv(csv_output_path, index=False, encoding="utf-8")
+    # data
+    if args.sequential:
+        # --limit caps the stratified order rather than taking the file's first N
+        population = load_records(args.data)
+        records = stratified_order(population, seed=args.seed)[:args.limit]
+        seq_reference = reference_correct(args.reference) if args.reference and os.path.exists(args.reference) else None
+        monitor = SequentialMonitor(population, ci_width=args.ci_width, alpha=args.alpha,
+                                    min_items=args.min_items, reference=seq_reference)
+    else:
+        records = load_records(args.data, args.limit)
+        monitor = None
+    template = PROMPTS[(args.mode, args.lang)]
+
+    cascade = None
+    if args.cascade_model:
+        strong_provider = args.cascade_provider or args.provider
+        strong_model, strong_client = build_client(
+            strong_provider, args.cascade_model, concurrency=args.concurrency,
+            base_url=args.base_url if strong_provider == args.provider else None, **hf_options)
+        # the strong tier gets its own rate budget when it is another provider
+        strong_limiter = limiter if strong_provider == args.provider else ProviderLimiter(
+            strong_client.provider, max_concurrency=args.concurrency, max_retries=args.max_retries)
+        strong_infer = limited_infer(strong_client.infer, strong_limiter)
+        strong_infer = hedge(strong_infer, strong_provider, strong_model, valid=parses_as_bool)
+        strong_infer = cached_infer(strong_infer, cache, strong_client.provider, strong_model,
+                                    strong_client.options, args.cache_mode, valid=parses_as_bool)
+        other_lang = "en" if args.lang == "kk" else "kk"
+        cascade = Cascade(strong_infer, margin=args.escalate_margin,
+                          variant_template=PROMPTS[(args.mode, other_lang)] if args.cascade_variants else None)
+
+    # CSV (predictions), streamed as items complete
+    csv_output_path = args.output_path or "../../results_evaluation/csv_results/" + args.outfile
+    results_df, run_info = run_evaluation(
+        records, infer, template, csv_output_path,
+        concurrency=args.concurrency, flush_every=args.flush_every, resume=args.resume,
+        pack_size=args.pack, packed_infer=packed_infer,
+        packed_templates=PACKED_PROMPTS[(args.mode, args.lang)],
+        scorer=scorer, cascade=cascade, monitor=monitor,
+    )
     print(f"Saved CSV predictions to: {csv_output_path}")
 
-    # Compute metrics
-    met = compute_metrics(golds, preds)
-    avg_latency = sum(times) / len(times) if times else 0.0
+    cache_stats = dict(getattr(infer, "stats", {"hits": 0, "misses": 0}))
+    for key, val in getattr(packed_infer, "stats", {}).items():
+        cache_stats[key] += val
+    if cascade is not None:
+        for key, val in getattr(cascade.strong_infer, "stats", {}).items():
+            cache_stats[key] += val
+
+    run_extras = {}
+    if args.pack > 1:
+        this_run = results_df[results_df["pack_size"].notna()]
+        run_extras = {
+            "pack_size": args.pack,
+            "packed_answered": int((this_run["packed"].astype(str) == "True").sum()),
+            "pack_fallbacks": int((this_run["packed"].astype(str) == "False").sum()),
+        }
+    if cascade is not None:
+        run_extras = {"cascade_model": strong_model, "escalate_margin": args.escalate_margin,
+                      "cascade_variants": args.cascade_variants, **cascade_summary(results_df)}
+    if monitor is not None:
+        run_extras.update(monitor.summary())
+    if hedge_policies:
+        for policy in hedge_policies:
+            for key, val in policy.stats().items():
+                run_extras[key] = run_extras.get(key, 0) + val
+            policy.shutdown()
+        run_extras["hedge_budget"] = args.hedge_budget
+        run_extras["hedge_threshold_s"] = hedge_policies[0].threshold()
+    reference = args.reference
+    if reference is None and args.pack > 1:
+        reference = f"../../results_evaluation/csv_results/predictions_{model_label(model)}_{args.mode}_{args.lang}.csv"
+    elif reference is None and cascade is not None:
+        # the strong model's own full pass, if there is one: the quality the cascade is after
+        reference = f"../../results_evaluation/csv_results/predictions_{model_label(strong_model)}_{args.mode}_{args.lang}.csv"
+    if reference and os.path.exists(reference) and os.path.abspath(reference) != os.path.abspath(csv_output_path):
+        run_extras.update(compare_with_reference(results_df, reference))
+    if cache:
+        cache.close()
 
     # Prepare metrics row to append
-    metrics_row = {
-        "provider": args.provider,
-        "model": model,
-        "prompt_mode": args.mode,
-        "language": args.lang,
-        "items": len(df),
-        "accuracy": met["accuracy"],
-        "f1": met["f1"],
-        "cohens_kappa": met["cohens_kappa"],
-        "macro_f1": met["macro_f1"],
-        "weighted_f1": met["weighted_f1"],
-        "precision": met["precision"],
-        "recall": met["recall"],
-        "tp": met["tp"], "tn": met["tn"], "fp": met["fp"], "fn": met["fn"],
-        "avg_latency_s": avg_latency,
-    }
+    metrics_row = build_metrics_row(
+        args.provider, model, args.mode, args.lang, results_df, run_info,
+        concurrency=args.concurrency,
+        cache_mode=args.cache_mode,
+        cache_hits=cache_stats["hits"],
+        cache_misses=cache_stats["misses"],
+        throttled=limiter.aimd.throttled,
+        concurrency_limit_final=limiter.aimd.limit,
+        **run_extras,
+    )
 
-    append_metrics_row(args.metrics_xlsx, metrics_row)
-    print(f"Appended metrics to: {args.metrics_xlsx}")
+    append_metrics_row(args.metrics_log, metrics_row)
+    print(f"Appended metrics to: {args.metrics_log}")
 
     # Console report
-    print("\n=== WiC Evaluation ===")
-    print(f"Provider: {args.provider} | Model: {model}")
-    print(f"Prompt mode: {args.mode} | Language: {args.lang}")
-    print(f"Items: {len(df)}")
-    print(f"Accuracy:       {met['accuracy']:.4f}")
-    print(f"Cohen's κ:      {met['cohens_kappa']:.4f}")
-    print(f"Macro F1:       {met['macro_f1']:.4f}   Weighted F1: {met['weighted_f1']:.4f}")
-    print(f"P: {met['precision']:.4f}  R: {met['recall']:.4f}  F1: {met['f1']:.4f}")
-    print(f"TP={met['tp']}  TN={met['tn']}  FP={met['fp']}  FN={met['fn']}")
-    print(f"Avg latency:    {avg_latency:.3f}s")
+    print_report(metrics_row)
 
 if __name__ == "__main__":
     main()
-
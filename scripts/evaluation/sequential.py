@@ -0,0 +1,183 @@
+import random
+from statistics import NormalDist
+import numpy as np
+
+from utils import read_partial_predictions
+
+# Sequential, stratified evaluation for screening runs: items are visited in an order
+# where every prefix is a proportional stratified sample (strata = pos x label), the
+# stratified estimates of accuracy / kappa are updated as results come in, and the run
+# stops once the accuracy CI is narrow enough, or once it is clearly worse than a
+# reference run on the same items (paired difference CI entirely below 0).
+# Estimates weight each stratum by its share of the whole dataset, so they stay
+# unbiased even when a short prefix over- or under-samples a small stratum.
+
+STRATA_KEYS = ("pos", "label")
+
+def stratum_of(rec: dict, keys=STRATA_KEYS) -> tuple:
+    return tuple(str(rec.get(k)) for k in keys)
+
+def stratified_order(records: list, keys=STRATA_KEYS, seed: int = 0) -> list:
+    """
+    `records` reordered so that any prefix holds each stratum in proportion to its size:
+    items are shuffled within their stratum and the k-th of n_h items is placed at
+    (k + u_h) / n_h on a common [0, 1) axis (systematic sampling with a random offset u_h).
+    """
+    rng = random.Random(seed)
+    groups = {}
+    for rec in records:
+        groups.setdefault(stratum_of(rec, keys), []).append(rec)
+    keyed = []
+    for s in sorted(groups):
+        members = groups[s]
+        rng.shuffle(members)
+        u = rng.random()
+        keyed.extend(((k + u) / len(members), rng.random(), rec) for k, rec in enumerate(members))
+    keyed.sort(key=lambda t: (t[0], t[1]))
+    return [rec for _, _, rec in keyed]
+
+class SequentialMonitor:
+    """
+    Stratified running estimates over the rows of a run, with a stopping rule.
+    `population`: all dataset records (for the stratum weights N_h / N);
+    `reference`: optional {idx: correct} of a reference run for the paired comparison.
+    """
+    def __init__(self, population: list, ci_width: float = 0.05, alpha: float = 0.05,
+                 min_items: int = 40, check_every: int = 20, reference: dict = None,
+                 keys=STRATA_KEYS, verbose: bool = True):
+        self.keys = keys
+        self.stratum = {int(rec["idx"]): stratum_of(rec, keys) for rec in population}
+        self.strata = sorted(set(self.stratum.values()))
+        pos = {s: i for i, s in enumerate(self.strata)}
+        self.code = {idx: pos[s] for idx, s in self.stratum.items()}
+        sizes = np.bincount(list(self.code.values()), minlength=len(self.strata)).astype(float)
+        self.N_h = sizes
+        self.W_h = sizes / sizes.sum()
+        self.ci_width = ci_width
+        self.alpha = alpha
+        self.z = NormalDist().inv_cdf(1 - alpha / 2)
+        self.min_items = min_items
+        self.check_every = max(1, check_every)
+        self.reference = reference or {}
+        self.verbose = verbose
+
+        h = len(self.strata)
+        self.cells = np.zeros((h, 4), dtype=np.int64)  # tp, tn, fp, fn per stratum
+        self.d_n = np.zeros(h)  # paired items (reference has them too)
+        self.d_sum = np.zeros(h)
+        self.d_sq = np.zeros(h)
+        self.n = 0
+        self.stop_reason = None
+
+    def update(self, row: dict) -> bool:
+        """Add one finished row; True once the run should stop."""
+        h = self.code.get(int(row["idx"]))
+        if h is None:
+            return False
+        gold, pred = bool(row["gold"]), bool(row["pred"])
+        self.cells[h, (0 if pred else 3) if gold else (2 if pred else 1)] += 1
+        ref = self.reference.get(int(row["idx"]))
+        if ref is not None:
+            d = float(gold == pred) - float(ref)
+            self.d_n[h] += 1
+            self.d_sum[h] += d
+            self.d_sq[h] += d * d
+        self.n += 1
+        if self.stop_reason is None and self.n % self.check_every == 0:
+            self._check()
+        return self.stop_reason is not None
+
+    def _fpc(self, n_h, seen):
+        # finite population correction: a stratum seen in full has no sampling error left
+        return np.clip(1 - n_h / self.N_h[seen], 0.0, 1.0)
+
+    def accuracy(self) -> tuple:
+        """(estimate, ci_low, ci_high, all strata covered) of the stratified accuracy."""
+        n_h = self.cells.sum(axis=1).astype(float)
+        seen = n_h > 0
+        if not seen.any():
+            return None, None, None, False
+        w = self.W_h[seen] / self.W_h[seen].sum()
+        x_h = (self.cells[:, 0] + self.cells[:, 1])[seen]
+        p = x_h / n_h[seen]
+        # (x + 1) / (n + 2) keeps a stratum with few, all-correct items from claiming zero variance
+        p_var = (x_h + 1) / (n_h[seen] + 2)
+        var = np.sum(w ** 2 * p_var * (1 - p_var) / n_h[seen] * self._fpc(n_h[seen], seen))
+        est = float(np.sum(w * p))
+        half = self.z * float(np.sqrt(var))
+        return est, max(0.0, est - half), min(1.0, est + half), bool(seen.all())
+
+    def paired_difference(self) -> tuple:
+        """(estimate, ci_low, ci_high) of this run's accuracy minus the reference's, stratified."""
+        seen = self.d_n > 0
+        if not seen.any():
+            return None, None, None
+        m = self.d_n[seen]
+        w = self.W_h[seen] / self.W_h[seen].sum()
+        mean = self.d_sum[seen] / m
+        var_h = np.where(m > 1, (self.d_sq[seen] - m * mean ** 2) / np.maximum(m - 1, 1), 1.0)
+        var = np.sum(w ** 2 * var_h / m * self._fpc(m, seen))
+        est = float(np.sum(w * mean))
+        half = self.z * float(np.sqrt(var))
+        return est, est - half, est + half
+
+    def kappa(self, n_boot: int = 1000, seed: int = 0) -> tuple:
+        """(estimate, ci_low, ci_high) of the stratified Cohen's kappa; CI from a stratified multinomial bootstrap."""
+        n_h = self.cells.sum(axis=1)
+        seen = n_h > 0
+        if not seen.any():
+            return None, None, None
+        w = self.W_h[seen] / self.W_h[seen].sum()
+        cells = self.cells[seen]
+
+        def kappa_of(props):
+            # props: (..., 4) population proportions of tp, tn, fp, fn
+            tp, tn, fp, fn = np.moveaxis(props, -1, 0)
+            po = tp + tn
+            pe = (tp + fp) * (tp + fn) + (tn + fn) * (tn + fp)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                return (po - pe) / (1 - pe)
+
+        props = cells / n_h[seen][:, None]
+        est = float(kappa_of((w[:, None] * props).sum(axis=0)))
+        rng = np.random.default_rng(seed)
+        boot = np.zeros((n_boot, 4))
+        for k, (n, p) in enumerate(zip(n_h[seen], props)):
+            boot += w[k] * rng.multinomial(n, p, size=n_boot) / n
+        with np.errstate(invalid="ignore"):
+            lo, hi = np.nanpercentile(kappa_of(boot), [100 * self.alpha / 2, 100 * (1 - self.alpha / 2)])
+        return est, float(lo), float(hi)
+
+    def _check(self):
+        acc, lo, hi, covered = self.accuracy()
+        diff = self.paired_difference()
+        if self.verbose:
+            line = f"[sequential] n={self.n}  accuracy={acc:.4f} [{lo:.4f}, {hi:.4f}]"
+            if diff[0] is not None:
+                line += f"  vs reference {diff[0]:+.4f} [{diff[1]:+.4f}, {diff[2]:+.4f}]"
+            print(line)
+        if self.n < self.min_items or not covered:
+            return
+        if hi - lo < self.ci_width:
+            self.stop_reason = "ci_width"
+        elif diff[2] is not None and diff[2] < 0:
+            self.stop_reason = "worse_than_reference"
+
+    def summary(self) -> dict:
+        """Stratified estimates and the stopping outcome, for the metrics row."""
+        acc, lo, hi, covered = self.accuracy()
+        kappa, k_lo, k_hi = self.kappa()
+        diff, d_lo, d_hi = self.paired_difference()
+        return {
+            "seq_items": self.n,
+            "seq_stop_reason": self.stop_reason or "exhausted",
+            "seq_strata_covered": covered,
+            "strat_accuracy": acc, "strat_accuracy_ci_low": lo, "strat_accuracy_ci_high": hi,
+            "strat_kappa": kappa, "strat_kappa_ci_low": k_lo, "strat_kappa_ci_high": k_hi,
+            "strat_diff_vs_reference": diff, "strat_diff_ci_low": d_lo, "strat_diff_ci_high": d_hi,
+        }
+
+def reference_correct(path: str) -> dict:
+    """{idx: correct} of a predictions CSV, for the paired stopping rule."""
+    ref = read_partial_predictions(path)
+    return dict(zip(ref["idx"].astype(int), ref["correct"].astype(bool)))
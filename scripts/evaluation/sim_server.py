@@ -0,0 +1,318 @@
+import re
+import json
+import time
+import math
+import random
+import hashlib
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# Local stand-in for the model providers, for load-testing runner.py without API costs
+# or a GPU. Speaks
+#   POST /api/chat              Ollama chat (plain or NDJSON-streamed)
+#   POST /v1/chat/completions   OpenAI-compatible chat completions (with logprobs)
+#   GET  /stats, POST /reset    request / error / latency counters
+# Answers are deterministic: the item is found in the dataset by its sentences and word,
+# and a hash of (model, item) decides whether the reply is the gold label (with
+# probability `accuracy`) or its negation. Packed prompts get one "<n>: True|False" line
+# per pair. Latency is lognormal with an optional heavy tail; 429s (with Retry-After)
+# and 5xx errors are injected at fixed rates, and `slots` bounds how many requests are
+# served at once (the rest queue, as on a single Ollama instance).
+
+ITEM_RE = re.compile(
+    r"(?:(?:Pair|Жұп)\s+(?P<n>\d+):\s*\n)?"
+    r"(?:Sentence|Сөйлем) 1:[ \t]*(?P<s1>.*?)[ \t]*\n"
+    r"(?:Sentence|Сөйлем) 2:[ \t]*(?P<s2>.*?)[ \t]*\n"
+    r"(?:Word|Сөз):[ \t]*(?P<w>.*?)[ \t]*(?:\n|$)",
+    flags=re.UNICODE,
+)
+# few-shot prompts end their examples with this; only what follows is the question
+TASK_RE = re.compile(r"Now your task:|Енді сенің тапсырмаң:")
+
+def load_gold(path: str) -> dict:
+    """(sentence1, sentence2, word) -> label of every dataset item."""
+    gold = {}
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                r = json.loads(line)
+                gold[(r["sentence1"].strip(), r["sentence2"].strip(), r["word"].strip())] = bool(r["label"])
+    return gold
+
+def _unit(*parts) -> float:
+    """Deterministic uniform [0, 1) from the given strings."""
+    h = hashlib.sha1("\x1f".join(parts).encode("utf-8")).digest()
+    return int.from_bytes(h[:8], "big") / 2 ** 64
+
+class SimConfig:
+    def __init__(self, accuracy: float = 0.8, latency_median_s: float = 0.3, latency_sigma: float = 0.5,
+                 tail_p: float = 0.0, tail_s: float = 10.0, rate_429: float = 0.0, rate_5xx: float = 0.0,
+                 retry_after_s: float = 0.5, garble_rate: float = 0.0, slots: int = 0,
+                 token_delay_s: float = 0.02, seed: int = 0):
+        self.accuracy = accuracy
+        self.latency_median_s = latency_median_s
+        self.latency_sigma = latency_sigma
+        self.tail_p = tail_p
+        self.tail_s = tail_s
+        self.rate_429 = rate_429
+        self.rate_5xx = rate_5xx
+        self.retry_after_s = retry_after_s
+        self.garble_rate = garble_rate
+        self.slots = slots
+        self.token_delay_s = token_delay_s
+        self.seed = seed
+
+class SimState:
+    """Everything the handler threads share: gold labels, config, RNG and counters."""
+    def __init__(self, gold: dict, config: SimConfig):
+        self.gold = gold
+        self.config = config
+        self.rng = random.Random(config.seed)
+        self.slots = threading.BoundedSemaphore(config.slots) if config.slots > 0 else None
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.counts = {"requests": 0, "ok": 0, "injected_429": 0, "injected_5xx": 0,
+                           "unknown_items": 0, "garbled": 0, "disconnected": 0, "in_flight_max": 0}
+            self.in_flight = 0
+            self.latencies = []
+
+    def incr(self, key: str, n: int = 1):
+        with self._lock:
+            self.counts[key] += n
+
+    def draw(self):
+        """(error kind or None, latency in seconds, garble?) for one request."""
+        c = self.config
+        with self._lock:
+            r = self.rng.random()
+            lat = c.latency_median_s * math.exp(c.latency_sigma * self.rng.gauss(0, 1))
+            if self.rng.random() < c.tail_p:
+                lat += c.tail_s
+            garble = self.rng.random() < c.garble_rate
+        if r < c.rate_429:
+            return "429", lat, garble
+        if r < c.rate_429 + c.rate_5xx:
+            return "5xx", lat, garble
+        return None, lat, garble
+
+    def enter(self):
+        with self._lock:
+            self.in_flight += 1
+            self.counts["in_flight_max"] = max(self.counts["in_flight_max"], self.in_flight)
+
+    def leave(self, latency_s: float = None):
+        with self._lock:
+            self.in_flight -= 1
+            if latency_s is not None:
+                self.latencies.append(latency_s)
+
+    def stats(self) -> dict:
+        with self._lock:
+            out = dict(self.counts)
+            lat = sorted(self.latencies)
+        for q in (50, 95, 99):
+            out[f"server_latency_p{q}_s"] = lat[min(len(lat) - 1, int(len(lat) * q / 100))] if lat else None
+        return out
+
+    def answer(self, model: str, prompt: str) -> tuple:
+        """(reply text, confidence of its first answer) for a single or packed prompt."""
+        tasks = list(TASK_RE.finditer(prompt))
+        if tasks:
+            prompt = prompt[tasks[-1].end():]
+        items = list(ITEM_RE.finditer(prompt))
+        if not items:
+            self.incr("unknown_items")
+            return "False", 0.5
+        numbered = [m for m in items if m.group("n")]
+
+        def one(m):
+            key = (m.group("s1"), m.group("s2"), m.group("w"))
+            gold = self.gold.get(key)
+            if gold is None:
+                self.incr("unknown_items")
+                gold = _unit("gold", *key) < 0.5
+            u = _unit(model, *key)
+            correct = u < self.config.accuracy
+            # confident when clearly right or clearly wrong, unsure near the accuracy cut
+            conf = 0.5 + 0.5 * min(1.0, abs(u - self.config.accuracy) * 4)
+            return (gold if correct else not gold), conf
+
+        if numbered:
+            lines, confs = [], []
+            for m in numbered:
+                val, conf = one(m)
+                lines.append(f"{m.group('n')}: {val}")
+                confs.append(conf)
+            return "\n".join(lines), confs[0]
+        # few-shot prompts without the task marker: the question is still the last item
+        val, conf = one(items[-1])
+        return str(val), conf
+
+class SimHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    state: SimState = None  # set on the subclass made by make_server
+
+    def log_message(self, fmt, *args):
+        pass
+
+    def _json(self, code: int, obj: dict, headers: dict = None):
+        body = json.dumps(obj, ensure_ascii=False).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.rstrip("/") == "/stats":
+            return self._json(200, self.state.stats())
+        self._json(404, {"error": "not found"})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        payload = json.loads(self.rfile.read(length) or b"{}")
+        if self.path.rstrip("/") == "/reset":
+            self.state.reset()
+            return self._json(200, {"ok": True})
+        if self.path.rstrip("/") == "/api/chat":
+            return self._serve(payload, self._ollama)
+        if self.path.rstrip("/") in ("/v1/chat/completions", "/chat/completions"):
+            return self._serve(payload, self._openai)
+        self._json(404, {"error": "not found"})
+
+    def _serve(self, payload: dict, reply):
+        st = self.state
+        st.incr("requests")
+        error, latency, garble = st.draw()
+        if st.slots:
+            st.slots.acquire()
+        t0 = time.perf_counter()
+        st.enter()
+        try:
+            if error == "429":
+                time.sleep(min(latency, 0.05))
+                st.incr("injected_429")
+                return self._json(429, {"error": {"message": "simulated rate limit", "type": "rate_limit"}},
+                                  {"Retry-After": str(st.config.retry_after_s)})
+            if error == "5xx":
+                time.sleep(latency)
+                st.incr("injected_5xx")
+                return self._json(503, {"error": {"message": "simulated overload", "type": "server_error"}})
+            prompt = "\n".join(str(m.get("content", "")) for m in payload.get("messages", []))
+            text, conf = st.answer(str(payload.get("model", "")), prompt)
+            if garble:
+                st.incr("garbled")
+                text = "I am not sure about this one."
+            reply(payload, text, conf, latency)
+            st.incr("ok")
+        except (BrokenPipeError, ConnectionResetError):
+            # the client hung up early (streaming early stop, hedge cancel, timeout)
+            st.incr("disconnected")
+        finally:
+            st.leave(time.perf_counter() - t0)
+            if st.slots:
+                st.slots.release()
+
+    def _ollama(self, payload: dict, text: str, conf: float, latency: float):
+        model = payload.get("model", "")
+        if not payload.get("stream"):
+            time.sleep(latency)
+            return self._json(200, {"model": model, "message": {"role": "assistant", "content": text},
+                                    "done": True})
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        # latency is time to first token; the reply then comes a few characters at a time
+        time.sleep(latency)
+        pieces = [text[i:i + 3] for i in range(0, len(text), 3)] or [""]
+        for k, piece in enumerate(pieces):
+            if k:
+                time.sleep(self.state.config.token_delay_s)
+            self._chunk({"model": model, "message": {"role": "assistant", "content": piece}, "done": False})
+        self._chunk({"model": model, "message": {"role": "assistant", "content": ""}, "done": True})
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _chunk(self, obj: dict):
+        data = (json.dumps(obj, ensure_ascii=False) + "\n").encode("utf-8")
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def _openai(self, payload: dict, text: str, conf: float, latency: float):
+        time.sleep(latency)
+        logprobs = None
+        if payload.get("logprobs"):
+            first = text.split(":")[-1].strip().split()[0] if text.strip() else ""
+            other = "False" if first == "True" else "True"
+            top = [{"token": first, "logprob": math.log(conf), "bytes": None},
+                   {"token": other, "logprob": math.log(max(1e-9, 1 - conf)), "bytes": None}]
+            logprobs = {"content": [{"token": first, "logprob": math.log(conf), "bytes": None,
+                                     "top_logprobs": top[:max(1, int(payload.get("top_logprobs") or 1))]}]}
+        prompt_tokens = sum(len(str(m.get("content", ""))) // 3 for m in payload.get("messages", []))
+        self._json(200, {
+            "id": "chatcmpl-sim", "object": "chat.completion", "created": int(time.time()),
+            "model": payload.get("model", ""),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": text},
+                         "logprobs": logprobs, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": 1, "total_tokens": prompt_tokens + 1},
+        })
+
+def make_server(gold: dict, config: SimConfig, host: str = "127.0.0.1", port: int = 0) -> ThreadingHTTPServer:
+    """A server bound to host:port (0 = any free port); call serve_forever() or use serve_in_thread."""
+    handler = type("BoundSimHandler", (SimHandler,), {"state": SimState(gold, config)})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+def serve_in_thread(server: ThreadingHTTPServer) -> threading.Thread:
+    t = threading.Thread(target=server.serve_forever, daemon=True)
+    t.start()
+    return t
+
+def add_config_args(ap: argparse.ArgumentParser):
+    ap.add_argument("--accuracy", type=float, default=0.8, help="Share of items answered with the gold label.")
+    ap.add_argument("--latency-median", type=float, default=0.3, help="Median latency (s) of the lognormal.")
+    ap.add_argument("--latency-sigma", type=float, default=0.5, help="Sigma of log-latency.")
+    ap.add_argument("--tail-p", type=float, default=0.0, help="Share of requests that hang for --tail-s more.")
+    ap.add_argument("--tail-s", type=float, default=10.0)
+    ap.add_argument("--rate-429", type=float, default=0.0, help="Share of requests answered with 429.")
+    ap.add_argument("--rate-5xx", type=float, default=0.0, help="Share of requests answered with 503.")
+    ap.add_argument("--retry-after", type=float, default=0.5, help="Retry-After (s) sent with 429s.")
+    ap.add_argument("--garble-rate", type=float, default=0.0, help="Share of replies that are not True/False.")
+    ap.add_argument("--slots", type=int, default=0, help="Requests served at once (0 = unbounded); others queue.")
+    ap.add_argument("--token-delay", type=float, default=0.02, help="Delay (s) between streamed chunks.")
+    ap.add_argument("--sim-seed", type=int, default=0)
+
+def config_from_args(args) -> SimConfig:
+    return SimConfig(accuracy=args.accuracy, latency_median_s=args.latency_median, latency_sigma=args.latency_sigma,
+                     tail_p=args.tail_p, tail_s=args.tail_s, rate_429=args.rate_429, rate_5xx=args.rate_5xx,
+                     retry_after_s=args.retry_after, garble_rate=args.garble_rate, slots=args.slots,
+                     token_delay_s=args.token_delay, seed=args.sim_seed)
+
+def main():
+    ap = argparse.ArgumentParser(description="Simulated Ollama / OpenAI-compatible server for load tests.")
+    ap.add_argument("--data", default="../../processed_data/final_dataset_lastE.jsonl")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8000)
+    add_config_args(ap)
+    args = ap.parse_args()
+
+    server = make_server(load_gold(args.data), config_from_args(args), args.host, args.port)
+    host, port = server.server_address[:2]
+    print(f"Simulated provider on http://{host}:{port}  (ollama: /api/chat, openai: /v1)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+import os
+import json
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# loading environment variables
+try:
+    from dotenv import load_dotenv
+    load_dotenv()
+except Exception:
+    pass
+
+import callstats
+from prompts import PROMPTS
+from utils import model_label
+from cache import CACHE_MODES, ResponseCache, cached_infer
+from metrics_store import METRICS_LOG, append_metrics_row
+from ratelimit import ProviderLimiter, limited_infer
+from runner import (
+    build_client, build_metrics_row,
+    load_records, parses_as_bool, print_report, run_evaluation,
+)
+
+# Example grid spec (JSON):
+# {
+#   "providers": {
+#     "openai": {"models": ["gpt-4o", "gpt-3.5-turbo"], "concurrency": 8, "rpm": 500, "tpm": 30000},
+#     "gemini": {"models": ["gemini-1.5-pro", "gemini-1.5-flash"], "concurrency": 4},
+#     "ollama": {"models": ["llama3"], "concurrency": 1, "stream": true}
+#   },
+#   (a provider entry may also set "base_url", e.g. to run against sim_server.py)
+#   "modes": ["zero", "few"],
+#   "langs": ["kk", "en"],
+#   "labels": {"gpt-4o": "gpt4o"}
+# }
+
+def expand_grid(spec: dict) -> list:
+    """List every (provider, model, mode, lang) cell of a grid spec."""
+    modes = spec.get("modes", ["zero", "few"])
+    langs = spec.get("langs", ["kk", "en"])
+    cells = []
+    for provider, conf in spec["providers"].items():
+        for model in conf["models"]:
+            for mode in modes:
+                for lang in langs:
+                    cells.append((provider, model, mode, lang))
+    return cells
+
+def main():
+    ap = argparse.ArgumentParser(description="Run a provider x model x mode x language grid in one process.")
+    ap.add_argument("--grid", required=True,
+                    help="JSON grid spec (see the example at the top of sweep.py).")
+    ap.add_argument("--data", default="../../processed_data/final_dataset_lastE.jsonl",
+                    help="Path to WiC JSONL.")
+    ap.add_argument("--limit", type=int, default=None,
+                    help="Evaluate first N items only.")
+    ap.add_argument("--csv_dir", default="../../results_evaluation/csv_results",
+                    help="Folder for predictions_<model>_<mode>_<lang>.csv files.")
+    ap.add_argument("--metrics_log", default=METRICS_LOG,
+                    help="JSONL metrics log to append one row per cell.")
+    ap.add_argument("--cache-mode", choices=CACHE_MODES, default="readwrite")
+    ap.add_argument("--cache-path", default="../../results_evaluation/cache/responses.sqlite")
+    ap.add_argument("--cache-max-entries", type=int, default=200_000)
+    ap.add_argument("--flush-every", type=int, default=20)
+    ap.add_argument("--max-retries", type=int, default=5)
+    ap.add_argument("--resume", action="store_true",
+                    help="Resume every cell from its partial CSV.")
+    args = ap.parse_args()
+
+    with open(args.grid, "r", encoding="utf-8") as f:
+        spec = json.load(f)
+    labels = spec.get("labels", {})
+    cells = expand_grid(spec)
+
+    # dataset and clients are built once and shared by all cells
+    records = load_records(args.data, args.limit)
+    os.makedirs(args.csv_dir, exist_ok=True)
+    clients = {}
+    for provider, model, _, _ in cells:
+        if (provider, model) not in clients:
+            conf = spec["providers"][provider]
+            clients[(provider, model)] = build_client(
+                provider, model,
+                concurrency=max(1, conf.get("concurrency", 1)),
+                stream=conf.get("stream", False),
+                base_url=conf.get("base_url"),
+            )[1]
+
+    cache = None
+    if args.cache_mode != "off":
+        cache = ResponseCache(args.cache_path, max_entries=args.cache_max_entries)
+
+    # one pool per provider: its size is that provider's in-flight limit, and the
+    # pools run side by side so every provider is kept busy at the same time
+    pools = {
+        provider: ThreadPoolExecutor(max_workers=max(1, conf.get("concurrency", 1)),
+                                     thread_name_prefix=provider)
+        for provider, conf in spec["providers"].items()
+    }
+    # rate limits and AIMD state are per provider, shared by all of its cells
+    limiters = {
+        provider: ProviderLimiter(provider, max_concurrency=max(1, conf.get("concurrency", 1)),
+                                  rpm=conf.get("rpm"), tpm=conf.get("tpm"),
+                                  max_retries=args.max_retries)
+        for provider, conf in spec["providers"].items()
+    }
+    report_lock = threading.Lock()
+
+    def run_cell(cell):
+        provider, model, mode, lang = cell
+        client = clients[(provider, model)]
+        concurrency = max(1, spec["providers"][provider].get("concurrency", 1))
+        limited = limited_infer(client.infer, limiters[provider])
+        # the limiter's own counter is shared by every cell on the provider (and cells run
+        # at the same time), so this cell's 429s are summed from its calls' callstats
+        throttled = [0]
+        throttled_lock = threading.Lock()
+
+        def infer(prompt: str) -> str:
+            try:
+                return limited(prompt)
+            finally:
+                n = callstats.current().get("throttled", 0)
+                if n:
+                    with throttled_lock:
+                        throttled[0] += n
+
+        infer = cached_infer(infer, cache, client.provider, model, client.options, args.cache_mode,
+                             valid=parses_as_bool)
+        outfile = f"predictions_{model_label(model, labels)}_{mode}_{lang}.csv"
+        csv_output_path = f"{args.csv_dir}/{outfile}"
+
+        results_df, run_info = run_evaluation(
+            records, infer, PROMPTS[(mode, lang)], csv_output_path,
+            concurrency=concurrency, flush_every=args.flush_every,
+            resume=args.resume, executor=pools[provider],
+        )
+        cache_stats = getattr(infer, "stats", {"hits": 0, "misses": 0})
+        metrics_row = build_metrics_row(
+            provider, model, mode, lang, results_df, run_info,
+            concurrency=concurrency,
+            cache_mode=args.cache_mode,
+            cache_hits=cache_stats["hits"],
+            cache_misses=cache_stats["misses"],
+            throttled=throttled[0],
+            concurrency_limit_final=limiters[provider].aimd.limit,
+        )
+        append_metrics_row(args.metrics_log, metrics_row)
+        # keeps the console reports of cells finishing together from interleaving
+        with report_lock:
+            print(f"Saved CSV predictions to: {csv_output_path}")
+            print_report(metrics_row)
+        return metrics_row
+
+    try:
+        # cell drivers only wait on the provider pools, so one thread per cell is cheap
+        with ThreadPoolExecutor(max_workers=len(cells)) as drivers:
+            futures = [drivers.submit(run_cell, cell) for cell in cells]
+            for fut in futures:
+                fut.result()
+    finally:
+        for pool in pools.values():
+            pool.shutdown(wait=True)
+        if cache:
+            cache.close()
+
+    print(f"\nFinished {len(cells)} cells; metrics appended to: {args.metrics_log}")
+
+if __name__ == "__main__":
+    main()
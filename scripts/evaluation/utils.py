@@ -1,4 +1,8 @@
+import io
+import os
+import csv
 import json
+import time
 import numpy as np
 import pandas as pd
 from sklearn.metrics import (
@@ -8,6 +12,8 @@ from sklearn.metrics import (
     recall_score,
 )
 
+from columnar import dataset_store, predictions_store, read_store, to_frame
+
 def load_jsonl(path: str) -> pd.DataFrame:
     rows = []
     with open(path, "r", encoding="utf-8") as f:
@@ -17,6 +23,159 @@ def load_jsonl(path: str) -> pd.DataFrame:
                 rows.append(json.loads(line))
     return pd.DataFrame(rows)
 
+def load_dataset(path: str, columns=None) -> pd.DataFrame:
+    """The WiC JSONL via its columnar copy (built or refreshed on first use)."""
+    return to_frame(read_store(dataset_store(path), columns))
+
+def load_predictions(path: str, columns=None) -> pd.DataFrame:
+    """A predictions_*.csv via its columnar copy; gold / pred / correct come back as bools (None if unparseable)."""
+    return to_frame(read_store(predictions_store(path), columns))
+
+# column order of csv_results/predictions_*.csv
+PREDICTION_COLUMNS = [
+    "idx", "word", "sentence1", "sentence2",
+    "gold", "pred", "raw_output", "latency_s", "correct",
+    "ttft_s", "render_s", "parse_s", "retries",
+    "pack_size", "packed", "prob_true",
+    "tier", "tier1_pred", "tier1_latency_s", "cascade_reason",
+    "hedged", "cached",
+]
+
+PERCENTILES = (50, 90, 95, 99)
+
+class PredictionWriter:
+    """
+    Streams prediction rows to a CSV, writing them in batches of `batch_size`
+    and syncing each batch to disk so an interrupted run keeps what it finished.
+    """
+    def __init__(self, path: str, columns=PREDICTION_COLUMNS, batch_size: int = 20, append: bool = False):
+        has_rows = append and os.path.exists(path) and os.path.getsize(path) > 0
+        self.path = path
+        self.batch_size = max(1, batch_size)
+        self._f = open(path, "a" if append else "w", newline="", encoding="utf-8")
+        self._writer = csv.DictWriter(self._f, fieldnames=columns, extrasaction="ignore")
+        if not has_rows:
+            self._writer.writeheader()
+        self._buffer = []
+        self.write_s = 0.0  # total time spent writing and syncing batches
+
+    def write(self, row: dict):
+        self._buffer.append(row)
+        if len(self._buffer) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        t0 = time.perf_counter()
+        if self._buffer:
+            self._writer.writerows(self._buffer)
+            self._buffer = []
+        self._f.flush()
+        os.fsync(self._f.fileno())
+        self.write_s += time.perf_counter() - t0
+
+    def close(self):
+        self.flush()
+        self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def _csv_bool(x):
+    if isinstance(x, (bool, np.bool_)):
+        return bool(x)
+    s = str(x).strip().lower()
+    if s in {"true", "1"}:
+        return True
+    if s in {"false", "0"}:
+        return False
+    return None
+
+def _complete_records(text: str) -> str:
+    """
+    `text` up to the end of its last complete CSV record. A crash mid-write can leave
+    the last row cut off anywhere, including inside a quoted (multi-line) field.
+    """
+    lines = text.splitlines(keepends=True)
+    consumed = 0
+
+    def feed():
+        nonlocal consumed
+        for line in lines:
+            consumed += 1
+            yield line
+
+    ends = []
+    try:
+        for _ in csv.reader(feed(), strict=True):
+            ends.append(consumed)
+    except csv.Error:
+        pass  # unterminated quote at the end: the record it opened is not in `ends`
+    if ends and ends[-1] == len(lines) and not text.endswith(("\n", "\r")):
+        ends.pop()  # every row the writer finishes ends in a newline
+    return "".join(lines[:ends[-1]]) if ends else ""
+
+def read_partial_predictions(path: str) -> pd.DataFrame:
+    """
+    Read a predictions CSV that may have been cut off mid-run.
+    Incomplete trailing rows are dropped and duplicated idx values keep their last row.
+    """
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return pd.DataFrame(columns=PREDICTION_COLUMNS)
+    # a cut can also split a multi-byte character; it is in the torn last row either way
+    with open(path, "r", newline="", encoding="utf-8", errors="replace") as f:
+        text = _complete_records(f.read())
+    if not text:
+        return pd.DataFrame(columns=PREDICTION_COLUMNS)
+    df = pd.read_csv(io.StringIO(text), on_bad_lines="skip", encoding="utf-8")
+    df["gold"] = df["gold"].map(_csv_bool)
+    df["pred"] = df["pred"].map(_csv_bool)
+    df = df.dropna(subset=["idx", "gold", "pred"])
+    df["idx"] = df["idx"].astype(int)
+    df["gold"] = df["gold"].astype(bool)
+    df["pred"] = df["pred"].astype(bool)
+    df["correct"] = df["gold"] == df["pred"]
+    return df.drop_duplicates(subset="idx", keep="last").reset_index(drop=True)
+
+def uncached_rows(df: pd.DataFrame) -> pd.DataFrame:
+    """Rows whose answer came from the model, not the response cache (their latency is a real one)."""
+    if "cached" not in df:
+        return df
+    return df[~df["cached"].map(_csv_bool).fillna(False).astype(bool)]
+
+def model_label(model: str, labels: dict = None) -> str:
+    """File-name label of a model, e.g. gemini-1.5-flash -> gemini1.5flash (as in csv_results)."""
+    if labels and model in labels:
+        return labels[model]
+    return model.replace("-", "").replace(":", "").replace("/", "_")
+
+def compare_with_reference(results_df: pd.DataFrame, reference_path: str) -> dict:
+    """
+    Accuracy of this run and of a reference predictions CSV on the idx values they share,
+    so e.g. packed and unpacked runs of the same model can be read side by side.
+    """
+    ref = read_partial_predictions(reference_path)
+    shared = results_df.merge(ref[["idx", "correct"]], on="idx", suffixes=("", "_ref"))
+    n = len(shared)
+    return {
+        "reference_file": os.path.basename(reference_path),
+        "reference_items": n,
+        "accuracy_on_shared": float(shared["correct"].mean()) if n else None,
+        "reference_accuracy": float(shared["correct_ref"].mean()) if n else None,
+    }
+
+def latency_percentiles(values) -> dict:
+    """p50/p90/p95/p99/max of a latency sample (None for an empty sample)."""
+    arr = np.asarray([v for v in values if v is not None and not pd.isna(v)], dtype=float)
+    keys = [f"p{q}" for q in PERCENTILES] + ["max"]
+    if arr.size == 0:
+        return {k: None for k in keys}
+    out = dict(zip(keys, (float(v) for v in np.percentile(arr, PERCENTILES))))
+    out["max"] = float(arr.max())
+    return out
+
 def parse_bool(text: str) -> bool:
     t = (text or "").strip().lower()
     if t == "true" or t.startswith("true"):
@@ -28,6 +187,78 @@ def parse_bool(text: str) -> bool:
 def _as_bool_array(x):
     return np.asarray(x, dtype=bool)
 
+METRIC_KEYS = ("accuracy", "cohens_kappa", "precision", "recall", "f1", "macro_f1", "weighted_f1")
+COUNT_KEYS = ("tp", "tn", "fp", "fn")
+
+def confusion_counts(y_true, y_pred):
+    """
+    (tp, tn, fp, fn) in one pass. y_pred may be (items,) or (runs, items) -- all runs or
+    bootstrap replicates at once; y_true is (items,) or the same shape as y_pred.
+    """
+    y_true = _as_bool_array(y_true)
+    y_pred = _as_bool_array(y_pred)
+    tp = (y_true & y_pred).sum(axis=-1)
+    fp = y_pred.sum(axis=-1) - tp
+    fn = y_true.sum(axis=-1) - tp
+    tn = y_pred.shape[-1] - tp - fp - fn
+    return tp, tn, fp, fn
+
+def _divide(num, den):
+    # zero_division=0, as passed to sklearn
+    num = np.asarray(num, dtype=float)
+    den = np.asarray(den, dtype=float)
+    return np.divide(num, den, out=np.zeros(np.broadcast(num, den).shape), where=den != 0)
+
+def metrics_from_counts(tp, tn, fp, fn) -> dict:
+    """
+    Every metric of compute_metrics from confusion counts (scalars or arrays), with the
+    same float operations sklearn performs, so results are bit-for-bit equal:
+      - precision / recall / f1 of the positive class, 0 on zero division;
+      - macro / weighted F1 averaged over the classes present in y_true or y_pred only;
+      - kappa = 1 - observed / expected disagreement, NaN when only one class is present.
+    """
+    tp, tn, fp, fn = (np.asarray(x, dtype=np.int64) for x in (tp, tn, fp, fn))
+    n = tp + tn + fp + fn
+    true_t, true_f = tp + fn, tn + fp
+    pred_t, pred_f = tp + fp, tn + fn
+
+    # per class: "positive" True uses tp, "positive" False uses tn
+    f1_t = _divide(2.0 * tp, true_t + pred_t.astype(float))
+    f1_f = _divide(2.0 * tn, true_f + pred_f.astype(float))
+    present_t = (true_t + pred_t) > 0
+    present_f = (true_f + pred_f) > 0
+    n_present = present_t.astype(int) + present_f
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        macro = (np.where(present_f, f1_f, 0.0) + np.where(present_t, f1_t, 0.0)) / n_present
+        weighted = (f1_f * true_f + f1_t * true_t) / (true_f + true_t).astype(float)
+        # chance disagreement: predicted False & truly True plus predicted True & truly False
+        expected = pred_f * true_t / n + pred_t * true_f / n
+        kappa = 1 - (fp + fn) / expected
+        kappa = np.where(n_present == 2, kappa, np.nan)
+        accuracy = (tp + tn) / n.astype(float)
+
+    out = {
+        "accuracy": accuracy,
+        "cohens_kappa": kappa,
+        "precision": _divide(tp, pred_t),
+        "recall": _divide(tp, true_t),
+        "f1": f1_t,
+        "macro_f1": macro,
+        "weighted_f1": weighted,
+        "tp": tp, "tn": tn, "fp": fp, "fn": fn,
+    }
+    # no items: all zeros, as compute_metrics always returned
+    empty = n == 0
+    if np.any(empty):
+        for k in METRIC_KEYS:
+            out[k] = np.where(empty, 0.0, out[k])
+    return out
+
+def compute_metrics_batch(y_true, y_pred) -> dict:
+    """compute_metrics for a (runs, items) prediction matrix: every value is a (runs,) array."""
+    return metrics_from_counts(*confusion_counts(y_true, y_pred))
+
 def compute_metrics(y_true, y_pred):
     """
     Returns a dict with:
@@ -38,6 +269,11 @@ def compute_metrics(y_true, y_pred):
       - confusion counts: tp, tn, fp, fn
     All continuous metrics are fractions in [0,1].
     """
+    m = compute_metrics_batch(y_true, y_pred)
+    return {k: (int(v) if k in COUNT_KEYS else float(v)) for k, v in m.items()}
+
+def compute_metrics_sklearn(y_true, y_pred):
+    """Reference implementation of compute_metrics on sklearn (one call per metric)."""
     y_true = _as_bool_array(y_true)
     y_pred = _as_bool_array(y_pred)
 
@@ -76,4 +312,20 @@ def compute_metrics(y_true, y_pred):
         "macro_f1":  float(f1_macro),
         "weighted_f1": float(f1_weighted),
         "tp": tp, "tn": tn, "fp": fp, "fn": fn,
-    }
\ No newline at end of file
+    }
+
+def check_metrics_kernel(y_true, y_pred) -> int:
+    """
+    Compare the vectorized kernel with the sklearn reference on every row of a
+    (runs, items) prediction matrix; raises AssertionError on the first difference
+    (NaN == NaN counts as equal). Returns the number of rows checked.
+    """
+    y_pred = np.atleast_2d(_as_bool_array(y_pred))
+    batch = compute_metrics_batch(y_true, y_pred)
+    for r in range(y_pred.shape[0]):
+        ref = compute_metrics_sklearn(y_true, y_pred[r])
+        for k, v in ref.items():
+            got = batch[k][r]
+            if not (got == v or (np.isnan(got) and np.isnan(v))):
+                raise AssertionError(f"row {r}: {k} = {got!r}, sklearn gives {v!r}")
+    return y_pred.shape[0]
@@ -1,6 +1,14 @@
 import os
 import re
+import csv
 import json
+import math
+import time
+import random
+import argparse
+import functools
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 import pandas as pd
 
 # compiling cleaning regexes
@@ -21,6 +29,7 @@ def clean_sentence(s: str) -> str:
 # Allowing Cyrillic letters, Latin fallback, apostrophes, hyphen in suffixes
 KZ_LETTERS = r"[A-Za-z\u0400-\u04FF\u2019\u02BC\-]"
 
+@functools.lru_cache(maxsize=None)
 def compile_kz_stem_pattern(stem: str) -> re.Pattern:
     """
     Building a regex that matches:
@@ -61,59 +70,381 @@ def find_first_span(stem: str, sentence: str):
     m = compile_kz_stem_pattern(stem).search(sentence)
     return (m.start(1), m.end(1)) if m else (-1, -1)
 
+# multi-stem span engine
+KZ_RUN_RE = re.compile(KZ_LETTERS + "*", flags=re.UNICODE)
+_END = ""  # trie key holding the stems whose variant ends at this node
+
+def _stem_variants(stem: str):
+    # same variants as compile_kz_stem_pattern; a bare "у" has no truncated form
+    variants = {stem}
+    if stem.endswith("у") and len(stem) > 1:
+        variants.add(stem[:-1])
+    return variants
+
+def _trie_regex(node: dict) -> str:
+    """Regex matching any variant stored below `node` (a variant ending here ends the match)."""
+    if _END in node:
+        return ""
+    alts = [re.escape(ch) + _trie_regex(child) for ch, child in sorted(node.items())]
+    return alts[0] if len(alts) == 1 else "(?:" + "|".join(alts) + ")"
+
+class SpanMatcher:
+    """
+    Span finder for a whole set of target stems, built once.
+      - find_first(stem, sentence): same span as find_first_span, with every stem's
+        pattern compiled up front instead of per call;
+      - find_all(sentence): spans of ALL stems in one pass. The stems and their truncated
+        -у variants go into one character trie; a regex compiled from the trie finds the
+        word starts where some variant begins (zero-width lookahead, so overlapping hits
+        are kept), only those positions are walked in the trie, and each match is extended
+        over the following Kazakh letters, as compile_kz_stem_pattern does.
+    """
+    def __init__(self, stems):
+        self.patterns = {}
+        for stem in stems:
+            stem = (stem or "").strip()
+            if stem and stem not in self.patterns:
+                self.patterns[stem] = compile_kz_stem_pattern(stem)
+        # the trie is only needed by find_all; built on first use
+        self.trie = None
+        self.candidates = None
+
+    def _build_trie(self):
+        self.trie = {}
+        for stem in self.patterns:
+            for v in _stem_variants(stem):
+                node = self.trie
+                for ch in v.lower():
+                    node = node.setdefault(ch, {})
+                node.setdefault(_END, set()).add(stem)
+        body = _trie_regex(self.trie) if self.trie else r"(?!x)x"
+        self.candidates = re.compile(rf"\b(?={body})", flags=re.IGNORECASE | re.UNICODE)
+
+    @staticmethod
+    def _lower(sentence: str) -> str:
+        low = sentence.lower()
+        if len(low) == len(sentence):
+            return low
+        # a few characters lower-case to two (e.g. 'İ'); keep offsets aligned
+        return "".join(c if len(c.lower()) != 1 else c.lower() for c in sentence)
+
+    def _matches(self, sentence: str):
+        """Yield (stem, start, end) leftmost first; for each stem the longest variant at a position."""
+        if self.trie is None:
+            self._build_trie()
+        low = None
+        for m in self.candidates.finditer(sentence):
+            if low is None:
+                low = self._lower(sentence)
+            i = m.start()
+            node, j, best = self.trie, i, {}
+            while j < len(low):
+                node = node.get(low[j])
+                if node is None:
+                    break
+                j += 1
+                for stem in node.get(_END, ()):
+                    best[stem] = j
+            for stem, j in best.items():
+                yield stem, i, KZ_RUN_RE.match(sentence, j).end()
+
+    def find_all(self, sentence: str) -> dict:
+        """{stem: [(start, end), ...]} with non-overlapping matches per stem, as re.finditer would give."""
+        out = {}
+        if not sentence:
+            return out
+        for stem, start, end in self._matches(sentence):
+            spans = out.setdefault(stem, [])
+            if spans and start < spans[-1][1]:
+                continue
+            spans.append((start, end))
+        return out
+
+    def find_first(self, stem: str, sentence: str):
+        stem = (stem or "").strip()
+        if not stem or not sentence:
+            return -1, -1
+        pattern = self.patterns.get(stem) or compile_kz_stem_pattern(stem)
+        m = pattern.search(sentence)
+        return (m.start(1), m.end(1)) if m else (-1, -1)
+
+    def first_spans(self, stems, sentences) -> list:
+        """Bulk find_first over two aligned columns (one stem per sentence)."""
+        return [self.find_first(stem, sent) for stem, sent in zip(stems, sentences)]
+
+    def all_spans(self, sentences) -> list:
+        """Bulk find_all over a sentence column."""
+        return [self.find_all(sent) for sent in sentences]
+
+def benchmark_spans(n: int, data_path: str, seed: int = 0, all_stems_rows: int = 20000):
+    """
+    Time the per-row regex path against SpanMatcher on n synthetic rows drawn from the dataset:
+      1. first span of the row's own stem (what the JSONL build needs);
+      2. spans of every stem in every sentence -- the regex baseline runs one pattern per stem,
+         so it is timed on at most `all_stems_rows` rows and reported as rows/s.
+    """
+    gold = pd.read_json(data_path, lines=True)
+    rng = random.Random(seed)
+    words = gold["word"].astype(str).str.strip().tolist()
+    sents = gold["sentence1"].astype(str).tolist() + gold["sentence2"].astype(str).tolist()
+    # pair every sentence with either its own word or a random one, so misses are exercised too
+    stems, sentences = [], []
+    for _ in range(n):
+        k = rng.randrange(len(gold))
+        stems.append(words[k] if rng.random() < 0.7 else rng.choice(words))
+        sentences.append(sents[k] if rng.random() < 0.5 else sents[k + len(gold)])
+    vocab = sorted(set(words))
+
+    t0 = time.perf_counter()
+    matcher = SpanMatcher(vocab)
+    build_s = time.perf_counter() - t0
+    print(f"=== Span finding on {n:,} rows ({len(vocab)} stems, matcher built in {build_s * 1000:.1f} ms) ===")
+
+    # 1. first span per row: the old path compiled the stem pattern on every call
+    t0 = time.perf_counter()
+    regex_first = []
+    for stem, sent in zip(stems, sentences):
+        m = compile_kz_stem_pattern.__wrapped__(stem).search(sent) if stem and sent else None
+        regex_first.append((m.start(1), m.end(1)) if m else (-1, -1))
+    regex_first_s = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    first = matcher.first_spans(stems, sentences)
+    first_s = time.perf_counter() - t0
+    first_mismatch = sum(a != b for a, b in zip(regex_first, first))
+    print(f"first span  | per-row regex: {n / regex_first_s:>10,.0f} rows/s | "
+          f"SpanMatcher: {n / first_s:>10,.0f} rows/s | mismatches: {first_mismatch}")
+
+    # 2. all stems per sentence
+    m_rows = min(n, all_stems_rows)
+    patterns = [(stem, compile_kz_stem_pattern(stem)) for stem in vocab]
+    t0 = time.perf_counter()
+    regex_all = []
+    for sent in sentences[:m_rows]:
+        found = {}
+        for stem, pat in patterns:
+            spans = [(m.start(1), m.end(1)) for m in pat.finditer(sent)]
+            if spans:
+                found[stem] = spans
+        regex_all.append(found)
+    regex_all_s = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    every = matcher.all_spans(sentences)
+    all_s = time.perf_counter() - t0
+    all_mismatch = sum(a != b for a, b in zip(regex_all, every))
+    print(f"all stems   | per-row regex: {m_rows / regex_all_s:>10,.0f} rows/s | "
+          f"SpanMatcher: {n / all_s:>10,.0f} rows/s | mismatches: {all_mismatch} (of {m_rows:,} checked)")
+    return {"build_s": build_s,
+            "first": {"regex_rows_s": n / regex_first_s, "matcher_rows_s": n / first_s, "mismatches": first_mismatch},
+            "all": {"regex_rows_s": m_rows / regex_all_s, "matcher_rows_s": n / all_s, "mismatches": all_mismatch}}
+
+# building JSONL entries
+# Column names
+WORD_COL  = "word"
+S1_COL    = "example_1"
+S2_COL    = "example_2"
+LABEL_COL = "label"   # expected as 0.0 / 1.0 floats (or True / False)
+POS_COL   = "POS"     # single POS column for the target word (same POS in both sentences)
+
+def _missing(v) -> bool:
+    # empty cells: None from openpyxl / csv, NaN from pandas
+    return v is None or (isinstance(v, float) and math.isnan(v))
+
+def parse_label(v, idx) -> bool:
+    """0.0 / 1.0 (or the booleans / "True" / "False" text a CSV export gives) -> bool."""
+    if isinstance(v, str):
+        text = v.strip().lower()
+        if text in ("true", "false"):
+            return text == "true"
+        try:
+            v = float(text)
+        except ValueError:
+            raise ValueError(f"Unexpected label value at idx {idx}: {v!r}")
+    if _missing(v):
+        raise ValueError(f"Unexpected label value at idx {idx}: {v!r}")
+    val = float(v)
+    if val not in (0.0, 1.0):
+        raise ValueError(f"Unexpected label value at idx {idx}: {val}")
+    return bool(val)
+
+def build_entry(idx: int, row, matcher: SpanMatcher) -> dict:
+    """One JSONL entry from a sheet row (a pandas Series or a {column: value} dict)."""
+    word = row.get(WORD_COL, "")
+    word = "" if _missing(word) else str(word).strip()
+    s1 = clean_sentence(row.get(S1_COL, ""))
+    s2 = clean_sentence(row.get(S2_COL, ""))
+
+    label = parse_label(row.get(LABEL_COL, 0.0), idx)
+
+    pos = row.get(POS_COL, None)  # pass-through POS
+    pos = None if _missing(pos) else pos
+
+    start1, end1 = matcher.find_first(word, s1)
+    start2, end2 = matcher.find_first(word, s2)
+
+    return {
+        "word": word,
+        "sentence1": s1,
+        "sentence2": s2,
+        "idx": int(idx),
+        "label": label,
+        "start1": int(start1),
+        "end1": int(end1),
+        "start2": int(start2),
+        "end2": int(end2),
+        "pos": pos,          # same POS for both sentences
+        "version": 1.1,
+    }
+
+def validate_row(idx: int, row) -> list:
+    """Problems that would make a row unusable, without span finding."""
+    problems = []
+    if _missing(row.get(WORD_COL)) or not str(row.get(WORD_COL)).strip():
+        problems.append("empty word")
+    for col in (S1_COL, S2_COL):
+        if _missing(row.get(col)) or not str(row.get(col)).strip():
+            problems.append(f"empty {col}")
+    try:
+        parse_label(row.get(LABEL_COL, 0.0), idx)
+    except ValueError as e:
+        problems.append(str(e))
+    return problems
+
+# streaming mode
+def iter_sheet_rows(path: str):
+    """
+    Yield the rows of the first sheet of an .xlsx (read-only openpyxl, one row at a time)
+    or of a CSV file as {column: value} dicts. Trailing empty rows are dropped, as
+    pd.read_excel does, so row positions (idx) match the in-memory path.
+    """
+    if path.lower().endswith(".csv"):
+        with open(path, "r", newline="", encoding="utf-8-sig") as f:
+            for row in csv.DictReader(f):
+                yield {k: (None if v == "" else v) for k, v in row.items()}
+        return
+
+    from openpyxl import load_workbook
+    wb = load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = wb.worksheets[0].iter_rows(values_only=True)
+        header = [None if h is None else str(h) for h in next(rows, ())]
+        empty = 0
+        for values in rows:
+            if all(_missing(v) for v in values):
+                empty += 1
+                continue
+            for _ in range(empty):
+                yield dict.fromkeys(header)
+            empty = 0
+            yield dict(zip(header, values))
+    finally:
+        wb.close()
+
+def _chunks(rows, size: int):
+    chunk = []
+    for idx, row in enumerate(rows):
+        chunk.append((idx, row))
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def process_chunk(chunk: list) -> str:
+    """Cleaned, span-annotated JSONL text of one chunk of (idx, row) pairs."""
+    # stem patterns are lru-cached per process, so later chunks reuse them
+    matcher = SpanMatcher(row.get(WORD_COL) for _, row in chunk if not _missing(row.get(WORD_COL)))
+    return "".join(json.dumps(build_entry(idx, row, matcher), ensure_ascii=False) + "\n"
+                   for idx, row in chunk)
+
+def stream_to_jsonl(input_path: str, jsonl_path: str, workers: int = None,
+                    chunk_size: int = 256, buffer_size: int = 1 << 20) -> int:
+    """
+    Read rows lazily, clean and find spans in a process pool chunk by chunk, and write the
+    chunks back in input order. At most 2 chunks per worker are in flight, so memory stays
+    flat however long the sheet is. Output goes to a temp file renamed into place at the end.
+    """
+    workers = workers or os.cpu_count() or 1
+    total = 0
+    tmp_path = jsonl_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8", buffering=buffer_size) as f, \
+            ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for chunk in _chunks(iter_sheet_rows(input_path), chunk_size):
+            pending.append((len(chunk), pool.submit(process_chunk, chunk)))
+            if len(pending) >= 2 * workers:
+                n, fut = pending.popleft()
+                f.write(fut.result())
+                total += n
+        while pending:
+            n, fut = pending.popleft()
+            f.write(fut.result())
+            total += n
+    os.replace(tmp_path, jsonl_path)
+    return total
+
+def validate_only(input_path: str):
+    """Check every row's word / sentences / label without span finding or writing; returns (rows, problems)."""
+    total = problems = 0
+    for idx, row in enumerate(iter_sheet_rows(input_path)):
+        total += 1
+        for problem in validate_row(idx, row):
+            problems += 1
+            if problems <= 50:
+                print(f"idx {idx}: {problem}")
+    return total, problems
+
 # main part
 if __name__ == "__main__":
     base_dir = os.path.dirname(os.path.abspath(__file__))
-    excel_path = os.path.join(base_dir, "../raw_data/Final_WiC_kazakh.xlsx")
-    out_dir = os.path.join(base_dir, "../processed_data")
-    os.makedirs(out_dir, exist_ok=True)
-    jsonl_path = os.path.join(out_dir, "final_dataset_2nd.jsonl")
 
-    # Load Excel
-    df = pd.read_excel(excel_path)
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--input", default=os.path.join(base_dir, "../raw_data/Final_WiC_kazakh.xlsx"),
+                    help="Annotated sheet (.xlsx, first sheet) or a CSV export of it.")
+    ap.add_argument("--output", default=os.path.join(base_dir, "../processed_data/final_dataset_2nd.jsonl"))
+    ap.add_argument("--stream", action="store_true",
+                    help="Read row by row and clean / find spans in a process pool (for large batches).")
+    ap.add_argument("--workers", type=int, default=None, help="Processes for --stream (default: all CPUs).")
+    ap.add_argument("--chunk-size", type=int, default=256, help="Rows per --stream work unit.")
+    ap.add_argument("--validate-only", action="store_true",
+                    help="Only check words, sentences and labels; write nothing.")
+    ap.add_argument("--bench-spans", type=int, default=None, metavar="N",
+                    help="Benchmark per-row regex vs SpanMatcher on N synthetic rows and exit.")
+    args = ap.parse_args()
 
-    # Column names
-    WORD_COL  = "word"
-    S1_COL    = "example_1"
-    S2_COL    = "example_2"
-    LABEL_COL = "label"   # expected as 0.0 / 1.0 floats
-    POS_COL   = "POS"     # single POS column for the target word (same POS in both sentences)
+    if args.bench_spans:
+        benchmark_spans(args.bench_spans, os.path.join(base_dir, "../processed_data/final_dataset_lastE.jsonl"))
+        raise SystemExit(0)
 
-    total = 0
-    with open(jsonl_path, "w", encoding="utf-8") as f:
-        for idx, row in df.iterrows():
-            total += 1
-
-            word = str(row.get(WORD_COL, "")).strip()
-            s1 = clean_sentence(row.get(S1_COL, ""))
-            s2 = clean_sentence(row.get(S2_COL, ""))
-
-            # labels are 0.0 / 1.0
-            val = float(row.get(LABEL_COL, 0.0))
-            if val not in (0.0, 1.0):
-                raise ValueError(f"Unexpected label value at idx {idx}: {val}")
-            label = bool(val)
-
-            pos = row.get(POS_COL, None)  # pass-through POS
-
-            start1, end1 = find_first_span(word, s1)
-            start2, end2 = find_first_span(word, s2)
-
-            entry = {
-                "word": word,
-                "sentence1": s1,
-                "sentence2": s2,
-                "idx": int(idx),
-                "label": label,
-                "start1": int(start1),
-                "end1": int(end1),
-                "start2": int(start2),
-                "end2": int(end2),
-                "pos": pos,          # same POS for both sentences
-                "version": 1.1,
-            }
-
-            json.dump(entry, f, ensure_ascii=False)
-            f.write("\n")
-
-    print(f"Wrote {total} entries to JSONL: {jsonl_path}")
+    t0 = time.perf_counter()
+    if args.validate_only:
+        total, problems = validate_only(args.input)
+        elapsed = time.perf_counter() - t0
+        print(f"Validated {total} rows in {elapsed:.2f}s ({total / max(elapsed, 1e-9):,.0f} rows/s): "
+              f"{problems} problem(s)")
+        raise SystemExit(1 if problems else 0)
+
+    jsonl_path = args.output
+    os.makedirs(os.path.dirname(os.path.abspath(jsonl_path)), exist_ok=True)
+
+    if args.stream:
+        total = stream_to_jsonl(args.input, jsonl_path, workers=args.workers, chunk_size=args.chunk_size)
+    else:
+        # Load Excel (or CSV)
+        if args.input.lower().endswith(".csv"):
+            df = pd.read_csv(args.input)
+        else:
+            df = pd.read_excel(args.input)
+
+        # every target stem goes into one matcher, built once for the whole sheet
+        matcher = SpanMatcher(df[WORD_COL].astype(str).str.strip())
+
+        total = 0
+        with open(jsonl_path, "w", encoding="utf-8") as f:
+            for idx, row in df.iterrows():
+                total += 1
+                json.dump(build_entry(idx, row, matcher), f, ensure_ascii=False)
+                f.write("\n")
+
+    elapsed = time.perf_counter() - t0
+    print(f"Wrote {total} entries to JSONL: {jsonl_path} "
+          f"({elapsed:.2f}s, {total / max(elapsed, 1e-9):,.0f} rows/s)")